@@ -0,0 +1,343 @@
+"""
+Interception overhead benchmarks.
+
+Measures the per-request latency and throughput of `http.client`, `urllib3` and `requests`, against a local server
+without unmock, and against unmock (with varying whitelist sizes, body sizes and header counts), as well as the time
+`import unmock` takes.
+Results are written as JSON, so that runs from different commits can be compared:
+
+    python benchmarks/bench.py run --output base.json
+    git checkout feature && python benchmarks/bench.py run --output head.json
+    python benchmarks/bench.py compare base.json head.json
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver, http_client
+from six.moves.urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import unmock  # noqa: E402
+
+MOCKED_HOST = "bench.unmock.io"
+BENCHMARKS = list()
+"""Registered benchmarks, as (name, function) tuples; functions yield result dictionaries"""
+
+
+def benchmark(fn):
+  BENCHMARKS.append((fn.__name__, fn))
+  return fn
+
+
+def make_body(size):
+  return b"x" * size
+
+
+def make_headers(count):
+  return dict(("X-Bench-{}".format(i), "value-{}".format(i)) for i in range(count))
+
+
+def make_whitelist(size):
+  """A whitelist of `size` patterns (never matching the mocked host), mixing exact, suffix and glob patterns"""
+  patterns = ["127.0.0.1", "localhost"]
+  for i in range(size):
+    patterns.append(("host{}.internal", "*.domain{}.net", "svc-{}-?.corp", "api{}.example.com/v1/*")[i % 4].format(i))
+  return patterns
+
+
+class BenchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Replies with `size` bytes and `headers` extra headers, as given in the query string"""
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True  # Headers and body are written separately; avoid delayed ACK stalls on keep-alive
+
+  def do_GET(self):
+    qs = parse_qs(urlsplit(self.path).query)
+    body = make_body(int(qs.get("size", ["0"])[0]))
+    self.send_response(200)
+    for k, v in make_headers(int(qs.get("headers", ["0"])[0])).items():
+      self.send_header(k, v)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class BenchServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+
+
+def start_server():
+  server = BenchServer(("127.0.0.1", 0), BenchHandler)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server
+
+
+class Clients:
+  """Functions making a single GET request with each client, and reading the whole body"""
+
+  def __init__(self):
+    import urllib3
+    import requests
+    self.pool = urllib3.PoolManager()
+    self.session = requests.Session()
+    self.connections = dict()  # (host, port) -> persistent HTTPConnection
+
+  def http_client_keep_alive(self, host, port, path):
+    conn = self.connections.get((host, port))
+    if conn is None:
+      conn = self.connections[host, port] = http_client.HTTPConnection(host, port)
+    conn.request("GET", path)
+    return conn.getresponse().read()
+
+  def http_client(self, host, port, path):
+    conn = http_client.HTTPConnection(host, port)
+    conn.request("GET", path)
+    body = conn.getresponse().read()
+    conn.close()
+    return body
+
+  def urllib3(self, host, port, path):
+    return self.pool.request("GET", "http://{}:{}{}".format(host, port, path)).data
+
+  def requests(self, host, port, path):
+    return self.session.get("http://{}:{}{}".format(host, port, path)).content
+
+
+def measure(fn, number, warmup=20):
+  """Calls `fn` `number` times, returning the latency statistics"""
+  for _ in range(warmup):
+    fn()
+  timings = list()
+  timer = time.perf_counter if hasattr(time, "perf_counter") else time.time
+  for _ in range(number):
+    start = timer()
+    fn()
+    timings.append(timer() - start)
+  return latency_stats(timings)
+
+
+def latency_stats(timings):
+  """The statistics of a list of durations, in seconds"""
+  number = len(timings)
+  timings = sorted(timings)
+  total = sum(timings)
+  return {
+      "n": number,
+      "mean_us": total / number * 1e6,
+      "p50_us": timings[number // 2] * 1e6,
+      "p99_us": timings[min(number - 1, int(number * 0.99))] * 1e6,
+      "rps": number / total,
+  }
+
+
+def _run_clients(clients, host, port, path, number, **params):
+  for client in ("http_client", "urllib3", "requests"):
+    fn = getattr(clients, client)
+    result = measure(lambda: fn(host, port, path), number)
+    result.update(params, client=client)
+    yield result
+
+
+@benchmark
+def baseline(ctx):
+  """Requests to the local server, without unmock"""
+  for size in ctx.body_sizes:
+    for headers in ctx.header_counts:
+      path = "/?size={}&headers={}".format(size, headers)
+      for result in _run_clients(ctx.clients, "127.0.0.1", ctx.port, path, ctx.number,
+                                 mode="real", body_size=size, header_count=headers, whitelist_size=0):
+        yield result
+
+
+@benchmark
+def mocked(ctx):
+  """Requests answered by unmock, with the same bodies and headers as the local server's"""
+  for size in ctx.body_sizes:
+    for headers in ctx.header_counts:
+      reply = {"content": make_body(size), "headers": make_headers(headers)}
+      with unmock.patch(replyFn=lambda _: reply):
+        for result in _run_clients(ctx.clients, MOCKED_HOST, 80, "/", ctx.number,
+                                   mode="mocked", body_size=size, header_count=headers, whitelist_size=0):
+          yield result
+
+
+@benchmark
+def socket_engine(ctx):
+  """Requests answered by unmock's socket engine, with the same bodies and headers as the local server's"""
+  for size in ctx.body_sizes:
+    for headers in ctx.header_counts:
+      reply = {"content": make_body(size), "headers": make_headers(headers)}
+      with unmock.patch(replyFn=lambda _: reply, engine="socket"):
+        for result in _run_clients(ctx.clients, MOCKED_HOST, 80, "/", ctx.number,
+                                   mode="socket", body_size=size, header_count=headers, whitelist_size=0):
+          yield result
+
+
+@benchmark
+def keep_alive(ctx):
+  """Repeated requests on a single persistent http.client connection, to the local server and answered by unmock"""
+  fn = ctx.clients.http_client_keep_alive
+  params = dict(client="http_client_keep_alive", body_size=0, header_count=0, whitelist_size=0)
+  result = measure(lambda: fn("127.0.0.1", ctx.port, "/"), ctx.number)
+  result.update(params, mode="real")
+  yield result
+  with unmock.patch(replyFn=lambda _: {"content": b""}):
+    result = measure(lambda: fn(MOCKED_HOST, 80, "/"), ctx.number)
+  result.update(params, mode="mocked")
+  yield result
+
+
+@benchmark
+def requests_adapter(ctx):
+  """
+  Prepared requests sent by a requests session, answered by unmock through urllib3 (the default) and in requests'
+  transport adapter. Preparing requests and looking up the environment's proxy settings cost the same either way (and
+  often more than the transport), so they are left out.
+  """
+  import requests
+  session = requests.Session()
+  session.trust_env = False
+  prepared = session.prepare_request(requests.Request("GET", "http://{}/".format(MOCKED_HOST)))
+  for size in ctx.body_sizes:
+    reply = {"content": make_body(size)}
+    for adapter in (False, True):
+      with unmock.patch(replyFn=lambda _: reply, requests_adapter=adapter):
+        result = measure(lambda: session.send(prepared).content, ctx.number)
+      result.update(client="requests", mode="adapter" if adapter else "mocked", body_size=size, header_count=0,
+                    whitelist_size=0)
+      yield result
+
+
+@benchmark
+def whitelist(ctx):
+  """Requests answered by unmock, and passed through to the local server, with whitelists of varying sizes"""
+  for size in ctx.whitelist_sizes:
+    with unmock.patch(whitelist=make_whitelist(size)):
+      for result in _run_clients(ctx.clients, MOCKED_HOST, 80, "/", ctx.number,
+                                 mode="mocked", body_size=0, header_count=0, whitelist_size=size):
+        yield result
+      for result in _run_clients(ctx.clients, "127.0.0.1", ctx.port, "/", ctx.number,
+                                 mode="passthrough", body_size=0, header_count=0, whitelist_size=size):
+        yield result
+
+
+@benchmark
+def import_time(ctx):
+  """`import unmock` in a fresh interpreter, which should be close to free: clients are patched once imported"""
+  code = ("import time; timer = getattr(time, 'perf_counter', time.time); start = timer(); import unmock; "
+          "print(timer() - start)")
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  timings = [float(subprocess.check_output([sys.executable, "-c", code], cwd=root)) for _ in range(ctx.imports)]
+  result = latency_stats(timings)
+  result.update(client="unmock", mode="import", body_size=0, header_count=0, whitelist_size=0)
+  yield result
+
+
+class Context:
+  def __init__(self, args, port):
+    self.port = port
+    self.number = args.number
+    self.clients = Clients()
+    self.imports = min(args.number, 50)  # Each import starts an interpreter
+    if args.quick:
+      self.body_sizes, self.header_counts, self.whitelist_sizes = [0, 1024], [0, 10], [0, 100]
+    else:
+      self.body_sizes, self.header_counts, self.whitelist_sizes = [0, 1024, 1024 * 1024], [0, 10, 50], [0, 100, 1000]
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT).decode("ascii").strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def result_key(result):
+  """Identifies a measurement across runs"""
+  return "{benchmark}/{client}/{mode}/body={body_size}/headers={header_count}/whitelist={whitelist_size}".format(
+      **result)
+
+
+def run(args):
+  server = start_server()
+  ctx = Context(args, server.server_address[1])
+  results = list()
+  try:
+    for name, fn in BENCHMARKS:
+      if args.only and name not in args.only:
+        continue
+      for result in fn(ctx):
+        result["benchmark"] = name
+        results.append(result)
+        print("{:<70} {:>10.1f} us/req {:>10.0f} req/s".format(result_key(result), result["mean_us"], result["rps"]))
+  finally:
+    server.shutdown()
+    server.server_close()
+  output = {
+      "meta": {
+          "commit": git_commit(),
+          "unmock": unmock.__version__,
+          "python": platform.python_version(),
+          "platform": platform.platform(),
+          "timestamp": time.time(),
+          "number": args.number,
+      },
+      "results": results,
+  }
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(output, f, indent=2, sort_keys=True)
+
+
+def compare(args):
+  """Prints the change in mean latency between two result files; exits with 1 if any regressed past the threshold"""
+  with open(args.base) as f:
+    base = dict((result_key(r), r) for r in json.load(f)["results"])
+  with open(args.head) as f:
+    head = dict((result_key(r), r) for r in json.load(f)["results"])
+  regressions = 0
+  for key in sorted(set(base) & set(head)):
+    change = head[key]["mean_us"] / base[key]["mean_us"] - 1
+    flag = ""
+    if change > args.threshold:
+      flag = "  REGRESSION"
+      regressions += 1
+    print("{:<70} {:>10.1f} -> {:>10.1f} us/req ({:+.1%}){}".format(
+        key, base[key]["mean_us"], head[key]["mean_us"], change, flag))
+  return 1 if regressions else 0
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  commands = parser.add_subparsers(dest="command")
+  run_parser = commands.add_parser("run", help="Run the benchmarks")
+  run_parser.add_argument("--output", "-o", help="Where to write the JSON results")
+  run_parser.add_argument("--number", "-n", type=int, default=500, help="Requests per measurement")
+  run_parser.add_argument("--quick", action="store_true", help="Fewer body sizes, header counts and whitelist sizes")
+  run_parser.add_argument("--only", nargs="+", help="Only run these benchmarks")
+  compare_parser = commands.add_parser("compare", help="Compare two result files")
+  compare_parser.add_argument("base")
+  compare_parser.add_argument("head")
+  compare_parser.add_argument("--threshold", type=float, default=0.1,
+                              help="Relative slowdown considered a regression (default: 0.1)")
+  args = parser.parse_args(argv)
+  if args.command == "run":
+    return run(args)
+  if args.command == "compare":
+    return compare(args)
+  parser.print_help()
+  return 2
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -16,7 +16,8 @@ SRC_DIR = 'unmock'  # Relative location wrt setup.py
 # Required packages.
 REQUIRED = ["requests", "six"]
 
-DEV = ["twine", "wheel", "pytest", "coverage"]
+DEV = ["twine", "wheel", "pytest", "coverage",
+       'aiohttp; python_version >= "3.7"', 'httpx; python_version >= "3.7"']
 
 # List of support packages needed based on python version used.
 # Tuple format: (version tuple, package to install)
@@ -30,7 +31,7 @@ for (ver, pkg) in SUPPORT:
     REQUIRED.append(pkg)
 
 # Optional packages
-EXTRAS = {'dev': DEV}
+EXTRAS = {'dev': DEV, 'openapi': ['pyyaml']}  # YAML specifications
 
 # Entry point (relative to setup.py)
 ENTRY_POINTS = []
@@ -105,6 +106,9 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules',
         'Topic :: Software Development :: Testing :: Mocking'
     ],
-    entry_points={'pytest11': ['unmock = unmock.pytest.plugin']},
+    entry_points={
+        'console_scripts': ['unmock = unmock.cli:main'],
+        'pytest11': ['unmock = unmock.pytest.plugin'],
+    },
     cmdclass={'tags': PushGitTagCommand}
 )
@@ -1,5 +1,15 @@
+import sys
+import threading
 import pytest
 import unmock as u
+from six.moves import BaseHTTPServer, socketserver
+
+pytest_plugins = ["pytester"]
+
+# Modules with coroutines, which older Pythons cannot even compile
+collect_ignore = []
+if sys.version_info < (3, 7):
+  collect_ignore = ["test_aio.py", "test_context_async.py", "test_simulation_async.py"]
 
 
 @pytest.fixture
@@ -10,3 +20,52 @@ def unmock_t():  # Defined internally for test suites
   u.on()
   yield init
   u.off()
+
+
+class LocalHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Replies to every request with its method and path, e.g. `GET /foo`"""
+  protocol_version = "HTTP/1.1"
+
+  def _reply(self):
+    self.server.requests += 1
+    length = int(self.headers.get("Content-Length") or 0)
+    body = self.rfile.read(length) if length else b""
+    content = "{} {}".format(self.command, self.path).encode("utf-8") + (b" " + body if body else b"")
+    self.send_response(200)
+    self.send_header("Content-Type", "text/plain")
+    self.send_header("Content-Length", str(len(content)))
+    self.send_header("X-Local", "1")
+    self.end_headers()
+    self.wfile.write(content)
+
+  do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+  def log_message(self, *args):
+    pass
+
+
+class LocalServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+  request_queue_size = 1024
+  requests = 0  # The number of requests served
+
+
+class LocalURL(str):
+  """The base URL of a LocalServer, giving access to the server itself"""
+
+  def __new__(cls, server):
+    url = super(LocalURL, cls).__new__(cls, "http://127.0.0.1:{}".format(server.server_address[1]))
+    url.server = server
+    return url
+
+
+@pytest.fixture(scope="session")
+def local_server():
+  """A local stand-in HTTP server, running in a background thread. Yields its base URL."""
+  server = LocalServer(("127.0.0.1", 0), LocalHandler)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  yield LocalURL(server)
+  server.shutdown()
+  server.server_close()
@@ -1,6 +1,7 @@
 """Named without test_ in the beginning so we can test manually"""
 import requests
 import os
+import threading
 
 TIMEOUT = 10
 
@@ -26,3 +27,12 @@ def test_pytest_flag(unmock):
   response = requests.get("http://www.example.com/",
                           timeout=TIMEOUT)  # Nothing here anyway
   pytest_wo(response.status_code == 303)
+
+
+def test_pytest_flag_in_thread(unmock):
+  unmock(replyFn=lambda req: {"status": 303})
+  responses = []
+  thread = threading.Thread(target=lambda: responses.append(requests.get("http://www.example.com/", timeout=TIMEOUT)))
+  thread.start()
+  thread.join()
+  pytest_wo(responses[0].status_code == 303)
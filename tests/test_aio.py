@@ -0,0 +1,184 @@
+import sys
+import time
+import pytest
+import requests
+import unmock
+
+if sys.version_info < (3, 7):
+  pytest.skip("unmock patches asynchronous clients on Python 3.7+", allow_module_level=True)
+
+import asyncio  # noqa: E402
+
+aiohttp = pytest.importorskip("aiohttp")
+httpx = pytest.importorskip("httpx")
+
+CONCURRENCY = 500
+
+
+async def async_reply(req):
+  await asyncio.sleep(0.05)  # A slow upstream; must not block the event loop
+  return {"content": "{} {}".format(req.method, req.endpoint), "headers": {"X-Mock": "1"}}
+
+
+def run(coro):
+  return asyncio.run(coro)
+
+
+def test_aiohttp_concurrent(local_server):
+  async def main():
+    async with aiohttp.ClientSession() as session:
+      async def fetch(i):
+        async with session.get("https://api.example.com/items/{}".format(i), params={"q": "x"}) as res:
+          return res.status, res.headers["X-Mock"], await res.text()
+
+      async def passthrough(i):
+        async with session.post("{}/local/{}".format(local_server, i), data=b"body") as res:
+          return res.headers["X-Local"], await res.text()
+
+      start = time.time()
+      mocked = await asyncio.gather(*[fetch(i) for i in range(CONCURRENCY)])
+      elapsed = time.time() - start
+      local = await asyncio.gather(*[passthrough(i) for i in range(20)])
+      return mocked, elapsed, local
+
+  with unmock.patch(replyFn=async_reply):
+    mocked, elapsed, local = run(main())
+  assert mocked[7] == (200, "1", "GET /items/7?q=x")
+  assert elapsed < CONCURRENCY * 0.05 / 10  # Replies were awaited concurrently
+  assert local[3] == ("1", "POST /local/3 body")
+
+
+def test_httpx_concurrent(local_server):
+  async def main():
+    async with httpx.AsyncClient() as client:
+      start = time.time()
+      mocked = await asyncio.gather(*[client.get("https://api.example.com/items/{}".format(i))
+                                      for i in range(CONCURRENCY)])
+      elapsed = time.time() - start
+      local = await asyncio.gather(*[client.get("{}/local/{}".format(local_server, i)) for i in range(20)])
+      return mocked, elapsed, local
+
+  with unmock.patch(replyFn=async_reply):
+    mocked, elapsed, local = run(main())
+  assert mocked[7].status_code == 200
+  assert mocked[7].text == "GET /items/7"
+  assert elapsed < CONCURRENCY * 0.05 / 10
+  assert local[3].headers["X-Local"] == "1"
+  assert local[3].text == "GET /local/3"
+
+
+def test_httpx_sync_and_streaming():
+  def reply(req):
+    return {"content": (part for part in [b"foo", b"bar"]), "status": 201}
+  with unmock.patch(replyFn=reply):
+    with httpx.Client() as client:
+      res = client.post("https://api.example.com/", content=b"payload")
+      assert res.status_code == 201
+      assert res.content == b"foobar"
+
+
+def test_async_reply_from_sync_client():
+  with unmock.patch(replyFn=async_reply):
+    assert requests.get("https://api.example.com/sync").text == "GET /sync"
+
+
+def test_encoded_content():
+  async def main():
+    async with aiohttp.ClientSession() as session:
+      async with session.get("https://api.example.com/gzip") as res:
+        decoded = await res.json()
+      async with session.get("https://api.example.com/deflate", auto_decompress=False) as res:
+        raw = await res.read()
+    async with httpx.AsyncClient() as client:
+      res = await client.get("https://api.example.com/gzip")
+    return decoded, raw, res.json()
+
+  def reply(req):
+    return {"content": {"sign": "scorpio"}, "encoding": req.endpoint.lstrip("/")}
+
+  with unmock.patch(replyFn=reply):
+    decoded, raw, from_httpx = run(main())
+  assert decoded == from_httpx == {"sign": "scorpio"}
+  assert raw != b'{"sign": "scorpio"}' and raw.startswith(b"x")  # zlib header
+
+
+def test_aiohttp_session_features():
+  def reply(req):
+    if req.endpoint == "/old":
+      return {"status": 302, "headers": {"Location": "/new"}}
+    if req.endpoint == "/login":
+      return {"headers": {"Set-Cookie": "session=abc; Path=/"}}
+    if req.endpoint == "/missing":
+      return {"status": 404}
+    if req.endpoint == "/slow":
+      return {"latency": 1}
+    return {"content": {"path": req.endpoint, "cookie": req.headers.get("Cookie"), "body": req.json}}
+
+  async def check_status(res):
+    checked.append(res.status)
+
+  async def on_request_start(session, context, params):
+    traced.append(("start", str(params.url)))
+
+  async def on_request_end(session, context, params):
+    traced.append(("end", params.response.status))
+
+  checked, traced = [], []
+  trace = aiohttp.TraceConfig()
+  trace.on_request_start.append(on_request_start)
+  trace.on_request_end.append(on_request_end)
+
+  async def main():
+    async with aiohttp.ClientSession(raise_for_status=check_status, trace_configs=[trace]) as session:
+      async with session.get("https://api.example.com/old") as res:
+        redirected = res.status, str(res.url), [r.status for r in res.history], await res.json()
+      async with session.get("https://api.example.com/login"):
+        pass
+      async with session.post("https://api.example.com/echo", json={"a": 1}) as res:
+        echoed = await res.json()
+      async with session.get("https://api.example.com/missing"):
+        pass
+      timeout = aiohttp.ClientTimeout(total=0.1)
+      with pytest.raises(asyncio.TimeoutError):
+        await session.get("https://api.example.com/slow", timeout=timeout)
+      cookies = dict((c.key, c.value) for c in session.cookie_jar)
+    return redirected, echoed, cookies
+
+  with unmock.patch(replyFn=reply) as options:
+    redirected, echoed, cookies = run(main())
+  assert redirected == (200, "https://api.example.com/new", [302], {"path": "/new", "cookie": None, "body": None})
+  assert echoed == {"path": "/echo", "cookie": "session=abc", "body": {"a": 1}}
+  assert cookies == {"session": "abc"}
+  assert checked == [200, 200, 200, 404]
+  assert traced[:2] == [("start", "https://api.example.com/old"), ("end", 200)]
+  assert [entry.path for entry in options.journal] == ["/old", "/new", "/login", "/echo", "/missing", "/slow"]
+
+
+def test_cassette_record_and_replay(local_server, tmp_path):
+  path = str(tmp_path / "async.cassette")
+
+  async def main():
+    async with aiohttp.ClientSession() as session:
+      async with session.post(local_server + "/aiohttp", data=b"one") as res:
+        from_aiohttp = res.headers["X-Local"], await res.text()
+    async with httpx.AsyncClient() as client:
+      from_async = (await client.get(local_server + "/async")).text
+    return from_aiohttp, from_async
+
+  with unmock.Cassette(path, mode="record") as cassette:
+    with unmock.patch(cassette=cassette):
+      assert run(main()) == (("1", "POST /aiohttp one"), "GET /async")
+      assert httpx.post(local_server + "/sync", content=b"two").text == "POST /sync two"
+
+  served = local_server.server.requests
+  cassette = unmock.Cassette(path)
+  try:
+    with unmock.patch(cassette=cassette, replyFn=lambda _: {"status": 404}):
+      assert run(main()) == (("1", "POST /aiohttp one"), "GET /async")
+      assert httpx.post(local_server + "/sync", content=b"two").text == "POST /sync two"
+      assert httpx.post(local_server + "/sync", content=b"three").status_code == 404  # Falls back to replyFn
+      assert local_server.server.requests == served
+      assert httpx.get(local_server + "/other").text == "GET /other"  # Not recorded, still whitelisted
+      assert local_server.server.requests == served + 1
+  finally:
+    cassette.close()
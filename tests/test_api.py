@@ -1,7 +1,23 @@
+import importlib
+import urllib3
 import unmock
 import unmock.core as unmock_core
 
 
+def is_imported(name):
+  try:
+    importlib.import_module(name)
+  except ImportError:
+    return False
+  return True
+
+
+# Six different mocks for HTTPConnection, two for the socket engine, two for urllib3, and those for the installed
+# requests and asyncio clients (imported here, so that they are patched right away)
+EXPECTED_PATCHES = (6 + 2 + 2 + int(is_imported("requests")) + 3 * int(is_imported("aiohttp")) +
+                    2 * int(is_imported("httpx")))
+
+
 def assert_number_of_patches(expected_number):
   assert len(unmock_core.PATCHERS.targets) == len(
       unmock_core.PATCHERS.patchers) == expected_number
@@ -9,8 +25,7 @@ def assert_number_of_patches(expected_number):
 
 def test_init_and_reset():
   unmock.init()
-  # Three different mocks for HTTPRequest, one for urllib3
-  assert_number_of_patches(4)
+  assert_number_of_patches(EXPECTED_PATCHES)
   unmock.off()
   assert_number_of_patches(0)
 
@@ -18,5 +33,5 @@ def test_init_and_reset():
 def test_context_manager():
   assert_number_of_patches(0)
   with unmock.patch():
-    assert_number_of_patches(4)
+    assert_number_of_patches(EXPECTED_PATCHES)
   assert_number_of_patches(0)
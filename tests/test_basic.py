@@ -39,3 +39,13 @@ def test_json_content():
   res = requests.get("http://www.bar.com/")
   assert res.json() == {"foo": "bar"}
   unmock.off()
+
+
+def test_multiple_headers():
+  def reply(_):
+    return {"content": "foo", "headers": {"X-Foo": "bar", "Content-Type": "text/plain", "X-Many": ["a", "b"]}}
+  with unmock.patch(replyFn=reply):
+    res = requests.get("https://www.foo.com/")
+    assert res.headers.get("X-Foo") == "bar"
+    assert res.headers.get("Content-Type") == "text/plain"
+    assert res.headers.get("X-Many") == "a, b"
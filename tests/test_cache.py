@@ -0,0 +1,76 @@
+import time
+import requests
+import unmock
+from unmock.core import ReplyCache, Request
+
+
+def make_request(endpoint, method="GET", data=None, headers=None):
+  req = Request("api.example.com", 443, endpoint, method)
+  req.add_headers(headers or dict())
+  req.add_body(data)
+  return req
+
+
+def test_memoizes_replies():
+  calls = list()
+
+  def reply(req):
+    calls.append(req.endpoint)
+    return {"content": "{} {}".format(req.endpoint, req.data or b"")}
+
+  with unmock.patch(replyFn=reply, cache=True) as options:
+    for _ in range(3):
+      assert requests.get("https://api.example.com/a?x=1&y=2").text == "/a?x=1&y=2 b''"
+    assert requests.get("https://api.example.com/a?y=2&x=1").status_code == 200  # Same normalised query string
+    requests.post("https://api.example.com/a?x=1&y=2", data="one")
+    requests.post("https://api.example.com/a?x=1&y=2", data="two")
+    requests.post("https://api.example.com/a?x=1&y=2", data="one")
+  assert calls == ["/a?x=1&y=2", "/a?x=1&y=2", "/a?x=1&y=2"]
+  stats = options.cache.stats()
+  assert (stats["hits"], stats["misses"], stats["entries"]) == (4, 3, 3)
+  assert options.journal.count() == 7  # Cached replies are still journaled
+
+
+def test_opt_out():
+  counter = [0]
+
+  def stateful(req):
+    counter[0] += 1
+    return {"content": str(counter[0])}
+
+  router = unmock.Router()
+  router.add("GET", "api.example.com", "/counter", stateful, cache=False)
+  replies = [lambda: {"content": "a", "cache": False}, lambda: {"content": iter([b"b"])}]
+  with unmock.patch(router=router, replyFn=lambda req: replies[int(req.qs["i"][0])](), cache=10) as options:
+    assert [requests.get("https://api.example.com/counter").text for _ in range(3)] == ["1", "2", "3"]
+    assert requests.get("https://api.example.com/?i=1").text == "b"
+    assert requests.get("https://api.example.com/?i=1").text == "b"  # Streams are not cached
+    assert requests.get("https://api.example.com/?i=0").text == "a"
+  assert len(options.cache) == 0
+
+
+def test_selected_headers():
+  cache = ReplyCache(headers=["Accept"])
+  json_req = make_request("/", headers={"Accept": "application/json", "X-Request-Id": "1"})
+  assert cache.key(json_req) == cache.key(make_request("/", headers={"accept": "application/json"}))
+  assert cache.key(json_req) != cache.key(make_request("/", headers={"Accept": "text/html"}))
+  # Streamed bodies are keyed on their digest, as computed while they are consumed
+  assert cache.key(make_request("/", data=iter([b"str", b"eamed"]))) == cache.key(make_request("/", data=b"streamed"))
+  assert cache.key(make_request("/", data={"form": "field"})) is None
+
+
+def test_eviction_and_expiry():
+  cache = ReplyCache(maxsize=2, ttl=0.05)
+  for i in range(3):
+    cache.put(i, {"content": str(i)})
+  assert cache.get(0) is None and cache.get(2) == {"content": "2"}
+  time.sleep(0.06)
+  assert cache.get(2) is None
+  stats = cache.stats()
+  assert (stats["evictions"], stats["expirations"], stats["hits"], stats["misses"]) == (1, 1, 1, 2)
+
+  cache = ReplyCache(max_bytes=100)
+  cache.put("a", {"content": b"x" * 60})
+  cache.put("b", {"content": b"x" * 60})  # Evicts "a" to stay within the memory cap
+  cache.put("c", {"content": b"x" * 200})  # Larger than the cap
+  assert (cache.get("a"), len(cache), cache.stats()["bytes"]) == (None, 1, 60)
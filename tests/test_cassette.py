@@ -0,0 +1,105 @@
+import zlib
+import pytest
+import requests
+import unmock
+from six.moves import http_client
+from six.moves.urllib.parse import urlsplit
+
+
+def test_record_and_replay(local_server, tmp_path):
+  path = str(tmp_path / "local.cassette")
+  port = urlsplit(local_server).port
+  with unmock.Cassette(path, mode="record") as cassette:
+    with unmock.patch(cassette=cassette):
+      assert requests.get(local_server + "/foo?b=2&a=1").text == "GET /foo?b=2&a=1"
+      assert requests.post(local_server + "/bar", data=b"one").text == "POST /bar one"
+      assert requests.post(local_server + "/bar", data=b"two").text == "POST /bar two"
+      conn = http_client.HTTPConnection("127.0.0.1", port)
+      conn.request("GET", "/baz")
+      assert conn.getresponse().read() == b"GET /baz"
+
+  served = local_server.server.requests
+  cassette = unmock.Cassette(path)
+  try:
+    with unmock.patch(cassette=cassette, replyFn=lambda _: {"status": 404}):
+      res = requests.get(local_server + "/foo?a=1&b=2")  # The query string is normalized
+      assert res.text == "GET /foo?b=2&a=1"
+      assert res.headers["X-Local"] == "1"
+      assert requests.post(local_server + "/bar", data=b"two").text == "POST /bar two"
+      assert requests.post(local_server + "/bar", data=b"one").text == "POST /bar one"
+      assert requests.post(local_server + "/bar", data=b"three").status_code == 404  # Falls back to replyFn
+      conn = http_client.HTTPConnection("127.0.0.1", port)
+      conn.request("GET", "/baz")
+      assert conn.getresponse().read() == b"GET /baz"
+      assert local_server.server.requests == served
+      assert requests.get(local_server + "/other").text == "GET /other"  # Not recorded, still whitelisted
+      assert local_server.server.requests == served + 1
+  finally:
+    cassette.close()
+
+
+def test_raw_bodies_are_recorded(tmp_path):
+  path = str(tmp_path / "raw.cassette")
+  cassette = unmock.Cassette(path, mode="record")
+  compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip.compress is Python 3 only
+  compressed = compressor.compress(b"foo") + compressor.flush()
+  cassette.record(unmock.Request("api.example.com", 443, "/", "GET"), 200,
+                  [("Content-Encoding", "gzip"), ("Transfer-Encoding", "chunked")], compressed)
+  cassette.save()
+  cassette.close()
+
+  with unmock.Cassette(path) as cassette:
+    with unmock.patch(cassette=cassette):
+      res = requests.get("https://api.example.com/")
+      assert res.content == b"foo"
+      assert "Transfer-Encoding" not in res.headers
+
+
+def test_streamed_uploads_are_recorded(local_server, tmp_path, monkeypatch):
+  from unmock.core import request
+  monkeypatch.setattr(request, "SPOOL_THRESHOLD", 100)
+  path = str(tmp_path / "uploads.cassette")
+  upload = tmp_path / "upload.bin"
+  upload.write_bytes(b"0123456789" * 20)
+  port = urlsplit(local_server).port
+  with unmock.Cassette(path, mode="record") as cassette:
+    with unmock.patch(cassette=cassette):
+      with open(str(upload), "rb") as f:
+        assert requests.put(local_server + "/up", data=f).text == "PUT /up " + "0123456789" * 20
+      conn = http_client.HTTPConnection("127.0.0.1", port)
+      with open(str(upload), "rb") as f:
+        conn.request("PUT", "/conn", body=f, headers={"Content-Length": "200"})
+      assert conn.getresponse().read() == b"PUT /conn " + b"0123456789" * 20
+
+  served = local_server.server.requests
+  with unmock.Cassette(path) as cassette:
+    with unmock.patch(cassette=cassette, replyFn=lambda _: {"status": 404}):
+      chunks = (b"0123456789" for _ in range(20))  # Keyed by the digest of the content, however it is sent
+      assert requests.put(local_server + "/up", data=chunks).text == "PUT /up " + "0123456789" * 20
+      conn = http_client.HTTPConnection("127.0.0.1", port)
+      conn.request("PUT", "/conn", body=b"0123456789" * 20)
+      assert conn.getresponse().read() == b"PUT /conn " + b"0123456789" * 20
+      assert requests.put(local_server + "/up", data=b"other").status_code == 404
+  assert local_server.server.requests == served
+
+
+def test_close_releases_served_bodies(local_server, tmp_path):
+  path = str(tmp_path / "release.cassette")
+  with unmock.Cassette(path, mode="record") as cassette:
+    with unmock.patch(cassette=cassette):
+      requests.get(local_server + "/served")
+
+  cassette = unmock.Cassette(path)
+  mapping = cassette._mmap
+  with unmock.patch(cassette=cassette, cache=True, journal=unmock.Journal(keep_bodies=True)) as options:
+    res = requests.get(local_server + "/served", stream=True)  # Neither read nor closed
+    assert requests.get(local_server + "/served").text == "GET /served"
+  reply = options.journal.last().reply
+  cassette.close()
+  assert mapping.closed
+  with pytest.raises(ValueError):
+    bytes(reply["content"])
+  with pytest.raises(ValueError):
+    res.raw.read()
+  with pytest.raises(ValueError):
+    cassette(options.journal.last().request)
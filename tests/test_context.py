@@ -0,0 +1,81 @@
+import threading
+import requests
+import unmock
+from unmock.core import http
+
+
+def reply_with(text):
+  return lambda _: {"content": text}
+
+
+def test_nested_scopes():
+  assert not unmock.is_mocking()
+  with unmock.patch(replyFn=reply_with("outer")):
+    assert requests.get("https://www.foo.com/").text == "outer"
+    with unmock.patch(replyFn=reply_with("inner")):
+      assert requests.get("https://www.foo.com/").text == "inner"
+    assert requests.get("https://www.foo.com/").text == "outer"
+  assert not unmock.is_mocking()
+
+
+def test_scope_overrides_global():
+  unmock.on(replyFn=reply_with("global"))
+  try:
+    with unmock.patch(replyFn=reply_with("scoped")):
+      assert requests.get("https://www.foo.com/").text == "scoped"
+    assert requests.get("https://www.foo.com/").text == "global"
+  finally:
+    unmock.off()
+
+
+class Barrier:
+  """Minimal stand-in for `threading.Barrier`, which Python 2 does not have."""
+
+  def __init__(self, parties):
+    self.parties = parties
+    self.count = 0
+    self.cond = threading.Condition()
+
+  def wait(self):
+    with self.cond:
+      generation = self.count // self.parties
+      self.count += 1
+      if self.count % self.parties == 0:
+        self.cond.notify_all()
+      else:
+        while self.count // self.parties == generation:
+          self.cond.wait()
+
+
+def test_parallel_threads():
+  barrier = Barrier(8)
+  results = dict()
+
+  def worker(i):
+    with unmock.patch(replyFn=reply_with("thread {}".format(i))):
+      barrier.wait()  # All scopes are open at the same time
+      if i == 0:
+        unmock.off()  # Must not tear down the other threads' scopes
+      results[i] = [requests.get("https://www.foo.com/").text for _ in range(20)]
+      barrier.wait()
+
+  threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  for i in range(8):
+    assert results[i] == ["thread {}".format(i)] * 20
+  assert http._users[0] == 0
+  assert not unmock.is_mocking()
+
+
+def test_passthrough_when_inactive(local_server):
+  with unmock.patch(replyFn=reply_with("mocked"), whitelist=[]):
+    assert requests.get(local_server + "/foo").text == "mocked"
+    # Another thread did not open a scope, so its requests are not intercepted
+    results = []
+    t = threading.Thread(target=lambda: results.append(requests.get(local_server + "/foo").text))
+    t.start()
+    t.join()
+    assert results == ["GET /foo"]
@@ -0,0 +1,25 @@
+import sys
+import pytest
+import requests
+import unmock
+
+if sys.version_info < (3, 7):
+  pytest.skip("asyncio.run requires Python 3.7+", allow_module_level=True)
+
+import asyncio  # noqa: E402
+
+
+def reply_with(text):
+  return lambda _: {"content": text}
+
+
+def test_parallel_tasks():
+  async def task(i):
+    with unmock.patch(replyFn=reply_with("task {}".format(i))):
+      await asyncio.sleep(0.01)  # Let the other tasks open their scopes
+      return requests.get("https://www.foo.com/").text
+
+  async def main():
+    return await asyncio.gather(*[task(i) for i in range(10)])
+
+  assert asyncio.run(main()) == ["task {}".format(i) for i in range(10)]
@@ -0,0 +1,52 @@
+import json
+import requests
+import unmock
+from unmock.core import Fixtures
+
+
+def write(path, content):
+  path.parent.mkdir(parents=True, exist_ok=True)
+  path.write_bytes(content.encode("utf-8") if hasattr(content, "encode") else content)
+
+
+def test_serves_fixture_tree(tmp_path):
+  host = tmp_path / "api.example.com"
+  write(host / "index.json", '{"root": true}')
+  write(host / "users.json", "[]")
+  write(host / "users.POST.json", '{"created": true}')
+  write(host / "users.POST.json.meta", json.dumps({"status": 201, "headers": {"Location": "/users/1"}}))
+  write(host / "users" / "{id}.json", '{"id": "any"}')
+  write(host / "users" / "me.json", '{"id": "me"}')
+  write(host / "users" / "me.json.meta", json.dumps({"status": 403, "headers": {"Content-Type": "text/plain"}}))
+  write(host / "logo.png", b"\x89PNG")
+  write(tmp_path / "README.md", "Not a host")
+
+  fixtures = Fixtures(str(tmp_path))
+  assert len(fixtures) == 6
+  with unmock.patch(fixtures=fixtures, replyFn=lambda req: {"status": 418}):
+    assert requests.get("https://api.example.com/").json() == {"root": True}
+    res = requests.get("https://api.example.com/users")
+    assert (res.json(), res.headers["Content-Type"]) == ([], "application/json")
+    assert requests.get("https://api.example.com/users.json").json() == []
+    res = requests.post("https://api.example.com/users", json={"name": "x"})
+    assert (res.status_code, res.headers["Location"], res.json()) == (201, "/users/1", {"created": True})
+    assert requests.get("https://api.example.com/users/42").json() == {"id": "any"}
+    res = requests.get("https://api.example.com/users/me")
+    assert (res.status_code, res.headers["Content-Type"]) == (403, "text/plain")
+    res = requests.get("https://api.example.com/logo.png")
+    assert (res.content, res.headers["Content-Type"]) == (b"\x89PNG", "image/png")
+    assert requests.get("https://api.example.com/missing").status_code == 418
+    assert requests.get("https://other.example.com/").status_code == 418
+
+
+def test_lazy_loading(tmp_path):
+  for i in range(2000):
+    write(tmp_path / "api.example.com" / "items" / "{}.json".format(i), '{{"id": {}}}'.format(i))
+  fixtures = Fixtures(str(tmp_path))
+  assert len(fixtures) == 2000
+  (tmp_path / "api.example.com" / "items" / "7.json").unlink()  # Files are only read when requested
+  with unmock.patch(fixtures=str(tmp_path)) as options:
+    assert requests.get("https://api.example.com/items/1999").json() == {"id": 1999}
+  items = options.fixtures.router.hosts["api.example.com"].static["items"]
+  loaded = set(route.reply.path for node in items.static.values() for route in node.routes if route.reply.reply)
+  assert [path.endswith("1999.json") for path in loaded] == [True]
@@ -0,0 +1,85 @@
+import pytest
+from six.moves import http_client
+import unmock
+
+
+def echo(req):
+  return {"content": "{} {} {} {}".format(req.method, req.endpoint, req.headers.get("X-Seq", "-"), req.data)}
+
+
+def test_keep_alive():
+  with unmock.patch(replyFn=echo) as options:
+    conn = http_client.HTTPConnection("api.example.com")
+    for i in range(100):
+      conn.request("POST", "/items/{}".format(i), body="body {}".format(i).encode("ascii"),
+                   headers={"X-Seq": str(i)})
+      res = conn.getresponse()
+      assert res.read() == "POST /items/{} {} b'body {}'".format(i, i, i).encode("ascii")
+    assert conn.sock is None  # Never connected
+    assert not conn._buffer  # No request was encoded for the wire
+    conn.close()
+  assert options.journal.count(host="api.example.com") == 100
+
+
+def test_low_level_api():
+  with unmock.patch(replyFn=echo):
+    conn = http_client.HTTPConnection("api.example.com")
+    conn.putrequest("PUT", "/upload")
+    conn.putheader("X-Seq", "1")
+    conn.endheaders()
+    conn.send(b"part 1, ")
+    conn.send(b"part 2")
+    assert conn.getresponse().read() == b"PUT /upload 1 b'part 1, part 2'"
+    with pytest.raises(http_client.ResponseNotReady):
+      conn.getresponse()
+    with pytest.raises(http_client.CannotSendHeader):
+      conn.putheader("X-Seq", "2")
+
+    conn.request("GET", "/a")
+    first = conn.getresponse()
+    conn.request("GET", "/b")
+    with pytest.raises(http_client.ResponseNotReady):  # The previous response was not read
+      conn.getresponse()
+    assert first.read() == b"GET /a - None"
+    assert conn.getresponse().read() == b"GET /b - None"
+
+
+def test_mixed_with_whitelisted(local_server):
+  port = local_server.server.server_address[1]
+  with unmock.patch(replyFn=echo, whitelist=["127.0.0.1/real/*"]):
+    conn = http_client.HTTPConnection("127.0.0.1", port)
+    for path in ("/mocked", "/real/1", "/mocked", "/real/2"):
+      conn.request("GET", path)
+      body = conn.getresponse().read()
+      assert body == (b"GET " + path.encode("ascii") if path.startswith("/real") else b"GET /mocked - None")
+    conn.close()
+
+
+def test_close_with_unread_response():
+  with unmock.patch(replyFn=echo):
+    conn = http_client.HTTPConnection("api.example.com")
+    conn.request("GET", "/a")
+    first = conn.getresponse()
+    conn.close()
+    assert first.isclosed()
+    conn.request("GET", "/b")
+    assert conn.getresponse().read() == b"GET /b - None"
+
+
+def test_failing_reply():
+  calls = []
+
+  def reply(req):
+    calls.append(req.endpoint)
+    if len(calls) == 1:
+      raise RuntimeError("upstream is down")
+    return echo(req)
+
+  with unmock.patch(replyFn=reply):
+    conn = http_client.HTTPConnection("api.example.com")
+    conn.request("GET", "/fails")
+    with pytest.raises(RuntimeError):
+      conn.getresponse()
+    conn.close()
+    conn.request("GET", "/works")
+    assert conn.getresponse().read() == b"GET /works - None"
@@ -0,0 +1,73 @@
+import pytest
+import requests
+from six.moves import http_client
+import unmock
+from unmock.core import Journal, Request
+
+
+def make_request(host, endpoint, method="GET", data=None):
+  req = Request(host, 443, endpoint, method)
+  req.add_body(data)
+  return req
+
+
+def reply(req):
+  return {"status": 201 if req.method == "POST" else 200}
+
+
+def test_records_intercepted_requests():
+  with unmock.patch(replyFn=reply, journal=Journal(keep_bodies=True)) as options:
+    requests.get("https://api.example.com/users?page=2")
+    requests.post("https://api.example.com/users", json={"name": "x"})
+    conn = http_client.HTTPConnection("www.foo.com")
+    conn.request("GET", "/")
+    conn.getresponse().read()
+
+  journal = options.journal
+  assert len(journal) == journal.count() == 3
+  assert journal.count(host="API.example.com") == 2
+  assert journal.count(host="api.example.com", method="post") == 1
+  assert journal.count(path="/users") == 2
+  last = journal.last(host="api.example.com")
+  assert (last.method, last.status, last.client) == ("POST", 201, "urllib3")
+  assert last.request.json == {"name": "x"}
+  assert journal.last(path="/").client == "http.client"
+  assert journal.filter(predicate=lambda e: e.request.qs.get("page") == ["2"])[0].endpoint == "/users?page=2"
+  assert journal.assert_called(host="www.foo.com", times=1)[0].host == "www.foo.com"
+  with pytest.raises(AssertionError, match="Expected 2 request"):
+    journal.assert_called(host="www.foo.com", times=2)
+  with pytest.raises(AssertionError, match="got 0"):
+    journal.assert_called(host="www.bar.com")
+
+
+def test_ring_buffer():
+  journal = Journal(capacity=3)
+  for i in range(5):
+    journal.record(make_request("host{}.com".format(i % 2), "/items/{}".format(i)), "urllib3", {})
+  assert [entry.path for entry in journal] == ["/items/2", "/items/3", "/items/4"]
+  assert journal.count(host="host0.com") == 2
+  assert journal.count(path="/items/0") == 0
+  assert journal.count(method="GET") == 3
+  assert sorted(journal._indexes["path"]) == ["/items/2", "/items/3", "/items/4"]
+  journal.clear()
+  assert len(journal) == 0 and journal.last() is None
+
+
+def test_metadata_only():
+  journal = unmock.core.UnmockOptions().journal  # The default
+  entry = journal.record(make_request("api.example.com", "/", "POST", b"secret"), "httpx", {"content": "big"})
+  assert entry.request is None and entry.reply is None
+  assert entry.body_digest is None  # Not hashed unless asked to, or already known
+  req = make_request("api.example.com", "/", "POST", b"secret")
+  digest = req.body_digest
+  assert journal.record(req, "httpx", {}).body_digest == digest
+  journal = Journal(hash_bodies=True)
+  assert journal.record(make_request("api.example.com", "/", "POST", b"secret"), "httpx", {}).body_digest == digest
+  journal = Journal(keep_bodies=True)
+  assert journal.record(make_request("api.example.com", "/", "POST", b"secret"), "httpx", {}).body_digest == digest
+
+
+def test_disabled():
+  with unmock.patch(journal=None) as options:
+    requests.get("https://api.example.com/")
+  assert options.journal is None
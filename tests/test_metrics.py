@@ -0,0 +1,66 @@
+import time
+import pytest
+import requests
+from six.moves import http_client
+import unmock
+from unmock.core import metrics
+
+
+@pytest.fixture
+def fresh_metrics():
+  metrics.reset()
+  yield
+  metrics.reset()
+
+
+def test_counts_and_latencies(fresh_metrics, local_server):
+  def slow_reply(req):
+    time.sleep(0.002)
+    return {"content": "slow"}
+
+  with unmock.patch(replyFn=slow_reply):
+    for _ in range(3):
+      requests.get("https://www.foo.com/")
+    conn = http_client.HTTPConnection("www.bar.com")
+    conn.request("GET", "/")
+    conn.getresponse().read()
+    requests.get(local_server)
+
+  snapshot = metrics.snapshot()
+  assert snapshot["intercepted"] == {"www.foo.com": {"urllib3": 3}, "www.bar.com": {"http.client": 1}}
+  assert snapshot["passthrough"]["127.0.0.1"]["urllib3"] == 1
+  latency = snapshot["reply_latency"]["www.foo.com"]
+  assert latency["count"] == 3
+  assert latency["sum"] >= 0.006
+  assert latency["max"] >= 0.002
+  assert sum(n for _, n in latency["buckets"]) == 3
+  assert latency["buckets"][-1][0] is None
+
+
+def test_hooks(fresh_metrics):
+  events = list()
+
+  def on_request(req, client):
+    events.append(("request", req.host, client))
+
+  def on_reply(req, client, reply, seconds):
+    events.append(("reply", reply["content"], seconds >= 0))
+
+  def on_response(req, client, response):
+    events.append(("response", response.status))
+
+  metrics.add_hook("request", on_request)
+  metrics.add_hook("reply", on_reply)
+  metrics.add_hook("response", on_response)
+  try:
+    with unmock.patch(replyFn=lambda _: {"content": "hi", "status": 201}):
+      requests.get("https://www.foo.com/")
+  finally:
+    metrics.remove_hook("request", on_request)
+    metrics.remove_hook("reply", on_reply)
+    metrics.remove_hook("response", on_response)
+  assert events == [("request", "www.foo.com", "urllib3"), ("reply", "hi", True), ("response", 201)]
+  assert metrics.HOOKS.request == metrics.HOOKS.reply == metrics.HOOKS.response == ()
+
+  with pytest.raises(ValueError):
+    metrics.add_hook("nope", on_request)
@@ -0,0 +1,183 @@
+import json
+import random
+import re
+import pytest
+import requests
+import unmock
+from unmock.core.openapi import OpenAPI, SchemaCompiler
+
+SPEC = {
+    "openapi": "3.0.3",
+    "info": {"title": "Pets", "version": "1"},
+    "servers": [{"url": "https://{region}.pets.example.com/v1", "variables": {"region": {"default": "eu"}}}],
+    "paths": {
+        "/pets": {
+            "get": {"responses": {"200": {"description": "", "content": {"application/json": {
+                "schema": {"type": "array", "items": {"$ref": "#/components/schemas/Pet"}, "maxItems": 5}}}}}},
+            "post": {"responses": {
+                "201": {"$ref": "#/components/responses/Created"},
+                "400": {"description": ""}}},
+        },
+        "/pets/{id}": {
+            "get": {"responses": {
+                "200": {"description": "", "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/Pet"}}}},
+                "default": {"description": ""}}},
+            "delete": {"responses": {"204": {"description": ""}}},
+        },
+        "/version": {
+            "get": {"responses": {"200": {"description": "", "content": {
+                "text/plain": {"schema": {"type": "string"}},
+                "application/json": {"example": {"version": "1.2.3"}}}}}},
+        },
+    },
+    "components": {
+        "schemas": {
+            "Pet": {
+                "type": "object",
+                "required": ["id", "name", "kind"],
+                "properties": {
+                    "id": {"type": "integer", "minimum": 1, "maximum": 100},
+                    "name": {"type": "string", "minLength": 3, "maxLength": 8},
+                    "kind": {"type": "string", "enum": ["cat", "dog"]},
+                    "weight": {"type": "number", "exclusiveMinimum": True, "minimum": 0, "maximum": 50},
+                    "born": {"type": "string", "format": "date-time"},
+                    "tag": {"type": "string", "format": "uuid"},
+                    "password": {"type": "string", "writeOnly": True},
+                    "parent": {"$ref": "#/components/schemas/Pet"},
+                    "owner": {"allOf": [{"$ref": "#/components/schemas/Named"},
+                                        {"type": "object", "properties": {"vip": {"type": "boolean"}}}]},
+                },
+            },
+            "Named": {"type": "object", "required": ["name"], "properties": {"name": {"type": "string"}}},
+        },
+        "responses": {
+            "Created": {"description": "", "content": {"application/json": {"schema": {
+                "type": "object", "properties": {"id": {"type": "integer", "multipleOf": 5}}}}}},
+        },
+    },
+}
+
+
+def check_pet(pet):
+  assert 1 <= pet["id"] <= 100
+  assert 3 <= len(pet["name"]) <= 8
+  assert pet["kind"] in ("cat", "dog")
+  assert "password" not in pet
+  if "weight" in pet:
+    assert 0 < pet["weight"] <= 50
+  if "born" in pet:
+    assert re.match(r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ$", pet["born"])
+  if "owner" in pet:
+    assert set(pet["owner"]) <= {"name", "vip"} and "name" in pet["owner"]
+  if "parent" in pet:
+    check_pet(pet["parent"])
+
+
+def test_generated_responses():
+  with unmock.patch(openapi=SPEC):
+    res = requests.get("https://eu.pets.example.com/v1/pets")
+    assert res.headers["Content-Type"] == "application/json"
+    pets = res.json()
+    assert 1 <= len(pets) <= 5
+    for pet in pets:
+      check_pet(pet)
+
+    res = requests.get("https://eu.pets.example.com/v1/pets/7")
+    check_pet(res.json())
+    assert res.json() == requests.get("https://eu.pets.example.com/v1/pets/7").json()  # Same seed, same request
+    assert res.json() != requests.get("https://eu.pets.example.com/v1/pets/8").json()
+
+    res = requests.post("https://eu.pets.example.com/v1/pets", json={"name": "Rex"})
+    assert res.status_code == 201
+    assert res.json()["id"] % 5 == 0
+    assert requests.delete("https://eu.pets.example.com/v1/pets/7").status_code == 204
+    assert requests.get("https://eu.pets.example.com/v1/version").json() == {"version": "1.2.3"}
+
+    assert requests.get("https://eu.pets.example.com/v1/unknown").content == b""  # Falls back to replyFn
+    assert requests.get("https://us.pets.example.com/v1/pets/7").content == b""
+
+
+def test_seeds():
+  first = OpenAPI(SPEC, seed=1)
+  with unmock.patch(openapi=first, cache=True) as options:
+    body = requests.get("https://eu.pets.example.com/v1/pets/7").json()
+    requests.get("https://eu.pets.example.com/v1/pets/7")
+  assert options.cache.stats()["hits"] == 1
+  with unmock.patch(openapi=OpenAPI(SPEC, seed=1)):
+    assert requests.get("https://eu.pets.example.com/v1/pets/7").json() == body
+  with unmock.patch(openapi=OpenAPI(SPEC, seed=2)):
+    assert requests.get("https://eu.pets.example.com/v1/pets/7").json() != body
+  with unmock.patch(openapi=OpenAPI(SPEC, seed=None), cache=True) as options:
+    requests.get("https://eu.pets.example.com/v1/pets/7")
+    requests.get("https://eu.pets.example.com/v1/pets/7")
+  assert options.cache.stats()["hits"] == 0  # Random bodies are not cached
+
+
+def test_schemas_compiled_once():
+  api = OpenAPI(SPEC)
+  assert len(api) == 5
+  assert not api.compiler.refs  # Nothing is compiled until requested
+  with unmock.patch(openapi=api):
+    requests.get("https://eu.pets.example.com/v1/pets/1")
+    refs = dict(api.compiler.refs)
+    requests.get("https://eu.pets.example.com/v1/pets")
+  assert set(refs) == {"#/components/schemas/Pet", "#/components/schemas/Named"}
+  assert api.compiler.refs == refs  # The second operation reused the compiled schemas
+
+
+def test_recursive_schema_terminates():
+  children = {"type": "array", "minItems": 1, "items": {"$ref": "#/components/schemas/Node"}}
+  document = {"components": {"schemas": {"Node": {
+      "type": "object", "required": ["value"], "properties": {"value": {"type": "integer"}, "children": children}}}}}
+  generator = SchemaCompiler(document).ref("#/components/schemas/Node")
+  depth = 0
+  node = generator(random.Random(0), 0)
+  while node.get("children"):
+    node = node["children"][0]
+    depth += 1
+  assert depth <= 4
+
+
+def test_patterns_and_untyped_schemas():
+  compiler = SchemaCompiler(dict())
+  patterns = [r"^[A-Z]{2}-\d{3,}$", r"^(cat|dog)s?$", r"^[^a-z]+$", r"^\w+@\w+\.com$", r"^\S{4}$"]
+  for pattern in patterns:
+    generator = compiler.compile({"type": "string", "pattern": pattern})
+    for seed in range(20):
+      assert re.search(pattern, generator(random.Random(seed), 0))
+  bounded = compiler.compile({"type": "string", "pattern": "^a+$", "minLength": 2, "maxLength": 3})
+  assert bounded(random.Random(0), 0) in ("aa", "aaa")
+  unsupported = {"type": "string", "pattern": r"^(a)\1$"}  # Back references are not generated
+  assert compiler.compile(dict(unsupported, example="aa"))(random.Random(0), 0) == "aa"
+  assert isinstance(compiler.compile(unsupported)(random.Random(0), 0), str)
+  assert isinstance(compiler.compile(dict())(random.Random(0), 0), str)
+  assert compiler.compile({"example": 3})(random.Random(0), 0) == 3
+  assert compiler.compile({"type": "null"})(random.Random(0), 0) is None
+
+
+def test_yaml_and_json_files(tmp_path):
+  yaml = pytest.importorskip("yaml")
+  spec = dict(SPEC, servers=[{"url": "/api"}])  # Relative servers match any host
+  (tmp_path / "spec.yaml").write_text(yaml.safe_dump(spec))
+  (tmp_path / "spec.json").write_text(json.dumps(spec))
+  for path in (str(tmp_path / "spec.yaml"), tmp_path / "spec.json"):  # Paths may be strings or path-like objects
+    with unmock.patch(openapi=path):
+      check_pet(requests.get("https://anything.example.com/api/pets/3").json())
+
+
+def test_unsupported_version():
+  with pytest.raises(ValueError):
+    OpenAPI({"swagger": "2.0", "paths": {}})
+
+
+def test_large_specification():
+  paths = dict()
+  for i in range(2500):
+    operation = {"responses": {"200": {"description": "", "content": {"application/json": {
+        "schema": {"$ref": "#/components/schemas/Pet"}}}}}}
+    paths["/resources{}/{{id}}/items".format(i)] = {"get": operation, "put": operation}
+  api = OpenAPI(dict(SPEC, paths=paths))
+  assert len(api) == 5000
+  with unmock.patch(openapi=api):
+    check_pet(requests.put("https://eu.pets.example.com/v1/resources2499/1/items").json())
@@ -0,0 +1,30 @@
+from unmock.core import UnmockOptions
+
+
+def test_default_whitelist():
+  opts = UnmockOptions()
+  assert opts._is_host_whitelisted("localhost")
+  assert opts._is_host_whitelisted("127.0.0.1")
+  assert not opts._is_host_whitelisted("www.example.com")
+
+
+def test_whitelist_patterns():
+  opts = UnmockOptions(whitelist=["api.example.com", "*.internal.net", "db-?.corp", "*.google.com/*",
+                                  "files.example.com/public/*"])
+  assert opts._is_host_whitelisted("API.example.com")
+  assert opts._is_host_whitelisted("a.b.internal.net")
+  assert not opts._is_host_whitelisted("internal.net")
+  assert opts._is_host_whitelisted("db-1.corp")
+  assert not opts._is_host_whitelisted("db-10.corp")
+  assert opts._is_host_whitelisted("www.google.com")
+  assert opts._is_host_whitelisted("www.google.com", "/search?q=unmock")
+  assert opts._is_host_whitelisted("files.example.com", "/public/a.txt")
+  assert not opts._is_host_whitelisted("files.example.com", "/private/a.txt")
+  assert not opts._is_host_whitelisted("www.example.com", "/public/a.txt")
+
+
+def test_whitelist_string():
+  opts = UnmockOptions(whitelist="*.example.com")
+  assert opts.whitelist == ["*.example.com"]
+  assert opts._is_host_whitelisted("www.example.com")
+  assert not opts._is_host_whitelisted("www.example.org")
@@ -0,0 +1,77 @@
+"""Runs test files through the unmock pytest plugin in-process"""
+import pytest
+import requests  # noqa: F401 (imported before the runs, which would otherwise import it afresh each)
+import unmock.core as unmock_core
+
+if not hasattr(pytest, "Pytester"):
+  pytest.skip("The pytester fixture requires pytest 6.2+", allow_module_level=True)
+
+TESTS = """
+import threading
+import pytest
+import requests
+import unmock.core as unmock_core
+
+PATCHERS = []
+
+
+def get_in_thread():
+  results = []
+  thread = threading.Thread(target=lambda: results.append(requests.get("https://www.foo.com/").text))
+  thread.start()
+  thread.join()
+  return results[0]
+
+
+def reply(text):
+  return lambda _: {"content": text}
+
+
+def check_patchers():
+  PATCHERS.append(list(unmock_core.PATCHERS.patchers))
+  assert all(p == PATCHERS[0] for p in PATCHERS)  # Patched once for the whole session
+
+
+@pytest.mark.unmock(replyFn=reply("marked"))
+def test_marker():
+  check_patchers()
+  assert requests.get("https://www.foo.com/").text == "marked"
+  assert get_in_thread() == "marked"
+
+
+def test_fixture(unmock):
+  unmock(replyFn=reply("first"))
+  assert requests.get("https://www.foo.com/").text == "first"
+  unmock(replyFn=reply("second"))
+  assert requests.get("https://www.foo.com/").text == "second"
+  assert get_in_thread() == "second"  # Threads started by the test use its options
+  check_patchers()
+
+
+@pytest.mark.unmock(replyFn=reply("marked"))
+def test_marker_and_fixture(unmock):
+  assert requests.get("https://www.foo.com/").text == "marked"
+  unmock(replyFn=reply("fixture"))
+  assert requests.get("https://www.foo.com/").text == "fixture"
+  check_patchers()
+
+
+def test_restored_after_teardown():
+  assert requests.get("https://www.foo.com/").text == ""  # Default options, from --unmock
+  assert get_in_thread() == ""
+  check_patchers()
+"""
+
+
+def test_plugin(pytester):
+  pytester.makepyfile(TESTS)
+  result = pytester.runpytest_inprocess("-p", "unmock.pytest.plugin", "--unmock")
+  result.assert_outcomes(passed=4)
+  assert not unmock_core.PATCHERS.patchers  # Released at the end of the session
+
+
+def test_marker_without_flag(pytester):
+  path = pytester.makepyfile(TESTS)
+  result = pytester.runpytest_inprocess("-p", "unmock.pytest.plugin", "{}::test_marker".format(path.name))
+  result.assert_outcomes(passed=1)
+  assert not unmock_core.PATCHERS.patchers
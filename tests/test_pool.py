@@ -0,0 +1,69 @@
+import os
+import pytest
+import urllib3
+import unmock
+
+STRESS_REQUESTS = int(os.environ.get("UNMOCK_STRESS_REQUESTS", "10000"))
+"""Mocked requests made by the stress test; set UNMOCK_STRESS_REQUESTS=300000 for a longer run"""
+
+
+def test_pool_stays_flat():
+  tracemalloc = pytest.importorskip("tracemalloc")  # Python 3.4+
+  manager = urllib3.PoolManager(maxsize=1, block=True)
+  reply = {"content": "ok", "headers": {"Content-Type": "text/plain"}}
+  with unmock.patch(replyFn=lambda _: reply):
+    def request():
+      res = manager.request("GET", "http://api.example.com/items?page=1")
+      assert res.data == b"ok"
+
+    warmup = 2000  # Fills the journal and the caches
+    tracemalloc.start()
+    try:
+      for _ in range(warmup):
+        request()
+      before, _ = tracemalloc.get_traced_memory()
+      for _ in range(STRESS_REQUESTS):
+        request()
+      after, _ = tracemalloc.get_traced_memory()
+    finally:
+      tracemalloc.stop()
+
+  pool = manager.connection_from_host("api.example.com", 80, "http")
+  assert pool.num_requests == warmup + STRESS_REQUESTS
+  assert pool.num_connections == 0  # No connection was ever created...
+  assert pool.pool.qsize() == 1  # ...nor checked out, so a blocking pool never runs dry
+  assert after - before < 256 * 1024
+
+
+def test_retries_and_redirects():
+  statuses = {"/flaky": [503, 503, 200]}
+
+  def reply(req):
+    if req.endpoint == "/old":
+      return {"status": 301, "headers": {"Location": "/new"}}
+    if req.endpoint == "/see-other":
+      return {"status": 303, "headers": {"Location": "/new"}}
+    if req.endpoint == "/elsewhere":
+      return {"status": 302, "headers": {"Location": "http://other.example.com/new"}}
+    if req.endpoint == "/loop":
+      return {"status": 302, "headers": {"Location": "/loop"}}
+    status = statuses[req.endpoint].pop(0) if req.endpoint in statuses else 200
+    return {"status": status, "content": "{} {}{}".format(req.method, req.host, req.endpoint)}
+
+  retry = urllib3.Retry(total=3, status_forcelist=[503], backoff_factor=0)
+  pool = urllib3.HTTPConnectionPool("api.example.com", retries=retry)
+  manager = urllib3.PoolManager(retries=retry)
+  with unmock.patch(replyFn=reply) as options:
+    assert pool.urlopen("GET", "/flaky").data == b"GET api.example.com/flaky"
+    assert pool.num_requests == 3
+    res = pool.urlopen("POST", "/see-other", body="x")
+    assert res.data == b"GET api.example.com/new"
+    assert [r.redirect_location for r in res.retries.history] == ["/new"]
+    assert pool.urlopen("GET", "/old", redirect=False).status == 301
+    assert manager.request("GET", "http://api.example.com/elsewhere").data == b"GET other.example.com/new"
+    with pytest.raises(urllib3.exceptions.MaxRetryError):
+      pool.urlopen("GET", "/loop")
+    with pytest.raises(urllib3.exceptions.HostChangedError):
+      pool.urlopen("GET", "http://other.example.com/")
+  assert options.journal.count(path="/loop") == 4
+  assert pool.num_connections == 0
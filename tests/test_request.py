@@ -0,0 +1,108 @@
+import pytest
+import requests
+import unmock
+from unmock.core import Request
+
+
+def test_slots():
+  req = Request("www.foo.com", 443, "/", "GET")
+  with pytest.raises(AttributeError):
+    req.foo = "bar"
+
+
+def test_lazy_query_string():
+  req = Request("www.foo.com", 443, "/search?q=a&q=b&page=1", "GET")
+  assert req._qs is None
+  assert req.qs == {"q": ["a", "b"], "page": ["1"]}
+  assert req.qs is req.qs
+  req.add_query("sort=asc")
+  assert req.qs["sort"] == ["asc"]
+
+
+def test_json_body():
+  req = Request("www.foo.com", 443, "/", "POST")
+  assert req.json is None
+  req.add_body(b'{"foo": [1, 2]}')
+  assert req.json == {"foo": [1, 2]}
+  req.add_body("not json")
+  assert req.json is None
+
+
+def test_headers():
+  req = Request("www.foo.com", 443, "/", "GET")
+  req.add_header(b"Accept", b"text/html")
+  req.add_header("accept", "application/json")
+  req.add_header("Content-Length", 4)
+  req.add_headers({"X-Foo": "bar"})
+  assert req.headers["ACCEPT"] == "text/html, application/json"
+  assert req.headers.get_all("Accept") == ["text/html", "application/json"]
+  assert req.headers["content-length"] == "4"
+  assert "x-foo" in req.headers
+  assert req.headers.get("X-Missing") is None
+  assert sorted(req.headers) == ["Accept", "Content-Length", "X-Foo"]
+
+
+def test_intercepted_headers():
+  captured = []
+
+  def reply(req):
+    captured.append(req)
+    return {}
+
+  with unmock.patch(replyFn=reply):
+    requests.post("https://www.foo.com/?a=1", json={"foo": "bar"}, headers={"X-Token": "secret"})
+  req = captured[0]
+  assert req.headers["x-token"] == "secret"
+  assert req.headers["Content-Type"] == "application/json"
+  assert req.json == {"foo": "bar"}
+  assert req.qs == {"a": ["1"]}
+
+
+def test_streamed_bodies(monkeypatch):
+  from unmock.core import request
+  monkeypatch.setattr(request, "SPOOL_THRESHOLD", 100)
+  req = Request("www.foo.com", 443, "/", "PUT")
+  req.add_body(iter([b'{"a": ', "1}"]))
+  assert (req.data, req.body_size, req.json) == (b'{"a": 1}', 8, {"a": 1})
+
+  req.add_body(chunk for chunk in [b"x" * 60] * 3)  # Over the threshold
+  assert hasattr(req.data, "read") and req.data.read() == b"x" * 180
+  assert req.body_size == 180
+  small = Request("www.foo.com", 443, "/", "PUT")
+  small.add_body(b"x" * 180)
+  assert req.body_digest == small.body_digest
+
+
+def test_intercepted_uploads(tmp_path, monkeypatch):
+  from unmock.core import request
+  monkeypatch.setattr(request, "SPOOL_THRESHOLD", 1024)
+  path = tmp_path / "upload.bin"
+  path.write_bytes(b"0123456789" * 1000)
+  expected = Request("", 0, "/", "PUT")
+  expected.add_body(path.read_bytes())
+
+  def reply(req):
+    return {"content": "{} {}".format(req.body_size, req.body_digest == expected.body_digest)}
+
+  with unmock.patch(replyFn=reply):
+    with open(str(path), "rb") as f:
+      assert requests.put("https://www.foo.com/upload", data=f).text == "10000 True"
+    chunks = (b"0123456789" * 100 for _ in range(10))
+    assert requests.put("https://www.foo.com/upload", data=chunks).text == "10000 True"
+    from six.moves import http_client
+    conn = http_client.HTTPConnection("www.foo.com")
+    with open(str(path), "rb") as f:
+      conn.request("PUT", "/upload", body=f)
+    assert conn.getresponse().read() == b"10000 True"
+
+
+def test_spooled_bodies_are_closed(monkeypatch):
+  from unmock.core import request
+  monkeypatch.setattr(request, "SPOOL_THRESHOLD", 100)
+  journal = unmock.Journal(keep_bodies=True)
+  with unmock.patch(replyFn=lambda req: {"content": req.data.read(3)}, journal=journal):
+    chunks = (b"x" * 60 for _ in range(3))
+    assert requests.put("https://www.foo.com/upload", data=chunks).content == b"xxx"
+  req = journal.last().request
+  assert req.data.closed
+  assert req.body_size == 180
@@ -0,0 +1,58 @@
+import json
+import zlib
+import requests
+import unmock
+
+
+def gzip_compress(data):
+  """`gzip.compress` is Python 3 only"""
+  compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  return compressor.compress(data) + compressor.flush()
+
+
+def reply(req):
+  if req.endpoint == "/old":
+    return {"status": 302, "headers": {"Location": "/new"}}
+  if req.endpoint == "/login":
+    return {"headers": {"Set-Cookie": "session=abc; Path=/"}}
+  if req.endpoint == "/gzip":
+    return {"content": gzip_compress(b"compressed"), "headers": {"Content-Encoding": "gzip"}}
+  content = {"method": req.method, "path": req.endpoint, "body": req.data, "accept": req.headers.get("Accept")}
+  return {"content": json.dumps(content), "headers": {"Content-Type": "application/json"}}
+
+
+def test_adapter_responses():
+  session = requests.Session()
+  with unmock.patch(replyFn=reply, requests_adapter=True) as options:
+    res = session.post("https://api.example.com/items?page=2", data="body", headers={"Accept": "text/plain"})
+    assert res.status_code == 200 and res.reason == "OK"
+    assert res.url == "https://api.example.com/items?page=2"
+    assert res.json() == {"method": "POST", "path": "/items?page=2", "body": "body", "accept": "text/plain"}
+    assert res.request.method == "POST"
+
+    res = session.get("https://api.example.com/old")
+    assert res.url == "https://api.example.com/new"
+    assert [r.status_code for r in res.history] == [302]
+
+    session.get("https://api.example.com/login")
+    assert session.cookies.get("session") == "abc"
+
+    assert session.get("https://api.example.com/gzip").content == b"compressed"
+
+    chunks = list(session.get("https://api.example.com/stream", stream=True).iter_content(4))
+    assert json.loads(b"".join(chunks).decode("utf-8"))["path"] == "/stream"
+  assert options.journal.count(host="api.example.com") == 6
+  assert [entry.client for entry in options.journal] == ["requests"] * 6
+
+
+def test_adapter_whitelisted(local_server):
+  with unmock.patch(replyFn=reply, requests_adapter=True) as options:
+    res = requests.get(local_server + "/real")
+    assert res.text == "GET /real"
+  assert options.journal.count() == 0
+
+
+def test_adapter_is_opt_in():
+  with unmock.patch(replyFn=reply) as options:
+    assert requests.get("https://api.example.com/items").json()["path"] == "/items"
+  assert [entry.client for entry in options.journal] == ["urllib3"]
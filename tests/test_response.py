@@ -0,0 +1,182 @@
+import pytest
+from unmock.core.response import get_template
+
+
+def test_template_is_reused():
+  reply = {"content": "foo", "status": 201, "headers": {"X-Foo": "bar"}}
+  template = get_template(reply)
+  assert template is get_template(dict(reply))
+  assert template.body == b"foo"
+  assert template.reason == "Created"
+
+
+def test_templates_are_bounded(monkeypatch):
+  from unmock.core import response
+  from unmock.core.utils import LRUCache
+  monkeypatch.setattr(response, "TEMPLATES", LRUCache(256, max_bytes=2500, sizeof=response._template_size))
+  large = get_template({"content": b"x" * 1000})
+  assert large is get_template({"content": b"x" * 1000})
+  get_template({"content": b"y" * 1000})
+  assert response.TEMPLATES.bytes == 2000
+  get_template({"content": b"z" * 1000})  # Evicts the least recently used template
+  assert response.TEMPLATES.bytes == 2000
+  assert large is not get_template({"content": b"x" * 1000})
+  get_template({"content": b"w" * 3000})  # Never cached
+  assert len(response.TEMPLATES) == 2
+  assert all(len(key[2]) == 20 for key in response.TEMPLATES._data)  # Keyed on a digest of the content
+
+
+def test_template_message():
+  template = get_template({"headers": {"Set-Cookie": ["a=1", "b=2"], "Content-Length": 0, "X-Foo": "bar"}})
+  msg = template.message()
+  assert msg.get_all("Set-Cookie") == ["a=1", "b=2"]
+  assert msg["Content-Length"] == "0"
+  assert msg["x-foo"] == "bar"
+  assert template.message() is not msg
+
+
+def test_unhashable_reply():
+  template = get_template({"content": b"x", "headers": {"X-Foo": {"not": "hashable"}}})
+  assert template.body == b"x"
+
+
+def test_buffer_and_file_content(tmp_path):
+  pathlib = pytest.importorskip("pathlib")  # Python 3.4+
+  import requests
+  import unmock
+  path = tmp_path / "export.bin"
+  path.write_bytes(b"0123456789" * 1000)
+  data = bytearray(b"buffered")
+  replies = {"/file": {"content": pathlib.Path(str(path))}, "/buffer": {"content": memoryview(data)},
+             "/empty": {"content": pathlib.Path(str(tmp_path / "empty"))}}
+  (tmp_path / "empty").write_bytes(b"")
+  with unmock.patch(replyFn=lambda req: replies[req.endpoint]):
+    res = requests.get("https://www.foo.com/file")
+    assert res.content == path.read_bytes()
+    assert res.headers.get("Transfer-Encoding") is None
+    assert requests.get("https://www.foo.com/buffer").content == b"buffered"
+    assert requests.get("https://www.foo.com/empty").content == b""
+
+
+def test_streamed_content():
+  tracemalloc = pytest.importorskip("tracemalloc")  # Python 3.4+
+  import requests
+  import unmock
+  chunk = b"x" * 65536
+
+  def reply(_):
+    return {"content": (chunk for _ in range(400))}  # ~25MB
+
+  with unmock.patch(replyFn=reply):
+    tracemalloc.start()
+    res = requests.get("https://www.foo.com/export", stream=True)
+    assert res.headers["Transfer-Encoding"] == "chunked"
+    total = sum(len(part) for part in res.iter_content(65536))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+  assert total == 400 * len(chunk)
+  assert peak < 5 * 1024 * 1024
+
+
+def test_streamed_content_http_client():
+  import unmock
+  from six.moves import http_client
+  with unmock.patch(replyFn=lambda _: {"content": iter(["foo", b"", b"bar"])}):
+    conn = http_client.HTTPSConnection("www.foo.com")
+    conn.request("GET", "/")
+    assert conn.getresponse().read() == b"foobar"
+
+
+def test_urllib3_response():
+  import zlib
+  import urllib3
+  import unmock
+  compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip.compress is Python 3 only
+  compressed = compressor.compress(b"foo" * 100) + compressor.flush()
+
+  def reply(req):
+    if req.endpoint == "/gzip":
+      return {"content": compressed, "headers": {"Content-Encoding": "gzip"}}
+    return {"content": "streamed", "status": 202, "headers": {"X-Foo": ["a", "b"]}}
+
+  with unmock.patch(replyFn=reply):
+    http = urllib3.PoolManager()
+    res = http.request("GET", "https://www.foo.com/", preload_content=False)
+    assert res.status == 202
+    assert res.headers.getlist("X-Foo") == ["a", "b"]
+    assert res.read(3) == b"str"
+    assert res.read() == b"eamed"
+    assert http.request("GET", "https://www.foo.com/gzip").data == b"foo" * 100
+    assert http.request("GET", "https://www.foo.com/gzip", decode_content=False).data == compressed
+
+
+def test_requests_cookies():
+  import requests
+  import unmock
+  with unmock.patch(replyFn=lambda _: {"headers": {"Set-Cookie": ["a=1; Path=/", "b=2; Path=/"]}}):
+    res = requests.get("https://www.foo.com/")
+    assert res.cookies.get("a") == "1"
+    assert res.cookies.get("b") == "2"
+
+
+def test_structured_content():
+  import json
+  import requests
+  import unmock
+  from unmock.core.serialization import set_json_encoder
+  template = get_template({"content": {"sign": "scorpio"}})
+  assert template is get_template({"content": {"sign": "scorpio"}})  # Equal content shares a template
+  assert template.body == b'{"sign": "scorpio"}'
+  assert template.headers == [("Content-Type", "application/json")]
+  with unmock.patch(replyFn=lambda _: {"content": [1, {"a": None}], "headers": {"Content-Type": "text/json"}}):
+    res = requests.get("https://www.foo.com/")
+    assert res.json() == [1, {"a": None}]
+    assert res.headers["Content-Type"] == "text/json"
+  set_json_encoder(lambda content: json.dumps(content, separators=(",", ":")).encode("utf-8"))
+  try:
+    assert get_template({"content": {"a": [1, 2]}}).body == b'{"a":[1,2]}'
+  finally:
+    set_json_encoder()
+
+
+def test_mutated_content():
+  import requests
+  import unmock
+  state = {"count": 0}
+
+  def reply(req):
+    state["count"] += 1
+    return {"content": state}
+
+  with unmock.patch(replyFn=reply):
+    assert [requests.get("https://www.foo.com/").json()["count"] for _ in range(3)] == [1, 2, 3]
+
+
+def test_encoded_content():
+  import zlib
+  import requests
+  import urllib3
+  import unmock
+  from unmock.core.serialization import BODIES
+  body = b"lucky " * 1000
+  BODIES.clear()
+
+  def reply(req):
+    encoding = req.endpoint.lstrip("/")
+    if encoding == "stream":
+      return {"content": iter([body, body]), "encoding": "gzip"}
+    return {"content": body, "encoding": encoding, "headers": {"Content-Length": "1"}}
+
+  with unmock.patch(replyFn=reply):
+    res = requests.get("https://www.foo.com/gzip")
+    assert res.content == body
+    assert res.headers["Content-Encoding"] == "gzip"
+    raw = urllib3.PoolManager().request("GET", "https://www.foo.com/deflate", decode_content=False)
+    assert int(raw.headers["Content-Length"]) == len(raw.data) < len(body)
+    assert zlib.decompress(raw.data) == body
+    assert requests.get("https://www.foo.com/deflate").content == body
+    res = requests.get("https://www.foo.com/stream")
+    assert res.content == body * 2
+    assert "Content-Length" not in res.headers
+  assert BODIES.stats()["entries"] == 2
+  assert zlib.decompress(get_template({"content": body, "encoding": "gzip"}).body, 16 + zlib.MAX_WBITS) == body
@@ -0,0 +1,52 @@
+import unmock
+import requests
+from unmock.core import Request
+
+
+def make_router():
+  router = unmock.Router()
+  router.add("GET", "api.example.com", "/users", {"content": "all users"})
+  router.add("GET", "api.example.com", "/users/me", {"content": "me"})
+  router.add("GET", "api.example.com", "/users/{id}",
+             lambda req: {"content": "user {}".format(req.params["id"])})
+  router.add("GET", "api.example.com", "/users/{id}/posts/{post}",
+             lambda req: {"content": "{id}:{post}".format(**req.params)})
+  router.add("GET", "*", "/search", {"content": "paged"}, query={"page": None})
+  router.add(None, None, "/search", {"content": "search"})
+
+  @router.route("POST", "api.example.com", "/users", headers={"content-type": "application/json"})
+  def create_user(req):
+    return {"status": 201}
+
+  return router
+
+
+def test_dispatch():
+  router = make_router()
+  assert router(Request("api.example.com", 443, "/users", "GET")) == {"content": "all users"}
+  assert router(Request("api.example.com", 443, "/users/", "GET")) == {"content": "all users"}
+  assert router(Request("api.example.com", 443, "/users/me", "GET")) == {"content": "me"}
+  assert router(Request("api.example.com", 443, "/users/42?x=y", "GET")) == {"content": "user 42"}
+  assert router(Request("api.example.com", 443, "/users/1/posts/2", "GET")) == {"content": "1:2"}
+  assert router(Request("api.example.com", 443, "/users/1/comments", "GET")) is None
+  assert router(Request("www.example.com", 443, "/users", "GET")) is None
+
+
+def test_predicates():
+  router = make_router()
+  assert router(Request("any.host", 80, "/search?page=2", "GET")) == {"content": "paged"}
+  assert router(Request("any.host", 80, "/search", "DELETE")) == {"content": "search"}
+  req = Request("api.example.com", 443, "/users", "POST")
+  assert router(req) is None
+  req.add_header("Content-Type", "application/json")
+  assert router(req) == {"status": 201}
+
+
+def test_router_with_fallback():
+  def fallback(req):
+    return {"status": 404}
+  with unmock.patch(router=make_router(), replyFn=fallback):
+    res = requests.get("https://api.example.com/users/7")
+    assert res.status_code == 200
+    assert res.text == "user 7"
+    assert requests.get("https://api.example.com/nothing").status_code == 404
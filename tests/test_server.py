@@ -0,0 +1,110 @@
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import pytest
+import requests
+import unmock
+
+if sys.version_info < (3, 7):
+  pytest.skip("unmock serve requires Python 3.7+", allow_module_level=True)
+
+import asyncio  # noqa: E402
+from unmock.server import load_options, serve  # noqa: E402
+
+
+def echo(req):
+  return {"content": "{} {}{} {}".format(req.method, req.host, req.endpoint, req.data.decode("utf-8") if req.data else "-"),
+          "headers": {"X-Pid": str(os.getpid())}}
+
+
+@pytest.fixture(scope="module")
+def mock_server():
+  """An unmock server answering with `echo`, running in a background thread. Yields its (host, port) address."""
+  loop = asyncio.new_event_loop()
+  server = loop.run_until_complete(serve(unmock.UnmockOptions(replyFn=echo), port=0))
+  thread = threading.Thread(target=loop.run_forever)
+  thread.daemon = True
+  thread.start()
+  yield server.sockets[0].getsockname()[:2]
+  loop.call_soon_threadsafe(loop.stop)
+  thread.join()
+  server.close()
+  loop.close()
+
+
+def test_redirect(mock_server):
+  with unmock.patch(redirect="{}:{}".format(*mock_server)) as options:
+    assert options.engine == "socket"
+    with requests.Session() as session:
+      res = session.post("https://api.example.com/items?q=1", data="hello")
+      assert res.text == "POST api.example.com/items?q=1 hello"
+      assert res.headers["X-Pid"] == str(os.getpid())
+      assert session.get("http://api.example.com:8080/x").text == "GET api.example.com/x -"
+      assert session.head("http://api.example.com/x").headers["Content-Length"] == str(len("HEAD api.example.com/x -"))
+  # The server journals the requests, not this process
+  assert options.journal.count() == 0
+
+
+def test_proxy(mock_server):
+  proxy = "http://{}:{}".format(*mock_server)
+  res = requests.get("http://api.example.com/a/b", proxies={"http": proxy})
+  assert res.text == "GET api.example.com/a/b -"
+
+
+def test_malformed_request(mock_server):
+  sock = socket.create_connection(mock_server, timeout=5)
+  try:
+    sock.sendall(b"GET /1 HTTP/1.1\r\nHost: api.example.com\r\n\r\nGARBAGE\r\n\r\n")
+    data = b""
+    for chunk in iter(lambda: sock.recv(1024), b""):  # Until the server closes the connection
+      data += chunk
+  finally:
+    sock.close()
+  assert data.index(b"GET api.example.com/1 -") < data.index(b"HTTP/1.1 400 Bad Request")
+  assert data.endswith(b"Bad Request: Malformed request line 'GARBAGE'")
+
+
+def test_load_options(tmp_path, monkeypatch):
+  (tmp_path / "mocks_for_load.py").write_text(textwrap.dedent("""
+      import unmock
+      router = unmock.Router()
+      router.add("GET", "api.example.com", "/users/{id}", lambda req: {"content": req.params["id"]})
+      settings = {"replyFn": lambda req: {"status": 204}}
+      """))
+  monkeypatch.syspath_prepend(str(tmp_path))
+  assert isinstance(load_options("mocks_for_load:router").router, unmock.Router)
+  assert load_options("mocks_for_load:settings").replyFn(None) == {"status": 204}
+  with pytest.raises(ValueError):
+    load_options("mocks_for_load")
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="Requires SO_REUSEPORT")
+def test_workers(tmp_path):
+  (tmp_path / "mocks_for_workers.py").write_text(textwrap.dedent("""
+      import os
+      def reply(req):
+        return {"content": req.endpoint, "headers": {"X-Pid": str(os.getpid())}}
+      """))
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(tmp_path), os.getcwd()]))
+  process = subprocess.Popen([sys.executable, "-m", "unmock", "serve", "mocks_for_workers:reply", "--port", "0",
+                              "--workers", "2"], stdout=subprocess.PIPE, env=env)
+  try:
+    url = process.stdout.readline().decode("utf-8").split()[3]
+    pids = set()
+    deadline = time.time() + 10
+    while len(pids) < 2 and time.time() < deadline:
+      try:
+        res = requests.get(url + "/ping", headers={"Connection": "close"})
+      except requests.ConnectionError:  # The workers are still starting
+        time.sleep(0.05)
+        continue
+      assert res.text == "/ping"
+      pids.add(res.headers["X-Pid"])
+    assert len(pids) == 2
+  finally:
+    process.terminate()
+    process.wait()
@@ -0,0 +1,56 @@
+import time
+import pytest
+import requests
+from six.moves import http_client
+import unmock
+from unmock.core.simulation import Uniform, Normal, Percentiles, sample
+
+
+def timed(fn):
+  start = time.time()
+  result = fn()
+  return result, time.time() - start
+
+
+def test_distributions():
+  profile = Percentiles({50: 0.02, 90: 0.1, 99: 0.5}, seed=7)
+  samples = [profile.sample() for _ in range(1000)]
+  again = Percentiles({50: 0.02, 90: 0.1, 99: 0.5}, seed=7)
+  assert samples == [again.sample() for _ in range(1000)]
+  assert min(samples) == 0.02 and max(samples) <= 0.5
+  assert sorted(samples)[500] == pytest.approx(0.02, abs=0.01)
+  assert sorted(samples)[900] == pytest.approx(0.1, abs=0.05)
+  assert all(0.1 <= Uniform(0.1, 0.2, seed=1).sample() <= 0.2 for _ in range(100))
+  assert all(Normal(0.01, 0.05, seed=1).sample() >= 0 for _ in range(100))
+  assert sample(0.5) == 0.5
+  with pytest.raises(ValueError):
+    Percentiles({})
+
+
+def test_latency_per_host_and_reply():
+  def reply(req):
+    return {"content": "slow", "latency": 0.2} if req.endpoint == "/slow" else {"content": "ok"}
+
+  with unmock.patch(replyFn=reply, latency={"*.slow.com": 0.1}):
+    _, elapsed = timed(lambda: requests.get("https://api.slow.com/"))
+    assert elapsed >= 0.1
+    _, elapsed = timed(lambda: requests.get("https://api.fast.com/"))
+    assert elapsed < 0.1
+    res, elapsed = timed(lambda: requests.get("https://api.fast.com/slow"))
+    assert res.text == "slow" and elapsed >= 0.2
+
+
+def test_bandwidth():
+  body = b"x" * 2000
+  with unmock.patch(replyFn=lambda _: {"content": body}, bandwidth=10000):
+    res, elapsed = timed(lambda: requests.get("https://www.foo.com/"))
+    assert res.content == body
+    assert elapsed >= 0.19
+
+    def http_client_get():
+      conn = http_client.HTTPConnection("www.foo.com")
+      conn.request("GET", "/")
+      return conn.getresponse().read()
+    data, elapsed = timed(http_client_get)
+    assert data == body
+    assert elapsed >= 0.19
@@ -0,0 +1,36 @@
+import sys
+import time
+import pytest
+import unmock
+
+if sys.version_info < (3, 7):
+  pytest.skip("unmock patches asynchronous clients on Python 3.7+", allow_module_level=True)
+
+import asyncio  # noqa: E402
+
+
+def timed(fn):
+  start = time.time()
+  result = fn()
+  return result, time.time() - start
+
+
+def test_async_clients_yield():
+  aiohttp = pytest.importorskip("aiohttp")
+  httpx = pytest.importorskip("httpx")
+
+  async def main():
+    async with aiohttp.ClientSession() as session:
+      async def fetch(i):
+        async with session.get("https://api.example.com/{}".format(i)) as res:
+          return await res.read()
+      aiohttp_bodies = await asyncio.gather(*[fetch(i) for i in range(100)])
+    async with httpx.AsyncClient() as client:
+      responses = await asyncio.gather(*[client.get("https://api.example.com/{}".format(i)) for i in range(100)])
+    return aiohttp_bodies, [r.content for r in responses]
+
+  body = b"y" * 1000
+  with unmock.patch(replyFn=lambda _: {"content": body}, latency=0.2, bandwidth=10000):
+    (aiohttp_bodies, httpx_bodies), elapsed = timed(lambda: asyncio.run(main()))
+  assert aiohttp_bodies == httpx_bodies == [body] * 100
+  assert 0.6 <= elapsed < 2  # Two rounds of 0.2s latency and 0.1s transfers, all concurrent within each round
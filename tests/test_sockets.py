@@ -0,0 +1,96 @@
+import socket
+import pytest
+import requests
+from six.moves import http_client
+import unmock
+from unmock.core.sockets import RequestParser
+
+
+def echo(req):
+  return {"content": "{} {} {}".format(req.method, req.endpoint, req.data.decode("utf-8") if req.data else "-"),
+          "headers": {"X-Host": req.host}}
+
+
+def test_parser_incremental():
+  parser = RequestParser()
+  data = (b"POST /a HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n\r\nhello"
+          b"PUT /b HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nfoo\r\n3;ext=1\r\nbar\r\n0\r\nX-Trailer: 1\r\n\r\n"
+          b"GET /c HTTP/1.1\r\n\r\n")
+  requests_ = list()
+  for i in range(len(data)):  # One byte at a time
+    requests_.extend(parser.feed(data[i:i + 1]))
+  assert [(method, target, body) for method, target, _, _, body in requests_] == [
+      ("POST", "/a", b"hello"), ("PUT", "/b", b"foobar"), ("GET", "/c", b"")]
+  assert requests_[0][3] == [("Host", "x"), ("Content-Length", "5")]
+
+
+def test_http_client_keep_alive():
+  with unmock.patch(replyFn=echo, engine="socket") as options:
+    conn = http_client.HTTPConnection("api.example.com")
+    for i in range(3):
+      conn.request("POST", "/items/{}".format(i), body="body {}".format(i))
+      res = conn.getresponse()
+      assert res.read() == "POST /items/{} body {}".format(i, i).encode("utf-8")
+      assert res.getheader("X-Host") == "api.example.com"
+    sock = conn.sock
+    assert sock is not None and type(sock).__name__ == "MockSocket"  # The same connection was kept alive
+    conn.close()
+  assert options.journal.count(host="api.example.com", method="POST") == 3
+  assert options.journal.last().client == "socket"
+
+
+def test_requests_https_and_streams():
+  def reply(req):
+    if req.endpoint == "/stream":
+      return {"content": iter([b"a", b"b", b"c"])}
+    if req.endpoint == "/close":
+      return {"content": "bye", "headers": {"Connection": "close"}}
+    return echo(req)
+
+  with unmock.patch(replyFn=reply, engine="socket"):
+    session = requests.Session()
+    assert session.get("https://api.example.com/x?y=1").text == "GET /x?y=1 -"
+    assert session.post("https://api.example.com/x", json={"a": 1}).text == 'POST /x {"a": 1}'
+    assert session.get("https://api.example.com/stream").content == b"abc"
+    assert session.get("https://api.example.com/close").text == "bye"
+    assert session.head("https://api.example.com/x").headers["Content-Length"] == str(len("HEAD /x -"))
+    assert session.get("https://api.example.com/after").text == "GET /after -"
+
+
+def test_pipelining():
+  with unmock.patch(replyFn=echo, engine="socket"):
+    sock = socket.create_connection(("api.example.com", 80))
+    sock.sendall(b"GET /1 HTTP/1.1\r\nHost: api.example.com\r\n\r\nGET /2 HTTP/1.1\r\nHost: api.example.com\r\n\r\n")
+    data = b""
+    for chunk in iter(lambda: sock.recv(7), b""):
+      data += chunk
+    sock.close()
+  assert data.count(b"HTTP/1.1 200 OK\r\n") == 2
+  assert data.index(b"GET /1 -") < data.index(b"GET /2 -")
+
+
+def test_malformed_requests():
+  parser = RequestParser()
+  assert parser.feed(b"GET /1 HTTP/1.1\r\n\r\nGARBAGE\r\n\r\nGET /2 HTTP/1.1\r\n\r\n")[0][1] == "/1"
+  assert parser.error == "Malformed request line 'GARBAGE'"
+  assert parser.feed(b"GET /3 HTTP/1.1\r\n\r\n") == []
+
+  with unmock.patch(replyFn=echo, engine="socket") as options:
+    sock = socket.create_connection(("api.example.com", 80))
+    sock.sendall(b"GET /1 HTTP/1.1\r\n\r\nPOST /2 HTTP/1.1\r\nContent-Length: x\r\n\r\n")
+    data = b""
+    for chunk in iter(lambda: sock.recv(1024), b""):
+      data += chunk
+    with pytest.raises(socket.error):
+      sock.sendall(b"GET /3 HTTP/1.1\r\n\r\n")  # The connection was closed
+    sock.close()
+  assert data.index(b"HTTP/1.1 200 OK") < data.index(b"HTTP/1.1 400 Bad Request")
+  assert data.endswith(b"Bad Request: Malformed Content-Length 'x'")
+  assert [entry.path for entry in options.journal] == ["/1"]
+
+
+def test_whitelisted_hosts_connect(local_server):
+  with unmock.patch(replyFn=echo, engine="socket"):
+    assert requests.get(local_server + "/real").headers["X-Local"]
+  with pytest.raises(ValueError):
+    unmock.UnmockOptions(engine="nope")
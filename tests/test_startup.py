@@ -0,0 +1,72 @@
+"""`import unmock` should be close to free; clients are only patched once the application imports them"""
+import subprocess
+import sys
+import textwrap
+import pytest
+from unmock.core.utils import Patchers, IMPORT_HOOK
+
+
+def run_python(code):
+  output = subprocess.check_output([sys.executable, "-c", textwrap.dedent(code)])
+  return output.decode("utf-8").strip().splitlines()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="Lazy attributes (PEP 562) require Python 3.7+")
+def test_import_is_lazy():
+  imported = run_python("""
+      import sys
+      before = set(sys.modules)
+      import unmock
+      print("\\n".join(sorted(set(sys.modules) - before)))
+      """)
+  assert imported == ["unmock", "unmock.__version__"]
+
+
+def test_pytest_plugin_attribute():
+  lines = run_python("""
+      import sys
+      import unmock
+      print(unmock.pytest.__name__)
+      print("unmock.core" in sys.modules)
+      """)
+  assert lines == ["unmock.pytest", "False"]
+
+
+def test_clients_are_patched_when_imported():
+  lines = run_python("""
+      import sys
+      import unmock
+      unmock.on(replyFn=lambda req: {"content": "mocked"})
+      print("urllib3" in sys.modules)
+      import requests
+      print(requests.get("http://www.example.com/").text)
+      unmock.off()
+      print(any(type(finder).__name__ == "ImportHook" for finder in sys.meta_path))
+      """)
+  assert lines == ["False", "mocked", "False"]
+
+
+def test_patchers_when_imported(tmp_path, monkeypatch):
+  (tmp_path / "unmock_fake_client.py").write_text(u"class Client:\n  def get(self):\n    return 'real'\n")
+  monkeypatch.syspath_prepend(str(tmp_path))
+  patchers = Patchers()
+  originals = dict()
+
+  def install():
+    originals["get"] = patchers.patch("unmock_fake_client.Client.get", lambda self: "patched")
+
+  patchers.when_imported("unmock_fake_client", install)
+  patchers.start()
+  assert "unmock_fake_client" not in sys.modules
+  import unmock_fake_client
+  try:
+    assert unmock_fake_client.Client().get() == "patched"
+    assert originals["get"](unmock_fake_client.Client()) == "real"
+    assert unmock_fake_client.__spec__.loader is unmock_fake_client.__loader__
+    assert type(unmock_fake_client.__loader__).__name__ != "_NotifyingLoader"
+    patchers.clear()
+    assert unmock_fake_client.Client().get() == "real"
+    assert IMPORT_HOOK not in sys.meta_path
+  finally:
+    patchers.clear()
+    del sys.modules["unmock_fake_client"]
@@ -1,37 +1,67 @@
+import sys
 from .__version__ import __version__  # Conform to PEP-0396
 
-from . import pytest
-from .core import UnmockOptions, Request
+# The core (and with it http.client, six...) is only imported when first used, so that `import unmock` is cheap
+_LAZY = ("UnmockOptions", "Request", "Router", "Cassette", "Journal", "ReplyCache", "Fixtures", "OpenAPI",
+         "set_json_encoder", "metrics", "simulation")
+
+if sys.version_info >= (3, 7):
+  def __getattr__(name):
+    if name == "pytest":  # The pytest plugin, only imported when pytest loads it
+      import importlib
+      value = importlib.import_module(".pytest", __name__)
+      globals()[name] = value
+      return value
+    if name not in _LAZY:
+      raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    from . import core
+    value = getattr(core, name)
+    globals()[name] = value  # Only looked up once
+    return value
+
+  def __dir__():
+    return sorted(set(list(globals()) + list(_LAZY) + ["pytest"]))
+else:  # Module-level __getattr__ (PEP 562) is not supported
+  from . import pytest
+  from .core import UnmockOptions, Request, Router, Cassette, Journal, ReplyCache, Fixtures, OpenAPI
+  from .core import set_json_encoder
+  from .core import metrics, simulation
 
 
 def on(**kwargs):
   """Shorthand for initialize"""
-  initialize(**kwargs)
+  return initialize(**kwargs)
 
 
 def init(**kwargs):
   """Shorthand for initialize"""
-  initialize(**kwargs)
+  return initialize(**kwargs)
 
 
 def initialize(**kwargs):
   """
-  Initialize the unmock library for capturing API calls.
+  Initialize the unmock library for capturing API calls, process-wide.
+  Scopes opened with `unmock.patch()` take precedence in the threads and tasks that opened them.
   Pass keyword arguments to be used for internal options:
 
   :param whitelist: An optional list (or string) of URLs to whitelist, so that you may access them without unmock
       intercepting the calls. Defaults to ["127.0.0.1", "127.0.0.0", "localhost"]
   :type string, list of strings
+
+  See UnmockOptions for the full list of keyword arguments.
+  :return: The UnmockOptions in use, e.g. to query their `journal`
   """
   from . import core  # Imported internally to keep the namespace clear
-  unmock_options = UnmockOptions(**kwargs)
+  unmock_options = core.UnmockOptions(**kwargs)
 
   core.http.initialize(unmock_options)
+  return unmock_options
 
 
 def off():
   """
   Removes Unmock automatic API call capturing, restoring normal behaviour.
+  Scopes opened with `unmock.patch()` (possibly in other threads or tasks) are not affected.
   """
   from . import core
   core.http.reset()
@@ -39,22 +69,29 @@ def off():
 
 def is_mocking():
   """
-  Returns whether or not unmock is currently capturing calls
+  Returns whether or not unmock is currently capturing calls (in the current thread or task)
   """
   from . import core
-  return len(core.PATCHERS.targets) > 0
+  return core.context.current() is not None
 
 
 class patch:
   """
   Allows the usage of unmock with scope-specific context managers.
+  Scopes are local to the current thread or asyncio task (child tasks inherit them), may be nested, and do not
+  interfere with scopes opened concurrently elsewhere.
   """
 
   def __init__(self, **kwargs):
     self.kwargs = kwargs
+    self.tokens = list()
 
   def __enter__(self):
-    return initialize(**self.kwargs)
+    from . import core
+    unmock_options = core.UnmockOptions(**self.kwargs)
+    self.tokens.append(core.http.push(unmock_options))
+    return unmock_options
 
   def __exit__(self, exc_type, exc_val, exc_tb):
-    off()
+    from . import core
+    core.http.pop(self.tokens.pop())
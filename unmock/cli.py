@@ -0,0 +1,25 @@
+"""The `unmock` command line; `unmock serve SPEC` runs a standalone mock server (see `unmock.server`)"""
+import argparse
+import sys
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="unmock")
+  commands = parser.add_subparsers(dest="command")
+  serve = commands.add_parser("serve", help="Answer HTTP requests with the replies of some UnmockOptions")
+  serve.add_argument("spec", metavar="SPEC",
+                     help="The 'module:attribute' to serve: UnmockOptions, a Router, a dictionary of UnmockOptions "
+                          "keyword arguments, or a replyFn")
+  serve.add_argument("--host", default="127.0.0.1", help="The address to listen on (default: %(default)s)")
+  serve.add_argument("--port", type=int, default=8080, help="The port to listen on (default: %(default)s)")
+  serve.add_argument("--workers", type=int, default=1,
+                     help="The number of worker processes, sharing the port with SO_REUSEPORT (default: %(default)s)")
+  args = parser.parse_args(argv)
+  if args.command != "serve":
+    parser.print_help()
+    return 2
+  if sys.version_info < (3, 7):
+    parser.error("unmock serve requires Python 3.7+")
+  from .server import run
+  run(args.spec, args.host, args.port, args.workers)
+  return 0
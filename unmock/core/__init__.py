@@ -2,6 +2,17 @@ from .utils import *
 from .http import *
 from .options import *
 from .request import *
+from .router import *
+from .cassette import *
+from .journal import *
+from .cache import *
+from .fixtures import *
+from .serialization import *
+from .openapi import *
+from . import context
+from . import metrics
+from . import simulation
 
 
-__all__ = ["initialize", "reset", "Request"]
+__all__ = ["initialize", "reset", "Request", "Router", "Cassette", "Journal", "ReplyCache", "Fixtures",
+           "OpenAPI", "set_json_encoder"]
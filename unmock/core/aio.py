@@ -0,0 +1,460 @@
+"""
+Interception of asyncio-based HTTP clients (aiohttp and httpx).
+This module relies on `async` syntax and `asyncio.get_running_loop`, so it is only imported on Python 3.7+.
+The clients are imported by the application, not by unmock: each one is patched once it is imported.
+"""
+import asyncio
+import inspect
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from .utils import PATCHERS
+from .request import Request, BodyWriter
+from .response import get_template
+from . import context
+from . import http
+from . import metrics
+from .simulation import chunk_size, throttle
+
+aiohttp = None
+httpx = None
+
+__all__ = ["install", "reply_for", "run_sync"]
+
+CHUNK_SIZE = 65536
+
+ORIGINALS = dict()
+"""The original (unpatched) functions, by name"""
+
+
+AIOHTTP = "aiohttp"
+HTTPX = "httpx"
+
+
+async def reply_for(unmock_options, req, client):
+  """
+  Gets the reply for the Request (see `http.replying`), awaiting it if replyFn (or a route) is a coroutine function
+  """
+  steps = http.replying(unmock_options, req, client)
+  reply = next(steps)
+  if inspect.isawaitable(reply):
+    try:
+      resolved = await reply
+    except BaseException:
+      steps.close()
+      raise
+    reply = steps.send(resolved)
+  return reply
+
+
+def _default_port(scheme):
+  return 443 if scheme == "https" else 80
+
+
+def _read_body(template):
+  """The full body of a template; streamed sources are read into memory"""
+  if isinstance(template.body, bytes):
+    return template.body
+  fp, _ = template.open(framed=False)
+  try:
+    return fp.read()
+  finally:
+    fp.close()
+
+
+async def throttled(fp, bandwidth):
+  """Yields chunks of `fp` no faster than `bandwidth` bytes per second, sleeping without blocking the loop"""
+  loop = asyncio.get_running_loop()
+  start, sent = loop.time(), 0
+  try:
+    for chunk in iter(lambda: fp.read(chunk_size(bandwidth)), b""):
+      sent += len(chunk)
+      wait = start + sent / bandwidth - loop.time()
+      if wait > 0:
+        await asyncio.sleep(wait)
+      yield chunk
+  finally:
+    fp.close()
+
+
+async def _feed(content, chunks, decompressor=None):
+  async for chunk in chunks:
+    if decompressor is not None:
+      chunk = decompressor.decompress(chunk)
+    if chunk:
+      content.feed_data(chunk)
+  if decompressor is not None:
+    tail = decompressor.flush()
+    if tail:
+      content.feed_data(tail)
+  content.feed_eof()
+
+
+def _decompressor(headers, auto_decompress):
+  """
+  A zlib decompressor for the bodies aiohttp decompresses while parsing responses (when `auto_decompress` is set),
+  or None
+  """
+  if not auto_decompress or headers.get("Content-Encoding", "").lower() not in ("gzip", "deflate"):
+    return None
+  return zlib.decompressobj(32 + zlib.MAX_WBITS)  # Detects the gzip or zlib header
+
+
+class _Protocol:
+  """
+  Stands in for the protocol of a mocked connection, and for the connection of a response body fed by unmock; flow
+  control is not needed. Keeps the response parameters aiohttp sets (e.g. `auto_decompress`).
+  """
+  connected = True
+  upgraded = False
+  _reading_paused = False
+
+  def __init__(self):
+    self.params = dict()
+
+  def set_response_params(self, **params):
+    self.params = params
+
+  def pause_reading(self):
+    pass
+
+  def resume_reading(self, resume_parser=True):
+    pass
+
+
+class MockedConnection:
+  """
+  The connection aiohttp gets from its connector for a mocked request: it never connects. The session then sends the
+  request (see `unmock_send`) and reads its response as usual, so that redirects, cookies, `raise_for_status`,
+  timeouts and tracing all work as with real requests.
+  """
+
+  def __init__(self, unmock_options):
+    self.unmock_options = unmock_options
+    self.protocol = _Protocol()
+    self.transport = None
+    self.closed = False
+
+  def release(self):
+    self.closed = True
+
+  def close(self):
+    self.closed = True
+
+  def add_callback(self, callback):
+    pass
+
+
+class _NoWriter:
+  """Stands in for aiohttp's stream writer of an already-sent request"""
+  output_size = 0
+
+
+class _BodyCollector:
+  """Stands in for the stream writer aiohttp writes request bodies to; keeps the body in a BodyWriter"""
+
+  def __init__(self):
+    self.body = BodyWriter()
+
+  async def write(self, chunk):
+    if chunk:
+      self.body.write(bytes(chunk))
+
+
+async def _add_aiohttp_body(req, request):
+  body = request.body
+  if isinstance(body, (bytes, bytearray)):
+    req.add_body(bytes(body) or None)
+    return
+  collector = _BodyCollector()
+  await body.write(collector)
+  collector.body.finish(req)
+
+
+def _aiohttp_response(request, template, bandwidth=None, auto_decompress=True):
+  """Builds the response of a mocked request, with the session's response class"""
+  loop = asyncio.get_running_loop()
+  response_class = getattr(request, "response_class", None) or ClientResponse
+  available = inspect.signature(response_class.__init__).parameters
+  kwargs = dict(
+      writer=None, continue100=None, timer=getattr(request, "_timer", None) or TimerNoop(),
+      traces=getattr(request, "_traces", []), loop=loop, session=getattr(request, "_session", None),
+      stream_writer=_NoWriter(), request_info=request.request_info)
+  url = getattr(request, "original_url", request.url)
+  response = response_class(request.method, url, **dict((k, v) for k, v in kwargs.items() if k in available))
+  response.version = aiohttp.HttpVersion11
+  response.status = template.status
+  response.reason = template.reason
+  headers = CIMultiDict(template.headers)
+  response._headers = CIMultiDictProxy(headers)
+  response._raw_headers = tuple((k.encode("utf-8"), v.encode("utf-8")) for k, v in template.headers)
+  if hasattr(response, "_raw_cookie_headers"):
+    response._raw_cookie_headers = tuple(headers.getall("Set-Cookie", ())) or None
+  else:  # Older aiohttp versions parse cookies when the response starts
+    for header in headers.getall("Set-Cookie", ()):
+      response.cookies.load(header)
+  content = StreamReader(_Protocol(), limit=CHUNK_SIZE, loop=loop)
+  decompressor = _decompressor(headers, auto_decompress)
+  if bandwidth:
+    fp, _ = template.open(framed=False)
+    response._unmock_feeder = loop.create_task(_feed(content, throttled(fp, float(bandwidth)), decompressor))
+  else:
+    body = _read_body(template)
+    if decompressor is not None:
+      body = decompressor.decompress(body) + decompressor.flush()
+    if body:
+      content.feed_data(body)
+    content.feed_eof()
+  response.content = content
+  return response
+
+
+async def unmock_connect(self, req, *args, **kwargs):
+  """aiohttp.BaseConnector.connect; mocked requests get a MockedConnection instead of connecting"""
+  unmock_options = context.current()
+  url = req.url
+  if unmock_options is None or unmock_options._is_host_whitelisted(url.host, url.raw_path_qs, req.method):
+    if unmock_options is not None:
+      metrics.passed_through(url.host, AIOHTTP)
+    return await ORIGINALS["aiohttp_connect"](self, req, *args, **kwargs)
+  return MockedConnection(unmock_options)
+
+
+async def record_send(self, cassette, conn, *args, **kwargs):
+  """
+  Sends an aiohttp request through, to be recorded to the cassette once its response was read (see `unmock_start`).
+  The body is collected first, so that it is keyed by the digest of its content, and sent from the collected copy.
+  """
+  url = self.url
+  req = Request(url.host, url.port or _default_port(url.scheme), url.raw_path_qs, self.method.upper())
+  req.add_headers(self.headers)
+  try:
+    await _add_aiohttp_body(req, self)
+    self.update_body_from_data(req.data)
+    response = await ORIGINALS["aiohttp_send"](self, conn, *args, **kwargs)
+  except BaseException:
+    req.close()
+    raise
+  response._unmock_record = (req, cassette)
+  return response
+
+
+async def unmock_send(self, conn, *args, **kwargs):
+  """aiohttp.ClientRequest.send; answers requests sent on a MockedConnection"""
+  if not isinstance(conn, MockedConnection):
+    unmock_options = context.current()
+    cassette = unmock_options._recorder if unmock_options is not None else None
+    if cassette is not None:
+      return await record_send(self, cassette, conn, *args, **kwargs)
+    return await ORIGINALS["aiohttp_send"](self, conn, *args, **kwargs)
+  unmock_options = conn.unmock_options
+  url = self.url
+  req = Request(url.host, url.port or _default_port(url.scheme), url.raw_path_qs, self.method.upper())
+  req.add_headers(self.headers)
+  await _add_aiohttp_body(req, self)
+  tracker = getattr(self, "_upload_tracker", None)
+  if tracker is not None:  # Upload progress; the whole body was taken
+    tracker._attempt_finished(self._upload_gen)
+  reply = await reply_for(unmock_options, req, AIOHTTP)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    await asyncio.sleep(delay)
+  auto_decompress = conn.protocol.params.get("auto_decompress", True)
+  self.response = _aiohttp_response(self, get_template(reply), bandwidth, auto_decompress)
+  return metrics.responded(req, AIOHTTP, self.response)
+
+
+async def record_start(self, connection, *args, **kwargs):
+  """
+  Reads the response to a request passed through while recording (see `record_send`), and records it to the cassette.
+  Bodies aiohttp decompressed are recorded decompressed, without their Content-Encoding.
+  """
+  req, cassette = self._unmock_record
+  del self._unmock_record
+  try:
+    await ORIGINALS["aiohttp_start"](self, connection, *args, **kwargs)
+    data = await self.content.read()
+    items = list(self.headers.items())
+    parser = getattr(connection.protocol, "_parser", None)
+    if self.headers.get("Content-Encoding", "identity").lower() != "identity" and \
+        getattr(parser, "_auto_decompress", True):
+      items = [(k, v) for k, v in items if k.lower() not in ("content-encoding", "content-length")]
+    cassette.record(req, self.status, items, data)
+  finally:
+    req.close()
+  content = StreamReader(_Protocol(), limit=CHUNK_SIZE, loop=asyncio.get_running_loop())
+  if data:
+    content.feed_data(data)
+  content.feed_eof()
+  self.content = content
+  return self
+
+
+async def unmock_start(self, connection, *args, **kwargs):
+  """aiohttp.ClientResponse.start; the responses to mocked requests are complete already"""
+  if not isinstance(connection, MockedConnection):
+    if hasattr(self, "_unmock_record"):
+      return await record_start(self, connection, *args, **kwargs)
+    return await ORIGINALS["aiohttp_start"](self, connection, *args, **kwargs)
+  self._closed = False
+  self._connection = connection
+  if hasattr(self, "_response_eof"):  # Releases the connection once the body was read, as aiohttp does
+    self.content.on_eof(self._response_eof)
+  return self
+
+
+def _httpx_request(request):
+  url = request.url
+  req = Request(url.host, url.port or _default_port(url.scheme), url.raw_path.decode("ascii"), request.method)
+  req.add_headers(request.headers.multi_items())
+  return req
+
+
+def _httpx_response(template, is_async, bandwidth=None):
+  extensions = {"http_version": b"HTTP/1.1", "reason_phrase": template.reason.encode("ascii")}
+  if isinstance(template.body, bytes) and not bandwidth:
+    return httpx.Response(template.status, headers=template.headers, content=template.body,
+                          extensions=extensions)
+  fp, _ = template.open(framed=False)
+  headers = [(k, v) for k, v in template.headers if k.lower() != "transfer-encoding"]
+  if is_async and bandwidth:
+    content = throttled(fp, float(bandwidth))
+  elif is_async:
+    async def chunks():
+      for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+        yield chunk
+      fp.close()
+    content = chunks()
+  else:
+    if bandwidth:
+      fp = throttle(fp, bandwidth)
+    content = iter(lambda: fp.read(CHUNK_SIZE), b"")
+  return httpx.Response(template.status, headers=headers, content=content, extensions=extensions)
+
+
+def _recorded_httpx_response(cassette, req, response, data, is_async):
+  """Records a passed-through httpx response and its raw body, and serves it as a mocked response would be"""
+  items = response.headers.multi_items()
+  cassette.record(req, response.status_code, items, data)
+  return _httpx_response(get_template(http.recorded_reply(response.status_code, items, data)), is_async)
+
+
+async def record_handle_async_request(self, cassette, request):
+  """Passes an httpx request through, recording it and its raw response to the cassette"""
+  req = _httpx_request(request)
+  try:
+    req.add_body(await request.aread())
+    response = await ORIGINALS["httpx_async"](self, request)
+    try:
+      data = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+      await response.aclose()
+    return _recorded_httpx_response(cassette, req, response, data, True)
+  finally:
+    req.close()
+
+
+def record_handle_request(self, cassette, request):
+  """Passes an httpx request through, recording it and its raw response to the cassette"""
+  req = _httpx_request(request)
+  try:
+    req.add_body(request.read())
+    response = ORIGINALS["httpx"](self, request)
+    try:
+      data = b"".join(response.iter_raw())
+    finally:
+      response.close()
+    return _recorded_httpx_response(cassette, req, response, data, False)
+  finally:
+    req.close()
+
+
+async def unmock_handle_async_request(self, request):
+  """httpx.AsyncHTTPTransport.handle_async_request"""
+  unmock_options = context.current()
+  url = request.url
+  if unmock_options is None or \
+      unmock_options._is_host_whitelisted(url.host, url.raw_path.decode("ascii"), request.method):
+    if unmock_options is None:
+      return await ORIGINALS["httpx_async"](self, request)
+    metrics.passed_through(url.host, HTTPX)
+    cassette = unmock_options._recorder
+    if cassette is not None:
+      return await record_handle_async_request(self, cassette, request)
+    return await ORIGINALS["httpx_async"](self, request)
+  req = _httpx_request(request)
+  req.add_body(await request.aread())
+  reply = await reply_for(unmock_options, req, HTTPX)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    await asyncio.sleep(delay)
+  return metrics.responded(req, HTTPX, _httpx_response(get_template(reply), True, bandwidth))
+
+
+def unmock_handle_request(self, request):
+  """httpx.HTTPTransport.handle_request; the synchronous httpx client does not use http.client either"""
+  unmock_options = context.current()
+  url = request.url
+  if unmock_options is None or \
+      unmock_options._is_host_whitelisted(url.host, url.raw_path.decode("ascii"), request.method):
+    if unmock_options is None:
+      return ORIGINALS["httpx"](self, request)
+    metrics.passed_through(url.host, HTTPX)
+    cassette = unmock_options._recorder
+    if cassette is not None:
+      return record_handle_request(self, cassette, request)
+    return ORIGINALS["httpx"](self, request)
+  req = _httpx_request(request)
+  req.add_body(request.read())
+  reply = http.reply_to(unmock_options, req, HTTPX)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    time.sleep(delay)
+  return metrics.responded(req, HTTPX, _httpx_response(get_template(reply), False, bandwidth))
+
+
+def install_aiohttp():
+  global aiohttp, ClientResponse, TimerNoop, StreamReader, CIMultiDict, CIMultiDictProxy
+  import aiohttp
+  from aiohttp.client_reqrep import ClientResponse
+  from aiohttp.helpers import TimerNoop
+  from aiohttp.streams import StreamReader
+  from multidict import CIMultiDict, CIMultiDictProxy
+  ORIGINALS["aiohttp_connect"] = PATCHERS.patch("aiohttp.BaseConnector.connect", unmock_connect)
+  ORIGINALS["aiohttp_send"] = PATCHERS.patch("aiohttp.ClientRequest.send", unmock_send)
+  ORIGINALS["aiohttp_start"] = PATCHERS.patch("aiohttp.ClientResponse.start", unmock_start)
+
+
+def install_httpx():
+  global httpx
+  import httpx
+  ORIGINALS["httpx_async"] = PATCHERS.patch(
+      "httpx.AsyncHTTPTransport.handle_async_request", unmock_handle_async_request)
+  ORIGINALS["httpx"] = PATCHERS.patch("httpx.HTTPTransport.handle_request", unmock_handle_request)
+
+
+def install(client):
+  """
+  Registers the patches for an asyncio client, once it was imported.
+  :param client: "aiohttp" or "httpx"
+  :type client string
+  """
+  if client == AIOHTTP:
+    install_aiohttp()
+  elif client == HTTPX:
+    install_httpx()
+
+
+def run_sync(awaitable):
+  """Runs a coroutine (e.g. an async replyFn) to completion from synchronous code"""
+  try:
+    asyncio.get_running_loop()
+  except RuntimeError:  # No event loop running in this thread
+    loop = asyncio.new_event_loop()
+    try:
+      return loop.run_until_complete(awaitable)
+    finally:
+      loop.close()
+  # A synchronous client was called from a coroutine; we cannot block its loop, so use a fresh one in a thread
+  with ThreadPoolExecutor(max_workers=1) as executor:
+    return executor.submit(run_sync, awaitable).result()
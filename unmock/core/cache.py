@@ -0,0 +1,130 @@
+import collections
+import sys
+import threading
+import time
+from .cassette import request_prefix
+
+__all__ = ["ReplyCache"]
+
+timer = time.monotonic if hasattr(time, "monotonic") else time.time
+
+
+def _size(reply):
+  """An estimate of the memory held by a reply, in bytes"""
+  content = reply.get("content", "")
+  try:
+    size = len(memoryview(content)) if not hasattr(content, "encode") else len(content)
+  except TypeError:  # Paths, or JSON-like content
+    size = sys.getsizeof(content)
+  headers = reply.get("headers") or dict()
+  return size + sum(len(str(k)) + len(str(v)) for k, v in headers.items())
+
+
+def _cacheable(reply):
+  """Whether a reply can be served more than once; streams and file objects are consumed by their first response"""
+  if reply.get("cache", True) is False:
+    return False
+  content = reply.get("content", "")
+  return not (hasattr(content, "read") or hasattr(content, "__next__") or hasattr(content, "next"))
+
+
+class ReplyCache:
+  """
+  Memoizes replies, so that expensive reply functions (loading fixtures, rendering templates...) are called once per
+  distinct request.
+
+  Requests are keyed on their method, host, port, path, sorted query string, the values of the `headers` given, and a
+  hash of their body. Entries are evicted least recently used first when there are more than `maxsize` of them or
+  when they hold more than `max_bytes`, and expire after `ttl` seconds.
+  Replies with a "cache" key set to False (e.g. from stateful reply functions, or routes added with `cache=False`) and
+  replies streaming their content are never cached.
+
+  Example:
+      cache = unmock.ReplyCache(maxsize=512, ttl=60, headers=["Accept"])
+      with unmock.patch(replyFn=render_fixture, cache=cache):
+        ...
+      cache.stats()  # {"hits": ..., "misses": ..., ...}
+  """
+
+  def __init__(self, maxsize=1024, ttl=None, max_bytes=None, headers=()):
+    """
+    :param maxsize: The maximum number of cached replies
+    :type maxsize int
+    :param ttl: An optional lifetime of cached replies, in seconds
+    :type ttl float
+    :param max_bytes: An optional cap on the (estimated) size of the cached replies, in bytes
+    :type max_bytes int
+    :param headers: The names of the request headers that replies depend on, e.g. ["Accept", "Authorization"]
+    :type headers list
+    """
+    if maxsize < 1:
+      raise ValueError("The cache size should be positive")
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self.max_bytes = max_bytes
+    self.headers = tuple(headers)
+    self._lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    """Drops the cached replies and resets the statistics"""
+    with self._lock:
+      self._entries = collections.OrderedDict()  # key -> (reply, expiry time or None, size)
+      self._bytes = 0
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+      self.expirations = 0
+
+  def key(self, req):
+    """The cache key of a Request, or None if it cannot be cached"""
+    if req.body_size is None:
+      return None  # e.g. form fields given as a dictionary
+    return (request_prefix(req.method, req.host, req.endpoint), req.port,
+            tuple(tuple(req.headers.get_all(name, ())) for name in self.headers),
+            req.body_digest if req.body_size else None)
+
+  def get(self, key):
+    """:return: The cached reply for the key, or None"""
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None and entry[1] is not None and entry[1] <= timer():
+        self._bytes -= entry[2]
+        self.expirations += 1
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return None
+      self._entries[key] = entry  # Most recently used
+      self.hits += 1
+      return entry[0]
+
+  def put(self, key, reply):
+    """Caches the reply for the key, unless it opted out or cannot be served more than once"""
+    if key is None or not _cacheable(reply):
+      return
+    size = _size(reply)
+    if self.max_bytes is not None and size > self.max_bytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._bytes -= previous[2]
+      self._entries[key] = (reply, timer() + self.ttl if self.ttl is not None else None, size)
+      self._bytes += size
+      while len(self._entries) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+        _, (_, _, evicted) = self._entries.popitem(last=False)
+        self._bytes -= evicted
+        self.evictions += 1
+
+  def stats(self):
+    """
+    :return: A dictionary of the "hits", "misses", "evictions" (to stay within the size limits) and "expirations"
+        counts, and of the number of cached "entries" and their estimated size in "bytes"
+    """
+    with self._lock:
+      return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations,
+              "entries": len(self._entries), "bytes": self._bytes}
+
+  def __len__(self):
+    return len(self._entries)
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import weakref
+from six.moves.urllib.parse import parse_qsl
+from .utils import parse_url
+
+__all__ = ["Cassette"]
+
+MAGIC = b"UNMOCKC1"
+HEADER = struct.Struct(">8sQ")  # Magic, length of the index
+RECORD = "record"
+REPLAY = "replay"
+
+
+def body_digest(data):
+  """A hex digest of a request body, as used in cassette keys"""
+  if data is None:
+    data = b""
+  elif hasattr(data, "encode"):
+    data = data.encode("utf-8")
+  elif not isinstance(data, (bytes, bytearray, memoryview)):
+    data = b""  # Streamed bodies (files, iterators) are not part of the key
+  return hashlib.sha256(data).hexdigest()
+
+
+def request_prefix(method, host, endpoint):
+  """
+  The normalized form of a request, without its body: the method, host, path and sorted query string.
+  e.g. `GET api.example.com /search?a=1&b=2`
+  """
+  path = endpoint
+  if not path.startswith("/"):  # Absolute URLs, e.g. when going through a proxy
+    _, _, p, query, _ = parse_url(path)
+  else:
+    p, _, query = path.partition("?")
+  query = "&".join("{}={}".format(k, v) for k, v in sorted(parse_qsl(query, keep_blank_values=True)))
+  return "{} {} {}{}".format(method.upper(), (host or "").lower(), p or "/", "?" + query if query else "")
+
+
+class Cassette:
+  """
+  Records whitelisted (passed through) requests and their responses, and replays them later, e.g. offline.
+
+  The cassette file consists of a fixed header (magic and index length), an index of normalized request keys, and the
+  response bodies. When replaying, only the index is parsed: the file is memory-mapped, and bodies are served
+  straight from the mapping without loading them in memory. Closing the cassette unmaps the file, releasing the bodies
+  it served: those cannot be read anymore.
+
+  In "record" mode, call `save` (or use the cassette as a context manager) to write the file.
+  In "replay" mode, recorded requests are answered from the cassette even if their host is whitelisted; other
+  requests are handled as usual.
+
+  Example:
+      with unmock.Cassette("tests/cassettes/github.cassette", mode="record") as cassette:
+        with unmock.patch(cassette=cassette, whitelist=["api.github.com"]):
+          requests.get("https://api.github.com/")
+  """
+
+  def __init__(self, path, mode=REPLAY):
+    """
+    :param path: The path of the cassette file
+    :type path string
+    :param mode: "record" or "replay"
+    :type mode string
+    """
+    if mode not in (RECORD, REPLAY):
+      raise ValueError("Cassette mode should be either '{}' or '{}'".format(RECORD, REPLAY))
+    self.path = path
+    self.mode = mode
+    self.index = dict()  # request prefix -> {body digest: [status, headers, offset, length]}
+    self._lock = threading.Lock()
+    self._mmap = None
+    self._views = weakref.WeakSet()  # The bodies served from the mapping, released when it is closed
+    self._blobs = None
+    self._size = 0
+    if mode == REPLAY:
+      self._load()
+    else:
+      self._blobs = tempfile.TemporaryFile()
+
+  @property
+  def recording(self):
+    return self.mode == RECORD
+
+  def _load(self):
+    with open(self.path, "rb") as f:
+      magic, index_length = HEADER.unpack(f.read(HEADER.size))
+      if magic != MAGIC:
+        raise ValueError("{} is not an unmock cassette".format(self.path))
+      self.index = json.loads(f.read(index_length).decode("utf-8"))
+      self._base = HEADER.size + index_length
+      if os.fstat(f.fileno()).st_size > self._base:
+        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  def contains(self, method, host, endpoint):
+    """Whether a response to this request (regardless of its body) was recorded"""
+    return request_prefix(method, host, endpoint) in self.index
+
+  def __call__(self, req):
+    """
+    Reply provider; looks up the recorded response to the Request.
+    :return: The recorded reply, or None if this request was not recorded (or the cassette is recording)
+    """
+    if self.recording:
+      return None
+    entries = self.index.get(request_prefix(req.method, req.host, req.endpoint))
+    if entries is None:
+      return None
+    entry = entries.get(req.body_digest)
+    if entry is None:
+      return None
+    status, headers, offset, length = entry
+    start = self._base + offset
+    if not length:
+      content = b""
+    else:
+      with self._lock:
+        if self._mmap is None:
+          raise ValueError("The cassette {} is closed".format(self.path))
+        content = memoryview(self._mmap)[start:start + length]
+        if hasattr(content, "release"):  # Python 3.2+; older mappings do not track their views
+          self._views.add(content)
+    return {"status": status, "headers": dict(group_headers(headers)), "content": content}
+
+  def record(self, req, status, headers, body):
+    """
+    Records a response to the given Request.
+    :param headers: A list of (name, value) tuples
+    :type headers list
+    :param body: The raw (possibly still content-encoded) response body
+    :type body bytes
+    """
+    headers = [[k, v] for k, v in headers if k.lower() != "transfer-encoding"]  # The body is stored in full
+    with self._lock:
+      offset = self._size
+      self._blobs.write(body)
+      self._size += len(body)
+      self.index.setdefault(request_prefix(req.method, req.host, req.endpoint), dict())[
+          req.body_digest] = [status, headers, offset, len(body)]
+
+  def save(self):
+    """Writes the recorded requests to the cassette file"""
+    with self._lock:
+      index = json.dumps(self.index, separators=(",", ":"), sort_keys=True).encode("utf-8")
+      with open(self.path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(index)))
+        f.write(index)
+        self._blobs.seek(0)
+        for chunk in iter(lambda: self._blobs.read(1 << 20), b""):
+          f.write(chunk)
+        self._blobs.seek(0, os.SEEK_END)
+
+  def close(self):
+    """Unmaps the cassette file (see the class documentation) and discards the bodies recorded but not saved"""
+    with self._lock:
+      if self._mmap is not None:
+        for view in list(self._views):
+          view.release()
+        self._views.clear()
+        self._mmap.close()
+        self._mmap = None
+    if self._blobs is not None:
+      self._blobs.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    if self.recording and exc_type is None:
+      self.save()
+    self.close()
+
+
+def group_headers(headers):
+  """Groups a list of (name, value) pairs into (name, value or list of values) pairs"""
+  grouped = dict()
+  order = list()
+  for k, v in headers:
+    if k not in grouped:
+      order.append(k)
+      grouped[k] = v
+    elif isinstance(grouped[k], list):
+      grouped[k].append(v)
+    else:
+      grouped[k] = [grouped[k], v]
+  return [(k, grouped[k]) for k in order]
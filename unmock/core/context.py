@@ -0,0 +1,63 @@
+"""
+Resolution of the UnmockOptions that apply to the current call.
+
+Patches are installed globally, but the options they use are looked up on every call: first from a stack of scopes
+local to the current context (asyncio task or thread), then from the process-wide default set by `unmock.on()`.
+On Python 3.7+ the stack lives in a `contextvars.ContextVar`, otherwise in a thread-local.
+"""
+import threading
+try:
+  import contextvars
+except ImportError:  # Python < 3.7
+  contextvars = None
+
+__all__ = ["current", "push", "pop", "set_default"]
+
+_default = [None]  # The process-wide options, boxed so they can be swapped atomically
+
+if contextvars is not None:
+  _scopes = contextvars.ContextVar("unmock_scopes", default=())
+
+  def _get_scopes():
+    return _scopes.get()
+
+  def push(unmock_options):
+    """
+    Makes `unmock_options` the active options for the current context, until `pop` is called with the returned token.
+    Scopes are nestable; child asyncio tasks inherit the scopes active when they were created.
+    """
+    return _scopes.set(_scopes.get() + (unmock_options,))
+
+  def pop(token):
+    """Restores the scopes as they were before the `push` call that returned `token`"""
+    _scopes.reset(token)
+else:
+  _local = threading.local()
+
+  def _get_scopes():
+    return getattr(_local, "scopes", ())
+
+  def push(unmock_options):
+    previous = _get_scopes()
+    _local.scopes = previous + (unmock_options,)
+    return previous
+
+  def pop(token):
+    _local.scopes = token
+
+
+def current():
+  """
+  :return: The UnmockOptions applying to the current call, or None if unmock is not active here
+  """
+  scopes = _get_scopes()
+  return scopes[-1] if scopes else _default[0]
+
+
+def set_default(unmock_options):
+  """
+  Sets the process-wide options, used when no scope is active in the current context.
+  :return: The previous process-wide options
+  """
+  previous, _default[0] = _default[0], unmock_options
+  return previous
@@ -0,0 +1,131 @@
+import json
+import mimetypes
+import os
+import threading
+from .router import Router
+
+__all__ = ["Fixtures"]
+
+METHODS = frozenset(["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+META = ".meta"
+
+
+class Fixture:
+  """A fixture file, whose reply is only built on its first hit"""
+  __slots__ = ("path", "has_meta", "reply")
+  lock = threading.Lock()  # Shared, so that large trees do not need a lock per file
+
+  def __init__(self, path, has_meta):
+    self.path = path
+    self.has_meta = has_meta
+    self.reply = None
+
+  def load(self):
+    reply = dict()
+    if self.has_meta:
+      with open(self.path + META, "rb") as f:
+        reply.update(json.loads(f.read().decode("utf-8")))
+    headers = dict(reply.get("headers") or dict())
+    if not any(k.lower() == "content-type" for k in headers):
+      content_type, _ = mimetypes.guess_type(self.path)
+      if content_type is not None:
+        headers["Content-Type"] = content_type
+    reply["headers"] = headers
+    if hasattr(os, "fspath"):  # Memory-mapped when served (see `open_body`)
+      import pathlib
+      reply["content"] = pathlib.Path(self.path)
+    else:
+      with open(self.path, "rb") as f:
+        reply["content"] = f.read()
+    return reply
+
+  def __call__(self, req):
+    if self.reply is None:
+      with self.lock:
+        if self.reply is None:
+          self.reply = self.load()
+    return self.reply
+
+
+def _parse_name(name):
+  """
+  Splits a fixture file name into the last segment of the path it answers and its method (or None for any method),
+  e.g. "42.json" -> ("42", None), "users.POST.json" -> ("users", "POST")
+  """
+  stem, dot, _ = name.rpartition(".")
+  if not dot:
+    stem = name
+  base, dot, method = stem.rpartition(".")
+  if dot and method in METHODS:
+    return base, method
+  return stem, None
+
+
+class Fixtures:
+  """
+  A reply provider serving fixture files from a directory tree, laid out as `<directory>/<host>/<path>.<extension>`:
+
+      fixtures/
+        api.example.com/
+          index.json              -> GET https://api.example.com/
+          users.json              -> GET https://api.example.com/users (and /users.json)
+          users.POST.json         -> POST https://api.example.com/users
+          users/{id}.json         -> GET https://api.example.com/users/42 (`{id}` captures a path parameter)
+          users/{id}.json.meta    -> Optional sidecar, e.g. {"status": 404, "headers": {"X-Total": "0"}}
+
+  The tree is scanned once, when the Fixtures are created, into a Router; no file is read then. A fixture file is only
+  read on its first hit: its sidecar is parsed, and its body is memory-mapped as it is served. The Content-Type is
+  guessed from the file extension unless the sidecar gives one. Files without a method answer any method, after the
+  files with a matching method.
+
+  Example:
+      unmock.on(fixtures="tests/fixtures", replyFn=fallback)
+  """
+
+  def __init__(self, directory):
+    """
+    :param directory: The root of the fixtures tree, containing a directory per host
+    :type directory string
+    """
+    self.directory = directory
+    self.router = Router()
+    self.count = 0
+    self._scan()
+
+  def _scan(self):
+    routes = list()
+    root = os.path.abspath(self.directory)
+    for host in sorted(os.listdir(root)):
+      host_dir = os.path.join(root, host)
+      if not os.path.isdir(host_dir):
+        continue
+      for dirpath, dirnames, filenames in os.walk(host_dir):
+        dirnames.sort()
+        relative = os.path.relpath(dirpath, host_dir)
+        prefix = "" if relative == os.curdir else "/" + relative.replace(os.sep, "/")
+        names = set(filenames)
+        for name in sorted(filenames):
+          if name.endswith(META) or name.startswith("."):
+            continue
+          segment, method = _parse_name(name)
+          fixture = Fixture(os.path.join(dirpath, name), name + META in names)
+          paths = [prefix or "/"] if segment == "index" else [prefix + "/" + segment]
+          if method is None and segment != name and "{" not in segment:
+            paths.append(prefix + "/" + name)  # The exact file name answers as well
+          for path in paths:
+            routes.append((method is None, host, method, path, fixture))
+          self.count += 1
+    # Routes with a method are tried before the ones answering any method, whatever the order of the files
+    routes.sort(key=lambda route: route[0])
+    for _, host, method, path, fixture in routes:
+      self.router.add(method, host, path, fixture)
+
+  def __call__(self, req):
+    """
+    Reply provider; looks up the fixture for the Request.
+    :return: The reply serving the fixture, or None if there is no fixture for the request
+    """
+    return self.router(req)
+
+  def __len__(self):
+    return self.count
@@ -1,28 +1,43 @@
-import os
-from io import BytesIO, StringIO
-import json
 import socket
-import email.parser
+import threading
+import time
 from .utils import PATCHERS, is_python_version_at_least
 from six.moves import http_client
-from .options import UnmockOptions
-from .request import Request
-has_urllib3 = True
-try:
-  import urllib3
-except ImportError:
-  has_urllib3 = False
+from six.moves.urllib.parse import urlsplit
+from .request import Request, BodyWriter, is_streamed
+from . import context
+from . import metrics
+from . import sockets
+from .simulation import throttle
+from .response import get_template, MessageResponse
+from .cassette import group_headers
 
-__all__ = ["initialize", "reset"]
+# Imported from urllib3 once it is patched
+HTTPHeaderDict = Retry = HostChangedError = MaxRetryError = None
+HTTPResponse = None
 
-U_KEY = "unmock"
+__all__ = ["initialize", "reset", "push", "pop", "retain", "release"]
+
+U_KEY = "unmock"  # The Exchange of a connection with mocked requests
+U_RECORD_KEY = "unmock_record"  # A passed-through request to be recorded to a cassette
+
+HTTP_CLIENT = "http.client"
+URLLIB3 = "urllib3"
+REQUESTS = "requests"
+
+ORIGINALS = dict()
+"""The original (unpatched) functions, by name"""
+
+_lock = threading.Lock()
+_users = [0]  # The number of active scopes, plus one if process-wide options are set
 
 
 class Mocket(socket.socket):
-  def __init__(self, content):
-    self.content = content
-    self.io = BytesIO(content.encode(
-        'utf-8') if hasattr(content, 'encode') else content)
+  def __init__(self, fp):
+    """
+    :param fp: A readable binary file object serving the response body
+    """
+    self.io = fp
 
   def makefile(self, *args, **kw):
     return self.io
@@ -31,187 +46,638 @@ class Mocket(socket.socket):
     pass
 
 
-def initialize(unmock_options):
+def replying(unmock_options, req, client):
   """
-  Entry point to mock the standard http client. It is used by `urllib` as well as the
-  `http.client.HTTPConnection`, so mocking it should support their use aswell.
+  Gets the reply for the given request based on the replyFn in `unmock_options`, and records it (metrics, journal).
+  This generator is shared by synchronous and asynchronous clients: if replyFn (or a route) is a coroutine function,
+  it first yields the awaitable it returned, to be sent back once resolved. It then yields the reply.
+  :param client: The name of the intercepting client, for metrics
+  :type client string
+  """
+  start = metrics.captured(req, client)
+  try:
+    reply = unmock_options.replyTo(req)
+    if hasattr(reply, "__await__"):
+      reply = yield reply
+      unmock_options._remember(req, reply)
+  finally:
+    req.close()
+  metrics.replied(req, client, reply, start)
+  if unmock_options.journal is not None:
+    unmock_options.journal.record(req, client, reply)
+  yield reply
+
+
+def reply_to(unmock_options, req, client):
+  """
+  Gets the reply for the given request (see `replying`), from synchronous code
+  :param client: The name of the intercepting client, for metrics
+  :type client string
+  """
+  steps = replying(unmock_options, req, client)
+  reply = next(steps)
+  if hasattr(reply, "__await__"):
+    from . import aio
+    try:
+      resolved = aio.run_sync(reply)
+    except BaseException:
+      steps.close()
+      raise
+    reply = steps.send(resolved)
+  return reply
+
+
+def active_options():
+  """
+  The options in use for the patched http.client and urllib3 calls: None if unmock is not active in the calling
+  context, or if requests are intercepted at the socket level instead
+  """
+  unmock_options = context.current()
+  return None if unmock_options is None or unmock_options._socket_engine else unmock_options
 
-  We mock the "low level" API (instead of the `request` method, we mock the `putrequest`, `putheader`, `endheaders`
-  and `getresponse` methods; the `request` method calls these sequentially).
 
-  HTTPSConnection also uses the regular HTTPConnection methods under the hood -> hurray!
+def get_response(unmock_options, req):
+  """
+  Generates a response from the given request based on the replyFn in `unmock_options`
+  """
+  reply = reply_to(unmock_options, req, HTTP_CLIENT)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    time.sleep(delay)
+  res = get_response_from_template(get_template(reply), req, bandwidth)
+  return metrics.responded(req, HTTP_CLIENT, res)
 
-  :param unmock_options: An UnmockOptions file with user-behaviour customizations
-  :type unmock_options UnmockOptions
+
+def get_response_from_template(template, req, bandwidth=None):
+  """
+  Creates an HTTPResponse serving the given ResponseTemplate
+  :param bandwidth: An optional bandwidth (in bytes per second) to throttle the reading of the body to
+  :type bandwidth float
+  """
+  fp, length = template.open()
+  if bandwidth:
+    fp = throttle(fp, bandwidth)
+  m = Mocket(fp)  # Mocket for HTTPResponse generation
+  # method, url were added later on
+  res = http_client.HTTPResponse(
+      m, method=req.method, url=req.endpoint) if is_python_version_at_least(
+      "3.0") else http_client.HTTPResponse(m)
+
+  # Parameters to keep HTTPResponse at bay while reading the response
+  res.chunked = template.chunked
+  res.chunk_left = None
+  res.length = length
+  res.version = 11
+  res.status = res.code = template.status
+  res.reason = template.reason
+  res.isclosed = lambda: m.io.closed
+  res.will_close = any(k.lower() == "connection" and "close" in v.lower() for k, v in template.headers)
+  res.msg = res.headers = template.message()
+
+  return res
+
+
+def recorded_reply(status, headers, body):
+  """The reply dictionary serving a response recorded to a cassette"""
+  return {"status": status, "headers": dict(group_headers(headers)), "content": body}
+
+
+def urllib3_response(pool, template, method, url, kw, bandwidth=None):
+  """Builds a urllib3 response from a ResponseTemplate, honouring the `urlopen` keyword arguments"""
+  fp, _ = template.open(framed=False)  # urllib3 reads the body as-is, without decoding chunks
+  if bandwidth:
+    fp = throttle(fp, bandwidth)
+
+  # Build the urllib3 response directly; there is no need for an intermediate httplib response
+  return pool.ResponseCls(
+      body=fp,
+      headers=HTTPHeaderDict(template.headers),
+      status=template.status,
+      version=11,
+      reason=template.reason,
+      preload_content=kw.get("preload_content", True),
+      decode_content=kw.get("decode_content", True),
+      original_response=MessageResponse(template.message()) if template.has_cookies else None,
+      pool=pool,
+      retries=kw.get("retries"),
+      request_method=method,
+      request_url=url)
+
+
+def recorded_body(req, body):
+  """
+  Sets the body of a request passed through while recording, and returns the body to send instead of `body`: streamed
+  bodies are spooled first (see `Request.add_body`), so that they are keyed by the digest of their content, as when
+  replayed, and sent from the spool.
+  """
+  req.add_body(body)
+  return req.data
+
+
+def record_urlopen(self, cassette, method, url, body, headers, kw):
+  """Passes a urllib3 request through, recording it and its raw response to the cassette"""
+  req = Request(self.host, self.port, url, method)
+  req.add_headers(headers or dict())
+  try:
+    body = recorded_body(req, body)
+    res = ORIGINALS["urlopen"](self, method, url, body, headers, **dict(kw, preload_content=False))
+    data = res.read(decode_content=False)
+    res.release_conn()
+    items = list(res.headers.iteritems()) if hasattr(res.headers, "iteritems") else list(res.headers.items())
+    cassette.record(req, res.status, items, data)
+  finally:
+    req.close()
+  return urllib3_response(self, get_template(recorded_reply(res.status, items, data)), method, url, kw)
+
+
+def unmock_urlopen(self, method, url, body=None, headers=None, retries=None, redirect=True, assert_same_host=True,
+                   **kw):
+  """
+  urllib3.urlopen (used in requests library as well). Requires a different patch as it creates its own sockets
+  internally.
+  Mocked requests never check a connection out of the pool: its host and port are the pool's own, and the pool is left
+  as a real request on a reused connection would leave it.
+  """
+  unmock_options = active_options()
+  if unmock_options is None:
+    return ORIGINALS["urlopen"](self, method, url, body, headers, retries, redirect, assert_same_host, **kw)
+  host = self.host
+  port = self.port
+  if unmock_options._is_host_whitelisted(host, url, method):
+    metrics.passed_through(host, URLLIB3)
+    kw = dict(kw, retries=retries, redirect=redirect, assert_same_host=assert_same_host)
+    cassette = unmock_options._recorder
+    if cassette is not None:
+      return record_urlopen(self, cassette, method, url, body, headers, kw)
+    return ORIGINALS["urlopen"](self, method, url, body, headers, **kw)
+
+  # As in urlopen, before the request is made
+  if headers is None:
+    headers = self.headers
+  if not isinstance(retries, Retry):
+    retries = Retry.from_int(retries, redirect=redirect, default=self.retries)
+  if assert_same_host and not self.is_same_host(url):
+    raise HostChangedError(self, url, retries)
+  self.num_requests += 1
+
+  req = Request(host, port, url, method)
+  req.add_headers(headers)
+  req.add_body(body)
+  reply = reply_to(unmock_options, req, URLLIB3)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    time.sleep(delay)
+  res = urllib3_response(self, get_template(reply), method, url, dict(kw, retries=retries), bandwidth)
+  res = metrics.responded(req, URLLIB3, res)
+  return retry_urlopen(self, res, method, url, body, headers, retries, redirect, assert_same_host, kw)
+
+
+def unmock_adapter_send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+  """
+  requests.adapters.HTTPAdapter.send, short-circuiting urllib3 when the options in use set `requests_adapter`:
+  mocked requests never go through the pool manager, connection pools or retries, and their `requests.Response` is
+  built by the adapter right away. Whitelisted requests (and every request otherwise) are sent as usual.
   """
+  unmock_options = active_options()
+  if unmock_options is None or not unmock_options.requests_adapter:
+    return ORIGINALS["adapter_send"](self, request, stream, timeout, verify, cert, proxies)
+  parts = urlsplit(request.url)
+  host = parts.hostname
+  port = parts.port or (443 if parts.scheme == "https" else 80)
+  url = request.path_url
+  if unmock_options._is_host_whitelisted(host, url, request.method):
+    return ORIGINALS["adapter_send"](self, request, stream, timeout, verify, cert, proxies)  # Counted by urllib3
+
+  req = Request(host, port, url, request.method)
+  req.add_headers(request.headers)
+  req.add_body(request.body)
+  reply = reply_to(unmock_options, req, REQUESTS)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    time.sleep(delay)
+  template = get_template(reply)
+  fp, _ = template.open(framed=False)
+  if bandwidth:
+    fp = throttle(fp, bandwidth)
+  # requests reads (and decodes) the body through the raw urllib3 response, as it would a real one's
+  raw = HTTPResponse(
+      body=fp,
+      headers=HTTPHeaderDict(template.headers),
+      status=template.status,
+      version=11,
+      reason=template.reason,
+      preload_content=False,
+      decode_content=False,
+      original_response=MessageResponse(template.message()) if template.has_cookies else None,
+      request_method=request.method,
+      request_url=url)
+  return metrics.responded(req, REQUESTS, self.build_response(request, raw))
+
+
+def retry_urlopen(pool, res, method, url, body, headers, retries, redirect, assert_same_host, kw):
+  """As in urlopen, once the response is received: follows redirects within the pool, and retries on statuses"""
+  location = redirect and res.get_redirect_location()
+  if location:
+    if res.status == 303:
+      method = "GET"
+      body = None
+      if hasattr(HTTPHeaderDict, "_prepare_for_method_change"):  # urllib3 1.26.18+
+        headers = HTTPHeaderDict(headers)._prepare_for_method_change()
+    try:
+      retries = retries.increment(method, url, response=res, _pool=pool)
+    except MaxRetryError:
+      if retries.raise_on_redirect:
+        res.drain_conn()
+        raise
+      return res
+    res.drain_conn()
+    retries.sleep_for_retry(res)
+    return pool.urlopen(method, location, body, headers, retries=retries, redirect=redirect,
+                        assert_same_host=assert_same_host, **kw)
+
+  if retries.is_retry(method, res.status, bool(res.headers.get("Retry-After"))):
+    try:
+      retries = retries.increment(method, url, response=res, _pool=pool)
+    except MaxRetryError:
+      if retries.raise_on_status:
+        res.drain_conn()
+        raise
+      return res
+    res.drain_conn()
+    retries.sleep(res)
+    return pool.urlopen(method, url, body, headers, retries=retries, redirect=redirect,
+                        assert_same_host=assert_same_host, **kw)
+  return res
+
+
+class Exchange(object):
+  """
+  The state of a mocked HTTPConnection. It follows the state machine http.client keeps (in private attributes) for real
+  requests: putrequest starts a request, putheader and endheaders record it, and getresponse answers it, after which
+  the connection is idle again and can be reused for the next request.
+  """
+  __slots__ = ("state", "options", "req", "body", "response")
+
+  def __init__(self):
+    self.state = http_client._CS_IDLE
+    self.options = None
+    self.req = None  # The request being made, if it is mocked
+    self.body = None  # The request body, or a BodyWriter if it was sent in parts or streamed
+    self.response = None  # The last response, until it is closed
+
+  def reset(self):
+    """Makes the connection idle again, as closing it (or a failed request) does"""
+    self.state = http_client._CS_IDLE
+    self.options = None
+    self.req = None
+    if isinstance(self.body, BodyWriter):  # Closes the spooled body of a request that was not answered
+      self.body.close()
+    self.body = None
+    if self.response is not None:
+      self.response.close()
+      self.response = None
+
+
+def _exchange(conn):
+  """The Exchange of a connection whose current request is mocked, or None"""
+  exchange = conn.__dict__.get(U_KEY)
+  return exchange if exchange is not None and exchange.req is not None else None
+
+
+def _add_body_part(exchange, data):
+  """Adds a part of the body of a mocked request, as given to endheaders or send"""
+  if exchange.body is None and not is_streamed(data):
+    exchange.body = data  # The whole body at once, as given
+    return
+  if not isinstance(exchange.body, BodyWriter):  # Streamed bodies are consumed as they are sent
+    writer = BodyWriter()
+    if exchange.body is not None:
+      writer.write(exchange.body)
+    exchange.body = writer
+  exchange.body.write(data)
+
+
+def unmock_putrequest(conn, method, url, skip_host=False,
+                      skip_accept_encoding=False):
+  """putrequest mock; called initially after the HTTPConnection object has been created. Contains information
+  about the endpoint and method.
+
+  :param conn
+  :type conn HTTPConnection
+  :param method
+  :type method string
+  :param url - the endpoint on conn
+  :type url string
+  :param skip_host
+  :type skip_host bool
+  :param skip_accept_encoding
+  :type skip_accept_encoding bool
+  """
+  # Extract host and port, create the request as normal
+  host = conn.host
+  port = conn.port
+  unmock_options = active_options()
+  exchange = conn.__dict__.get(U_KEY)
+  if unmock_options is not None and not unmock_options._is_host_whitelisted(host, url, method):
+    if exchange is None:
+      exchange = conn.__dict__[U_KEY] = Exchange()
+    if exchange.response is not None and exchange.response.isclosed():
+      exchange.response = None
+    if exchange.state != http_client._CS_IDLE:
+      raise http_client.CannotSendRequest(exchange.state)
+    exchange.state = http_client._CS_REQ_STARTED
+    exchange.options = unmock_options
+    exchange.req = Request(host, port, url, method)
+    exchange.body = None
+  else:
+    if exchange is not None:  # A previous request on this connection was mocked
+      exchange.req = None
+    if unmock_options is not None:
+      metrics.passed_through(host, HTTP_CLIENT)
+    if unmock_options is not None and unmock_options._recorder is not None:
+      setattr(conn, U_RECORD_KEY, (Request(host, port, url, method), unmock_options._recorder))
+    ORIGINALS["putrequest"](conn, method, url, skip_host, skip_accept_encoding)
+
+
+def unmock_putheader(conn, header, *values):
+  """putheader mock; called sequentially after the putrequest. Headers of mocked requests are recorded as given,
+  without being encoded for the wire.
+
+  :param conn
+  :type conn HTTPConnection
+  :param header
+  :type header string
+  :param values
+  :type values list, bytes
+  """
+  exchange = _exchange(conn)
+  if exchange is not None:
+    if exchange.state != http_client._CS_REQ_STARTED:
+      raise http_client.CannotSendHeader()
+    exchange.req.add_header(header, *values)
+    return
+  ORIGINALS["putheader"](conn, header, *values)
+  if hasattr(conn, U_RECORD_KEY):
+    getattr(conn, U_RECORD_KEY)[0].add_header(header, *values)
+
+
+# The encode_chunked parameters was added in Python 3.6
+if is_python_version_at_least("3.6"):
+  def unmock_end_headers(conn, message_body=None, encode_chunked=False):
+    """endheaders mock; signals the end of the HTTP request.
+    NOTE: We drop the bare asterisk for Python2 compatibility.
+    See https://stackoverflow.com/questions/2965271/forced-naming-of-parameters-in-python/14298976#14298976
 
-  def get_response(req):
+    :param conn
+    :type conn HTTPConnection
+    :param message_body
+    :type message_body string
+    :param encode_chunked
+    :type encode_chunked bool
     """
-    Generates a response from the given request based on the replyFn in `unmock_options`
+    exchange = _exchange(conn)
+    if exchange is not None:  # The whitelist was already consulted in putrequest
+      internal_unmock_end_headers(exchange, message_body)
+    else:
+      # endheaders causes the socket to connect and sends data, so only call original
+      # function if the connection is whitelisted
+      if message_body and hasattr(conn, U_RECORD_KEY):
+        message_body = recorded_body(getattr(conn, U_RECORD_KEY)[0], message_body)
+      ORIGINALS["endheaders"](conn, message_body, encode_chunked=encode_chunked)
+else:
+  def unmock_end_headers(conn, message_body=None):
+    """endheaders mock; signals the end of the HTTP request.
+    At this point we should have all the data to make the request to the unmock service.
+
+    :param conn
+    :type conn HTTPConnection
+    :param message_body
+    :type message_body string
     """
-    reply = unmock_options.replyTo(req)  # Get the reply for this Request
-    content = reply.get("content", "")
-    m = Mocket(content)  # Mocket for HTTPResponse generation
-    # method, url were added later on
-    res = http_client.HTTPResponse(
-        m, method=req.method, url=req.endpoint) if is_python_version_at_least(
-        "3.0") else http_client.HTTPResponse(m)
-
-    # Parameters to keep HTTPResponse at bay while reading the response
-    res.chunked = False
-    res.length = len(content)
-    res.version = 11
-    res.status = res.code = reply.get("status", 200)
-    res.reason = http_client.responses[res.status]
-    res.isclosed = lambda: m.io.closed
-
-    # Generate the bytes buffer for the msg attribute (mostly copied from httplib)
-    # This is basically an encoded headers dictionary
-    _buffer = []
-    for k, v in reply.get("headers", dict()).items():
-      val = []
-      v = v if isinstance(v, list) else [v]
-      for vv in v:
-        if hasattr(vv, 'encode'):
-          val.append(vv.encode('latin-1'))
-        elif isinstance(vv, int):
-          val.append(str(vv).encode('ascii'))
-      _buffer.append(k.encode('ascii') + b':' + b'\r\n\t'.join(val))
-    hstring = b''.join(_buffer).decode('iso-8859-1')
-    if is_python_version_at_least("3.0"):
-      res.msg = res.headers = email.parser.Parser(
-          _class=http_client.HTTPMessage).parsestr(hstring)
+    exchange = _exchange(conn)
+    if exchange is not None:
+      internal_unmock_end_headers(exchange, message_body)
     else:
-      res.msg = http_client.HTTPMessage(StringIO(hstring))
+      if message_body and hasattr(conn, U_RECORD_KEY):
+        message_body = recorded_body(getattr(conn, U_RECORD_KEY)[0], message_body)
+      ORIGINALS["endheaders"](conn, message_body)
 
-    return res
 
-  def unmock_urlopen(self, method, url, body=None, headers=None, **kw):
-    """
-    urllib3.urlopen (used in requests library as well). Requires a different patch as it creates its own sockets
-    internally.
-    """
-    conn = self._get_conn()
-    host = conn.host
-    port = conn.port
-    if unmock_options._is_host_whitelisted(host):
-      return original_urlopen(method, url, body, headers, **kw)
-
-    req = Request(host, port, url, method)
-    req.add_headers(headers or dict())
-    req.add_body(body)
-    res = get_response(req)
-
-    # In the process of creating the urllib response from HTTPResponse, the data is flushed (?)
-    # TODO this could be an internal error - potentially a hack :shrug:
-    contentValue = res.fp.getvalue()
-    res = self.ResponseCls.from_httplib(res)  # So we reassign it here
-    res._fp = BytesIO(contentValue)
+def internal_unmock_end_headers(exchange, message_body=None):
+  if exchange.state != http_client._CS_REQ_STARTED:
+    raise http_client.CannotSendHeader()
+  exchange.state = http_client._CS_REQ_SENT
+  if message_body:
+    _add_body_part(exchange, message_body)
 
-    return res
 
-  def unmock_putrequest(conn, method, url, skip_host=False,
-                        skip_accept_encoding=False):
-    """putrequest mock; called initially after the HTTPConnection object has been created. Contains information
-    about the endpoint and method.
+def unmock_send(conn, data):
+  """send mock; the body of a mocked request may be sent after its headers, e.g. by `request` or by urllib3"""
+  exchange = _exchange(conn)
+  if exchange is None:
+    return ORIGINALS["send"](conn, data)
+  if data:
+    _add_body_part(exchange, data)
 
-    :param conn
-    :type conn HTTPConnection
-    :param method
-    :type method string
-    :param url - the endpoint on conn
-    :type url string
-    :param skip_host
-    :type skip_host bool
-    :param skip_accept_encoding
-    :type skip_accept_encoding bool
-    """
-    # Extract host and port, create the request as normal
-    host = conn.host
-    port = conn.port
-    if not unmock_options._is_host_whitelisted(host):
-      # Attach the unmock object to this connection for information aggregation
-      req = Request(host, port, url, method)
-      setattr(conn, U_KEY, req)
-    else:
-      original_putrequest(conn, method, url, skip_host, skip_accept_encoding)
 
-  def unmock_putheader(conn, header, *values):
-    """putheader mock; called sequentially after the putrequest.
+def unmock_getresponse(conn, *args, **kw):
+  """
+  getresponse mock; answers mocked requests, only once their whole body was sent. Also records the responses to
+  passed-through requests when recording to a cassette.
+  """
+  exchange = _exchange(conn)
+  if exchange is not None:
+    if exchange.response is not None and not exchange.response.isclosed():
+      raise http_client.ResponseNotReady(exchange.state)
+    if exchange.state != http_client._CS_REQ_SENT:
+      raise http_client.ResponseNotReady(exchange.state)
+    req = exchange.req
+    if isinstance(exchange.body, BodyWriter):
+      exchange.body.finish(req)
+    elif exchange.body is not None:
+      req.add_body(exchange.body)
+    try:
+      res = get_response(exchange.options, req)
+    finally:  # The connection can be reused even if the reply failed
+      exchange.reset()
+    if not res.will_close:
+      exchange.response = res
+    return res
 
-    :param conn
-    :type conn HTTPConnection
-    :param header
-    :type header string
-    :param values
-    :type values list, bytes
-    """
-    original_putheader(conn, header, *values)  # Add header to the connection
-    if hasattr(conn, U_KEY):
-      req = getattr(conn, U_KEY)
-      req.add_header(header, *values)  # And aggregate if needed
-
-  # The encode_chunked parameters was added in Python 3.6
-  if is_python_version_at_least("3.6"):
-    def unmock_end_headers(conn, message_body=None, encode_chunked=False):
-      """endheaders mock; signals the end of the HTTP request.
-      NOTE: We drop the bare asterisk for Python2 compatibility.
-      See https://stackoverflow.com/questions/2965271/forced-naming-of-parameters-in-python/14298976#14298976
-
-      :param conn
-      :type conn HTTPConnection
-      :param message_body
-      :type message_body string
-      :param encode_chunked
-      :type encode_chunked bool
-      """
-      if unmock_options._is_host_whitelisted(conn.host):
-        # endheaders causes the socket to connect and sends data, so only call original
-        # function if the connection is whitelisted
-        original_endheaders(conn, message_body, encode_chunked=encode_chunked)
-      elif hasattr(conn, U_KEY):
-        internal_unmock_end_headers(conn, message_body)
-  else:
-    def unmock_end_headers(conn, message_body=None):
-      """endheaders mock; signals the end of the HTTP request.
-      At this point we should have all the data to make the request to the unmock service.
-
-      :param conn
-      :type conn HTTPConnection
-      :param message_body
-      :type message_body string
-      """
-      if unmock_options._is_host_whitelisted(conn.host):
-        original_endheaders(conn, message_body)
-      elif hasattr(conn, U_KEY):
-        internal_unmock_end_headers(conn, message_body)
-
-  def internal_unmock_end_headers(conn, message_body=None):
-    req = getattr(conn, U_KEY)
-    if message_body:  # Add body if needed
-      req.add_body(message_body)
-
-    res = get_response(req)
-
-    conn.getresponse = lambda: res
-    conn.__response = res
-    conn.__state = http_client._CS_REQ_SENT
+  res = ORIGINALS["getresponse"](conn, *args, **kw)
+  if not hasattr(conn, U_RECORD_KEY):
+    return res
+  req, cassette = getattr(conn, U_RECORD_KEY)
+  delattr(conn, U_RECORD_KEY)
+  try:
+    data = res.read()
+    items = list(res.msg.items()) if is_python_version_at_least("3.0") else [
+        tuple(h.rstrip("\r\n").split(": ", 1)) for h in res.msg.headers]
+    cassette.record(req, res.status, items, data)
+  finally:
+    req.close()
+  return get_response_from_template(get_template(recorded_reply(res.status, items, data)), req)
+
+
+def unmock_close(conn):
+  """close mock; also resets the Exchange of connections with mocked requests"""
+  exchange = conn.__dict__.get(U_KEY)
+  if exchange is not None:
+    exchange.reset()
+  ORIGINALS["close"](conn)
+
+
+def install():
+  """
+  Patches the standard http client. It is used by `urllib` as well as the
+  `http.client.HTTPConnection`, so mocking it should support their use aswell.
+
+  We mock the "low level" API (instead of the `request` method, we mock the `putrequest`, `putheader`, `endheaders`,
+  `send` and `getresponse` methods; the `request` method calls these sequentially), and `close`.
+
+  HTTPSConnection also uses the regular HTTPConnection methods under the hood -> hurray!
 
+  Patches are installed once, and look up the active UnmockOptions on every call (see `context`), so they behave as
+  the original functions when unmock is not active in the calling context.
+  """
   # Create the patchers and mock away!
-  original_putrequest = PATCHERS.patch(
+  ORIGINALS["putrequest"] = PATCHERS.patch(
       "six.moves.http_client.HTTPConnection.putrequest", unmock_putrequest)
-  original_putheader = PATCHERS.patch(
+  ORIGINALS["putheader"] = PATCHERS.patch(
       "six.moves.http_client.HTTPConnection.putheader", unmock_putheader)
-  original_endheaders = PATCHERS.patch(
+  ORIGINALS["endheaders"] = PATCHERS.patch(
       "six.moves.http_client.HTTPConnection.endheaders", unmock_end_headers)
-
-  # We probably do not need to patch the requests module, but in case we do, it's here -> requests.packages.urllib3.connectionpool.HTTPConnectionPool.urlopen
-  if has_urllib3:
-    original_urlopen = PATCHERS.patch(
-        "urllib3.connectionpool.HTTPConnectionPool.urlopen", unmock_urlopen)
+  ORIGINALS["send"] = PATCHERS.patch(
+      "six.moves.http_client.HTTPConnection.send", unmock_send)
+  ORIGINALS["getresponse"] = PATCHERS.patch(
+      "six.moves.http_client.HTTPConnection.getresponse", unmock_getresponse)
+  ORIGINALS["close"] = PATCHERS.patch(
+      "six.moves.http_client.HTTPConnection.close", unmock_close)
+
+  sockets.install(reply_to)  # Inert unless the options in use select the socket engine
+
+  # Third-party clients are patched when (and if) the application imports them, so they are never imported here
+  PATCHERS.when_imported("urllib3", install_urllib3)
+  PATCHERS.when_imported("requests", install_requests)
+  if is_python_version_at_least("3.7"):  # The aio module relies on Python 3.7+ syntax and asyncio
+    PATCHERS.when_imported("aiohttp", lambda: install_aio("aiohttp"))
+    PATCHERS.when_imported("httpx", lambda: install_aio("httpx"))
 
   PATCHERS.start()
 
 
-def reset():
+def install_urllib3():
+  """
+  Patches urllib3.urlopen, which requests uses as well. Requires a different patch as it creates its own sockets
+  internally. We probably do not need to patch the requests module, but in case we do, it's here ->
+  requests.packages.urllib3.connectionpool.HTTPConnectionPool.urlopen
+  """
+  global HTTPHeaderDict, Retry, HostChangedError, MaxRetryError
+  from urllib3._collections import HTTPHeaderDict
+  from urllib3.util.retry import Retry
+  from urllib3.exceptions import HostChangedError, MaxRetryError
+  ORIGINALS["urlopen"] = PATCHERS.patch(
+      "urllib3.connectionpool.HTTPConnectionPool.urlopen", unmock_urlopen)
+
+
+def install_requests():
+  """
+  Patches requests' HTTPAdapter.send, which answers mocked requests without urllib3 when the options in use set
+  `requests_adapter`. requests imports urllib3, so its requests are intercepted by `unmock_urlopen` otherwise.
+  """
+  global HTTPResponse, HTTPHeaderDict
+  from urllib3.response import HTTPResponse
+  from urllib3._collections import HTTPHeaderDict
+  ORIGINALS["adapter_send"] = PATCHERS.patch("requests.adapters.HTTPAdapter.send", unmock_adapter_send)
+
+
+def install_aio(client):
+  """Patches an asyncio client ("aiohttp" or "httpx")"""
+  from . import aio
+  aio.install(client)
+
+
+def uninstall():
+  """Removes all patches"""
   PATCHERS.clear()
+  ORIGINALS.clear()
+
+
+def _acquire():
+  """Registers a user of the patches, installing them for the first one. Must be called with `_lock` held."""
+  _users[0] += 1
+  if _users[0] == 1:
+    install()
+
+
+def _release():
+  """Unregisters a user of the patches, removing them once nobody uses them. Must be called with `_lock` held."""
+  _users[0] -= 1
+  if _users[0] == 0:
+    uninstall()
+
+
+def initialize(unmock_options):
+  """
+  Sets the process-wide UnmockOptions, used in every thread and task that did not open its own scope with `push`.
+
+  :param unmock_options: An UnmockOptions file with user-behaviour customizations
+  :type unmock_options UnmockOptions
+  """
+  with _lock:
+    if context.set_default(unmock_options) is None:
+      _acquire()
+
+
+def reset():
+  """Unsets the process-wide UnmockOptions. Patches are removed once no scope is active anywhere either."""
+  with _lock:
+    if context.set_default(None) is not None:
+      _release()
+
+
+def swap_default(unmock_options):
+  """
+  Replaces the process-wide UnmockOptions (None unsets them), installing or removing the patches as needed.
+  :return: The previous process-wide UnmockOptions, to restore them later
+  """
+  with _lock:
+    previous = context.set_default(unmock_options)
+    if previous is None and unmock_options is not None:
+      _acquire()
+    elif previous is not None and unmock_options is None:
+      _release()
+  return previous
+
+
+def push(unmock_options):
+  """
+  Opens a scope in which `unmock_options` are used, local to the current thread or asyncio task.
+  Scopes are cheap and nestable; patches are only installed when the first user appears.
+  :return: A token for `pop`
+  """
+  with _lock:
+    _acquire()
+  return context.push(unmock_options)
+
+
+def pop(token):
+  """Closes the scope opened by the `push` call which returned `token`"""
+  context.pop(token)
+  with _lock:
+    _release()
+
+
+def retain():
+  """
+  Keeps the patches installed until `release` is called, even while no options are active.
+  Used to install the patches once for a whole test session, making every scope opened within it cheap.
+  """
+  with _lock:
+    _acquire()
+
+
+def release():
+  """Undoes a `retain` call"""
+  with _lock:
+    _release()
@@ -0,0 +1,171 @@
+import collections
+import threading
+from .router import _request_path
+
+__all__ = ["Journal"]
+
+
+class Entry:
+  """A request intercepted by unmock, and the reply it got"""
+  __slots__ = ("seq", "client", "method", "host", "path", "endpoint", "status", "request", "reply", "_digest")
+
+  def __init__(self, seq, client, req, reply, keep_bodies, hash_bodies):
+    self.seq = seq
+    self.client = client
+    self.method = req.method.upper()
+    self.host = (req.host or "").lower()
+    self.path = _request_path(req.endpoint)
+    self.endpoint = req.endpoint
+    self.status = reply.get("status", 200)
+    # Only keep the body digest if it is already known (e.g. spooled uploads, cassette lookups): hashing every body
+    # is costly, and is opt-in
+    self._digest = req.body_digest if hash_bodies else req._digest
+    if keep_bodies:
+      self.request = req
+      self.reply = reply
+    else:  # Only metadata
+      self.request = None
+      self.reply = None
+
+  @property
+  def body_digest(self):
+    """The SHA-256 hex digest of the request body, or None if it was not hashed and the request is not kept"""
+    if self._digest is None and self.request is not None:
+      self._digest = self.request.body_digest
+    return self._digest
+
+  def __repr__(self):
+    return "<{} {}{} -> {} ({})>".format(self.method, self.host, self.endpoint, self.status, self.client)
+
+
+class Journal:
+  """
+  A bounded record of the requests intercepted by unmock, and of their replies.
+
+  Entries are kept in a ring buffer: once `capacity` entries are recorded, the oldest ones are dropped. They are
+  indexed by host, method and path, so that queries on those do not scan the whole journal.
+  By default, entries only hold the request metadata, and the hash of its body if it was already computed (spooled
+  uploads, cassette and cache lookups); `hash_bodies=True` hashes every body. Keeping the Request objects and replies
+  (with `keep_bodies=True`) holds on to their bodies until the entries are dropped; the temporary files of spooled
+  uploads are closed once they are replied to.
+
+  Example:
+      with unmock.patch(replyFn=reply) as options:
+        get_horoscope("scorpio")
+      options.journal.assert_called(host="zodiac.com", path="/horoscope/scorpio", times=1)
+  """
+
+  def __init__(self, capacity=1000, keep_bodies=False, hash_bodies=False):
+    """
+    :param capacity: The maximum number of entries to keep
+    :type capacity int
+    :param keep_bodies: Whether to keep the Request objects and replies, or only metadata
+    :type keep_bodies bool
+    :param hash_bodies: Whether to compute the digest of every request body, rather than only keep those already known
+    :type hash_bodies bool
+    """
+    if capacity < 1:
+      raise ValueError("The journal capacity should be positive")
+    self.capacity = capacity
+    self.keep_bodies = keep_bodies
+    self.hash_bodies = hash_bodies
+    self._lock = threading.Lock()
+    self.clear()
+
+  def clear(self):
+    with self._lock:
+      self._entries = [None] * self.capacity
+      self._seq = 0  # Sequence number of the next entry
+      # Index name -> key -> sequence numbers, oldest first
+      self._indexes = {"host": dict(), "method": dict(), "path": dict()}
+
+  def record(self, req, client, reply):
+    """Adds an entry for the Request, intercepted by `client`, and its reply"""
+    with self._lock:
+      seq = self._seq
+      slot = seq % self.capacity
+      evicted = self._entries[slot]
+      if evicted is not None:
+        # The evicted entry is the oldest one, so it comes first in each of its indexes
+        for name, index in self._indexes.items():
+          key = getattr(evicted, name)
+          seqs = index[key]
+          seqs.popleft()
+          if not seqs:
+            del index[key]
+      entry = self._entries[slot] = Entry(seq, client, req, reply, self.keep_bodies, self.hash_bodies)
+      for name, index in self._indexes.items():
+        key = getattr(entry, name)
+        seqs = index.get(key)
+        if seqs is None:
+          seqs = index[key] = collections.deque()
+        seqs.append(seq)
+      self._seq += 1
+      return entry
+
+  def _all(self):
+    start = max(0, self._seq - self.capacity)
+    return [self._entries[seq % self.capacity] for seq in range(start, self._seq)]
+
+  def filter(self, host=None, method=None, path=None, predicate=None):
+    """
+    :param host: Only entries for this host
+    :type host string
+    :param method: Only entries with this method
+    :type method string
+    :param path: Only entries for this path (without query string)
+    :type path string
+    :param predicate: Only entries for which this function, receiving the Entry, returns True
+    :type predicate Callable
+    :return: The matching entries, oldest first
+    """
+    criteria = dict()
+    if host is not None:
+      criteria["host"] = host.lower()
+    if method is not None:
+      criteria["method"] = method.upper()
+    if path is not None:
+      criteria["path"] = path
+    with self._lock:
+      if not criteria:
+        entries = self._all()
+      else:
+        # Start from the most selective index, then check the other criteria on its entries
+        candidates = [self._indexes[name].get(key, ()) for name, key in criteria.items()]
+        seqs = min(candidates, key=len)
+        entries = [self._entries[seq % self.capacity] for seq in seqs]
+        entries = [entry for entry in entries if all(getattr(entry, k) == v for k, v in criteria.items())]
+    if predicate is not None:
+      entries = [entry for entry in entries if predicate(entry)]
+    return entries
+
+  def count(self, **criteria):
+    """The number of entries matching the criteria (see `filter`)"""
+    if not criteria:
+      return len(self)
+    return len(self.filter(**criteria))
+
+  def last(self, **criteria):
+    """The most recent entry matching the criteria (see `filter`), or None"""
+    entries = self.filter(**criteria)
+    return entries[-1] if entries else None
+
+  def assert_called(self, times=None, **criteria):
+    """
+    Asserts that requests matching the criteria (see `filter`) were intercepted, `times` times if given.
+    :return: The matching entries
+    """
+    entries = self.filter(**criteria)
+    if (times is None and not entries) or (times is not None and len(entries) != times):
+      description = ", ".join("{}={!r}".format(k, v) for k, v in sorted(criteria.items()))
+      recent = "\n".join("  {!r}".format(entry) for entry in self.filter()[-10:]) or "  (none)"
+      raise AssertionError("Expected {} request(s) matching {}, got {}. Most recent requests:\n{}".format(
+          "some" if times is None else times, description or "anything", len(entries), recent))
+    return entries
+
+  def __len__(self):
+    return min(self._seq, self.capacity)
+
+  def __iter__(self):
+    with self._lock:
+      return iter(self._all())
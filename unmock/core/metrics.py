@@ -0,0 +1,166 @@
+"""
+Counters, latency histograms and hooks for intercepted traffic.
+
+Every interception point (the `client`: "http.client", "urllib3", "requests", "aiohttp", "httpx", "socket", or "server"
+for `unmock serve`) reports to this module: requests answered by unmock and whitelisted requests passed through are
+counted by host and client, and the time spent getting replies (replyFn, routes, cassettes) is recorded in a histogram
+per host. Use `snapshot` to read them.
+Whitelisted urllib3 requests go through http.client as well, so they are counted as passed through by both.
+
+Hooks are functions registered on an event with `add_hook`:
+    "request": called with (req, client) when a request is captured, before its reply is generated
+    "reply": called with (req, client, reply, seconds) once the reply was generated
+    "response": called with (req, client, response) with the client-specific response about to be returned
+Hooks are stored in tuples that are only swapped when registering, so no work is done when none are registered.
+"""
+import bisect
+import threading
+import time
+
+__all__ = ["add_hook", "remove_hook", "snapshot", "reset", "HOOKS"]
+
+INTERCEPTED = "intercepted"
+PASSTHROUGH = "passthrough"
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Upper bounds of the reply latency histogram buckets, in seconds; slower replies go to a last, unbounded bucket"""
+
+timer = time.perf_counter if hasattr(time, "perf_counter") else time.time
+
+
+class Hooks:
+  __slots__ = ("request", "reply", "response")
+
+  def __init__(self):
+    self.request = ()
+    self.reply = ()
+    self.response = ()
+
+
+HOOKS = Hooks()
+"""The registered hooks, by event"""
+
+_hooks_lock = threading.Lock()
+
+
+def add_hook(event, fn):
+  """
+  Registers a hook.
+  :param event: "request", "reply" or "response"
+  :type event string
+  :param fn: The function to call on every occurrence of the event
+  :type fn Callable
+  """
+  if event not in Hooks.__slots__:
+    raise ValueError("Unknown event '{}', expected one of {}".format(event, ", ".join(Hooks.__slots__)))
+  with _hooks_lock:
+    setattr(HOOKS, event, getattr(HOOKS, event) + (fn,))
+
+
+def remove_hook(event, fn):
+  """Unregisters a hook added with `add_hook`"""
+  with _hooks_lock:
+    hooks = list(getattr(HOOKS, event))
+    hooks.remove(fn)
+    setattr(HOOKS, event, tuple(hooks))
+
+
+class Histogram:
+  __slots__ = ("counts", "count", "total", "max")
+
+  def __init__(self):
+    self.counts = [0] * (len(BUCKETS) + 1)
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def observe(self, seconds):
+    self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+    self.count += 1
+    self.total += seconds
+    if seconds > self.max:
+      self.max = seconds
+
+  def to_dict(self):
+    return {
+        "count": self.count,
+        "sum": self.total,
+        "max": self.max,
+        "buckets": [[le, n] for le, n in zip(BUCKETS + (None,), self.counts)],  # None stands for +Inf
+    }
+
+
+class Metrics:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    with self._lock:
+      self.counters = dict()  # (INTERCEPTED or PASSTHROUGH, host, client) -> count
+      self.latencies = dict()  # host -> Histogram of reply latencies
+
+  def count(self, kind, host, client):
+    key = (kind, host, client)
+    with self._lock:
+      self.counters[key] = self.counters.get(key, 0) + 1
+
+  def replied(self, host, client, seconds):
+    key = (INTERCEPTED, host, client)
+    with self._lock:
+      self.counters[key] = self.counters.get(key, 0) + 1
+      histogram = self.latencies.get(host)
+      if histogram is None:
+        histogram = self.latencies[host] = Histogram()
+      histogram.observe(seconds)
+
+  def snapshot(self):
+    with self._lock:
+      result = {INTERCEPTED: dict(), PASSTHROUGH: dict(), "reply_latency": dict()}
+      for (kind, host, client), n in self.counters.items():
+        result[kind].setdefault(host, dict())[client] = n
+      for host, histogram in self.latencies.items():
+        result["reply_latency"][host] = histogram.to_dict()
+      return result
+
+
+METRICS = Metrics()
+
+
+def snapshot():
+  """
+  :return: A dictionary with the "intercepted" and "passthrough" request counts (as {host: {client: count}}), and the
+      "reply_latency" histograms (as {host: {"count", "sum", "max", "buckets": [[upper bound, count], ...]}})
+  """
+  return METRICS.snapshot()
+
+
+def reset():
+  """Clears the counters and histograms"""
+  METRICS.reset()
+
+
+def passed_through(host, client):
+  """Counts a whitelisted request"""
+  METRICS.count(PASSTHROUGH, host, client)
+
+
+def captured(req, client):
+  """Signals a captured request; returns the start time of its reply"""
+  for fn in HOOKS.request:
+    fn(req, client)
+  return timer()
+
+
+def replied(req, client, reply, start):
+  """Records the reply to a captured request, given the start time returned by `captured`"""
+  seconds = timer() - start
+  METRICS.replied(req.host, client, seconds)
+  for fn in HOOKS.reply:
+    fn(req, client, reply, seconds)
+
+
+def responded(req, client, response):
+  """Signals the response returned for a captured request; returns it"""
+  for fn in HOOKS.response:
+    fn(req, client, response)
+  return response
@@ -0,0 +1,451 @@
+import base64
+import datetime
+import json
+import os
+import random
+import re
+import string
+import threading
+import uuid
+import zlib
+import six
+from .router import Router
+from .utils import LRUCache, parse_url
+
+try:
+  from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+  import sre_parse
+
+__all__ = ["OpenAPI"]
+
+METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+MAX_DEPTH = 4  # Beyond this nesting, objects only get their required properties and arrays their minimum items
+EPOCH = datetime.datetime(2020, 1, 1)
+LETTERS = string.ascii_lowercase
+MAX_EXTRA_REPEATS = 3  # Unbounded repeats in patterns (`*`, `+`, `{n,}`) repeat at most this many more times
+PATTERN_ATTEMPTS = 10
+CATEGORIES = {
+    "CATEGORY_DIGIT": string.digits,
+    "CATEGORY_NOT_DIGIT": string.ascii_letters,
+    "CATEGORY_SPACE": " ",
+    "CATEGORY_NOT_SPACE": string.ascii_letters + string.digits,
+    "CATEGORY_WORD": string.ascii_letters + string.digits + "_",
+    "CATEGORY_NOT_WORD": "-.",
+}
+"""Characters standing for the regular expression categories (`\\d`, `\\w`...) in generated strings"""
+
+
+def _resolve(document, ref):
+  """Resolves a local JSON reference, e.g. `#/components/schemas/User`"""
+  if not ref.startswith("#/"):
+    raise ValueError("Only local references are supported, got '{}'".format(ref))
+  node = document
+  for part in ref[2:].split("/"):
+    node = node[part.replace("~1", "/").replace("~0", "~")]
+  return node
+
+
+def _word(rng, min_length=5, max_length=12):
+  return "".join(rng.choice(LETTERS) for _ in range(rng.randint(min_length, max_length)))
+
+
+def _date_time(rng):
+  return EPOCH + datetime.timedelta(seconds=rng.randint(0, 5 * 365 * 24 * 3600))
+
+
+FORMATS = {
+    "date-time": lambda rng: _date_time(rng).isoformat() + "Z",
+    "date": lambda rng: _date_time(rng).date().isoformat(),
+    "time": lambda rng: _date_time(rng).time().isoformat(),
+    "uuid": lambda rng: str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+    "email": lambda rng: "{}@example.com".format(_word(rng)),
+    "hostname": lambda rng: "{}.example.com".format(_word(rng)),
+    "uri": lambda rng: "https://example.com/{}".format(_word(rng)),
+    "url": lambda rng: "https://example.com/{}".format(_word(rng)),
+    "ipv4": lambda rng: ".".join(str(rng.randint(1, 254)) for _ in range(4)),
+    "ipv6": lambda rng: ":".join("{:x}".format(rng.getrandbits(16)) for _ in range(8)),
+    "byte": lambda rng: base64.b64encode(bytes(bytearray(rng.getrandbits(8) for _ in range(12)))).decode("ascii"),
+}
+"""Generators of strings in the given formats"""
+
+
+def _name(code):
+  """The name of a regular expression opcode, e.g. "LITERAL" (Python 2 gives the names in lower case)"""
+  return str(code).upper()
+
+
+def _in_set(items, char):
+  """Whether the character is in the set (the items of an IN opcode), ignoring its negation"""
+  for op, arg in items:
+    op = _name(op)
+    if op == "LITERAL" and six.unichr(arg) == char:
+      return True
+    if op == "RANGE" and arg[0] <= ord(char) <= arg[1]:
+      return True
+    if op == "CATEGORY" and char in CATEGORIES.get(_name(arg), ""):
+      return True
+  return False
+
+
+def _from_set(items, rng):
+  if any(_name(op) == "NEGATE" for op, _ in items):
+    candidates = [c for c in string.ascii_letters + string.digits + "-_. " if not _in_set(items, c)]
+    return rng.choice(candidates)
+  op, arg = rng.choice([item for item in items if _name(item[0]) in ("LITERAL", "RANGE", "CATEGORY")])
+  op = _name(op)
+  if op == "LITERAL":
+    return six.unichr(arg)
+  if op == "RANGE":
+    return six.unichr(rng.randint(arg[0], arg[1]))
+  return rng.choice(CATEGORIES[_name(arg)])
+
+
+def _from_pattern(tokens, rng, out):
+  """Appends the characters of a string matching the parsed regular expression to `out`"""
+  for op, arg in tokens:
+    op = _name(op)
+    if op == "LITERAL":
+      out.append(six.unichr(arg))
+    elif op == "NOT_LITERAL":
+      out.append(rng.choice([c for c in LETTERS + string.digits if c != six.unichr(arg)]))
+    elif op == "ANY":
+      out.append(rng.choice(LETTERS))
+    elif op == "IN":
+      out.append(_from_set(arg, rng))
+    elif op == "BRANCH":
+      _from_pattern(rng.choice(arg[1]), rng, out)
+    elif op == "SUBPATTERN":
+      _from_pattern(arg[-1], rng, out)
+    elif op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+      low, high, repeated = arg
+      for _ in range(rng.randint(low, min(high, low + MAX_EXTRA_REPEATS))):
+        _from_pattern(repeated, rng, out)
+    elif op != "AT":  # Anchors need no characters
+      raise ValueError("Unsupported regular expression construct {}".format(op))
+
+
+def _constant(value):
+  return lambda rng, depth: value
+
+
+class SchemaCompiler:
+  """
+  Compiles the schemas of an OpenAPI document into generator functions, called with a `random.Random` and the
+  current nesting depth. Schemas are only walked once: referenced schemas are compiled on their first use and shared.
+  """
+
+  def __init__(self, document):
+    self.document = document
+    self.refs = dict()  # JSON reference -> generator
+
+  def ref(self, ref):
+    generator = self.refs.get(ref)
+    if generator is None:
+      compiled = list()
+      # Recursive schemas refer to themselves while being compiled; they get a stand-in calling the final generator
+      self.refs[ref] = lambda rng, depth: compiled[0](rng, depth)
+      compiled.append(self.compile(_resolve(self.document, ref)))
+      generator = self.refs[ref] = compiled[0]
+    return generator
+
+  def compile(self, schema):
+    """:return: A function generating a value valid against the schema"""
+    if "$ref" in schema:
+      return self.ref(schema["$ref"])
+    if "const" in schema:
+      return _constant(schema["const"])
+    if "enum" in schema:
+      values = schema["enum"]
+      return lambda rng, depth: rng.choice(values)
+    if "allOf" in schema:
+      return self._all_of([self.compile(s) for s in schema["allOf"]])
+    for keyword in ("oneOf", "anyOf"):
+      if keyword in schema:
+        alternatives = [self.compile(s) for s in schema[keyword]]
+        return lambda rng, depth: rng.choice(alternatives)(rng, depth)
+    kind = schema.get("type")
+    if isinstance(kind, list):  # OpenAPI 3.1, e.g. ["string", "null"]
+      kind = next((k for k in kind if k != "null"), "null")
+    if kind is None:
+      kind = "object" if "properties" in schema else "array" if "items" in schema else None
+    if kind == "null":
+      return _constant(None)
+    if kind is None:  # Any value is valid; its example if it has one, or a string
+      return _constant(schema["example"]) if "example" in schema else self._string(schema)
+    return getattr(self, "_" + kind)(schema)
+
+  def _all_of(self, parts):
+    def generate(rng, depth):
+      result = None
+      for part in parts:
+        value = part(rng, depth)
+        if isinstance(value, dict) and isinstance(result, dict):
+          result.update(value)
+        else:
+          result = value
+      return result
+    return generate
+
+  def _object(self, schema):
+    required = set(schema.get("required", ()))
+    properties = [(name, self.compile(prop), name in required)
+                  for name, prop in schema.get("properties", dict()).items()
+                  if not prop.get("writeOnly")]  # Write-only properties are never part of responses
+
+    def generate(rng, depth):
+      depth += 1
+      return dict((name, generator(rng, depth)) for name, generator, is_required in properties
+                  if is_required or depth <= MAX_DEPTH)
+    return generate
+
+  def _array(self, schema):
+    items = self.compile(schema.get("items", dict()))
+    min_items = schema.get("minItems", 1)
+    max_items = max(min_items, schema.get("maxItems", min_items + 2))
+    unique = schema.get("uniqueItems", False)
+
+    def generate(rng, depth):
+      depth += 1
+      count = rng.randint(min_items, max_items) if depth <= MAX_DEPTH else min_items
+      values = [items(rng, depth) for _ in range(count)]
+      if unique:  # Duplicates are dropped rather than regenerated
+        seen, distinct = set(), list()
+        for value in values:
+          key = json.dumps(value, sort_keys=True)
+          if key not in seen:
+            seen.add(key)
+            distinct.append(value)
+        values = distinct
+      return values
+    return generate
+
+  def _bounds(self, schema, default_min, default_max, step):
+    low, high = schema.get("minimum"), schema.get("maximum")
+    exclusive_min, exclusive_max = schema.get("exclusiveMinimum"), schema.get("exclusiveMaximum")
+    if not isinstance(exclusive_min, bool) and exclusive_min is not None:  # OpenAPI 3.1 gives the bound itself
+      low, exclusive_min = exclusive_min, True
+    if not isinstance(exclusive_max, bool) and exclusive_max is not None:
+      high, exclusive_max = exclusive_max, True
+    if low is None:
+      low = default_min if high is None else min(default_min, high - default_max)
+    if high is None:
+      high = low + default_max
+    return low + step if exclusive_min else low, high - step if exclusive_max else high
+
+  def _integer(self, schema):
+    low, high = self._bounds(schema, 0, 1000, 1)
+    multiple = schema.get("multipleOf")
+    if multiple:
+      low, high = -(-low // multiple), high // multiple
+      return lambda rng, depth: rng.randint(low, high) * multiple
+    return lambda rng, depth: rng.randint(low, high)
+
+  def _number(self, schema):
+    low, high = self._bounds(schema, 0, 1000, 0.01)
+    multiple = schema.get("multipleOf")
+    if multiple:
+      low, high = -(-low // multiple), high // multiple
+      return lambda rng, depth: rng.randint(int(low), int(high)) * multiple
+    return lambda rng, depth: round(rng.uniform(low, high), 2)
+
+  def _boolean(self, schema):
+    return lambda rng, depth: rng.random() < 0.5
+
+  def _string(self, schema):
+    fmt = FORMATS.get(schema.get("format"))
+    if fmt is not None:
+      return lambda rng, depth: fmt(rng)
+    min_length = schema.get("minLength", 0)
+    max_length = schema.get("maxLength", max(min_length, 12))
+    low, high = max(min_length, min(5, max_length)), max_length
+
+    def word(rng, depth):
+      return _word(rng, low, high)
+    if "pattern" in schema:
+      return self._pattern(schema["pattern"], min_length, schema.get("maxLength"), schema.get("example", word))
+    return word
+
+  def _pattern(self, pattern, min_length, max_length, fallback):
+    """
+    Generates strings matching simple regular expressions (literals, classes, categories, alternations, groups and
+    repeats). Strings that do not match the pattern and length bounds (e.g. with lookarounds or back references) are
+    regenerated a few times, before falling back to the schema's example or, lacking one, to a plain word.
+    """
+    try:
+      regex, tokens = re.compile(pattern), sre_parse.parse(pattern)
+    except re.error:
+      tokens = None
+    fallback = fallback if callable(fallback) else _constant(fallback)
+
+    def generate(rng, depth):
+      for _ in range(PATTERN_ATTEMPTS if tokens is not None else 0):
+        out = list()
+        try:
+          _from_pattern(tokens, rng, out)
+        except ValueError:
+          break
+        value = "".join(out)
+        if regex.search(value) and len(value) >= min_length and (max_length is None or len(value) <= max_length):
+          return value
+      return fallback(rng, depth)
+    return generate
+
+
+def _media_type(content):
+  """Picks the media type to reply with: JSON if the operation offers it"""
+  for media_type in content:
+    if media_type == "application/json" or media_type.endswith("+json"):
+      return media_type
+  return next(iter(content), None)
+
+
+class Operation:
+  """An operation of the specification, whose response is only compiled on its first hit"""
+  __slots__ = ("api", "key", "spec", "compiled")
+  lock = threading.Lock()
+
+  def __init__(self, api, key, spec):
+    self.api = api
+    self.key = key
+    self.spec = spec
+    self.compiled = None
+
+  def compile(self):
+    """:return: The status, headers and body generator (or example) of the operation's response"""
+    document = self.api.document
+    responses = self.spec.get("responses") or {"200": {}}
+    codes = sorted(str(code) for code in responses)
+    code = next((c for c in codes if c.startswith("2")), "default" if "default" in codes else codes[0])
+    response = responses[code] if code in responses else responses[int(code)]  # YAML keys may be integers
+    if "$ref" in response:
+      response = _resolve(document, response["$ref"])
+    status = int(code.replace("X", "0")) if code[0].isdigit() else 200
+    content = response.get("content") or dict()
+    media_type = _media_type(content)
+    if media_type is None:
+      return status, dict(), None
+    media = content[media_type]
+    if "example" in media:
+      generator = _constant(media["example"])
+    elif media.get("examples"):
+      example = next(iter(media["examples"].values()))
+      generator = _constant(_resolve(document, example["$ref"]).get("value") if "$ref" in example
+                            else example.get("value"))
+    else:
+      generator = self.api.compiler.compile(media.get("schema", dict()))
+    return status, {"Content-Type": media_type}, generator
+
+  def __call__(self, req):
+    if self.compiled is None:
+      with self.lock:
+        if self.compiled is None:
+          self.compiled = self.compile()
+    status, headers, generator = self.compiled
+    reply = {"status": status, "headers": headers}
+    if generator is not None:
+      reply["content"] = self.api.generate(self.key, req, generator)
+    return reply
+
+
+class OpenAPI:
+  """
+  A reply provider generating responses from an OpenAPI 3 specification.
+
+  Requests are matched on the method and path of the specification's operations (under the hosts and base paths of
+  its `servers`, or any host if it has none). Operations reply with their first success response (or the default
+  one), whose body is the media type's example if it has one, or is generated from its schema. Each schema is compiled
+  once into a generator function, on the first request to an operation, so large specifications load quickly.
+
+  Bodies are generated from a random generator seeded with `seed` and the request's method and endpoint: the same
+  request gets the same body, which is memoized, and the replies can be cached (see ReplyCache). With `seed=None`,
+  every request gets a new body.
+
+  Example:
+      unmock.on(openapi=unmock.OpenAPI("petstore.yaml", seed=42))
+  """
+
+  def __init__(self, spec, seed=0, cache_size=1024):
+    """
+    :param spec: The specification, as a dictionary or the path to a JSON or YAML file (YAML requires PyYAML), as a
+        string or a path-like object
+    :type spec Union[dict, string, os.PathLike]
+    :param seed: The seed of generated bodies, or None for random bodies
+    :type seed int
+    :param cache_size: The number of generated bodies to memoize
+    :type cache_size int
+    """
+    self.document = spec if isinstance(spec, dict) else self.load(spec)
+    version = str(self.document.get("openapi", self.document.get("swagger", "")))
+    if not version.startswith("3"):
+      raise ValueError("Unsupported OpenAPI version '{}', expected 3.x".format(version))
+    self.seed = seed
+    self.compiler = SchemaCompiler(self.document)
+    self.bodies = LRUCache(cache_size)
+    self.router = Router()
+    self.count = 0
+    self._add_operations()
+
+  @staticmethod
+  def load(path):
+    """Loads a specification from a JSON or YAML file, given its path as a string or a path-like object"""
+    path = os.fspath(path) if hasattr(path, "__fspath__") else str(path)
+    with open(path, "rb") as f:
+      data = f.read().decode("utf-8")
+    if path.endswith((".yaml", ".yml")):
+      import yaml
+      loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+      return yaml.load(data, Loader=loader)
+    return json.loads(data)
+
+  def _servers(self):
+    """The (host, base path) tuples the operations are served at; the host is None for any host"""
+    servers = list()
+    for server in self.document.get("servers") or [{"url": "/"}]:
+      url = server.get("url", "/")
+      for name, variable in (server.get("variables") or dict()).items():
+        url = url.replace("{" + name + "}", str(variable.get("default", "")))
+      parsed = parse_url(url) if "://" in url else None
+      host = parsed.hostname if parsed is not None else None
+      base = (parsed.path if parsed is not None else url).rstrip("/")
+      if (host, base) not in servers:
+        servers.append((host, base))
+    return servers
+
+  def _add_operations(self):
+    servers = self._servers()
+    for path, item in (self.document.get("paths") or dict()).items():
+      # The router only captures whole segments, e.g. `/files/{name}.json` is matched as `/files/{name}`
+      template = "/".join("{" + s[s.index("{") + 1:s.index("}")] + "}" if "{" in s else s for s in path.split("/"))
+      for method in METHODS:
+        spec = item.get(method)
+        if spec is None:
+          continue
+        operation = Operation(self, (method, path), spec)
+        for host, base in servers:
+          self.router.add(method, host, base + template, operation)
+        self.count += 1
+
+  def generate(self, key, req, generator):
+    """Generates (or recalls) the body of the operation with the given key for the Request"""
+    if self.seed is None:
+      return generator(random.Random(), 0)
+    seed = zlib.crc32("{}:{} {}".format(self.seed, req.method, req.endpoint).encode("utf-8"))
+    body = self.bodies.get((key, seed))
+    if body is None:
+      body = generator(random.Random(seed), 0)
+      self.bodies.set((key, seed), body)
+    return body
+
+  def __call__(self, req):
+    """
+    Reply provider; generates the response of the operation matching the Request.
+    :return: The reply, or None if no operation matches the request
+    """
+    reply = self.router(req)
+    if reply is not None and self.seed is None:
+      reply["cache"] = False
+    return reply
+
+  def __len__(self):
+    return self.count
@@ -1,11 +1,127 @@
 import fnmatch
-from .utils import parse_url
+import re
+from .utils import parse_url, LRUCache
+from .simulation import sample
+from .journal import Journal
+from .cache import ReplyCache
+from .fixtures import Fixtures
+from .openapi import OpenAPI
 
 __all__ = ["UnmockOptions"]
 
+WILDCARDS = re.compile(r"[*?\[]")
+ENGINES = ("patch", "socket")
+
+
+def _translate(pattern):
+  """fnmatch.translate, stripped of the trailing flags Python 2 adds so the result can be joined with others."""
+  translated = fnmatch.translate(pattern)
+  if translated.endswith("\\Z(?ms)"):  # Python 2
+    translated = translated[:-len("(?ms)")]
+  return translated
+
+
+def _combine(patterns):
+  """Compiles a list of fnmatch patterns into a single regex, or returns None if there are no patterns"""
+  if not patterns:
+    return None
+  return re.compile("|".join("(?:{})".format(_translate(p)) for p in patterns), re.S)
+
+
+class Whitelist:
+  """
+  A compiled form of the user-supplied whitelist, so that checking a host does not scan all patterns.
+  Patterns are split into:
+    - Exact hostnames (no wildcards), looked up in a set;
+    - Simple domain wildcards (`*.domain.com`), looked up by the host's dot-separated suffixes;
+    - Any other host pattern, matched by one combined regular expression;
+    - `host/path` patterns, matched by one combined regular expression against the host and request path.
+  Decisions are memoized in a bounded LRU cache.
+  """
+
+  def __init__(self, patterns, cache_size=4096):
+    self.exact = set()
+    self.suffixes = set()
+    host_patterns = list()
+    path_patterns = list()
+    for pattern in patterns:
+      if "/" in pattern:
+        host, _, path = pattern.partition("/")
+        path_patterns.append("{}/{}".format(host.lower(), path))
+      elif not WILDCARDS.search(pattern):
+        self.exact.add(pattern.lower())
+      elif pattern.startswith("*.") and not WILDCARDS.search(pattern[2:]):
+        self.suffixes.add(pattern[2:].lower())
+      else:
+        host_patterns.append(pattern.lower())
+    self.host_regex = _combine(host_patterns)
+    self.path_regex = _combine(path_patterns)
+    self.cache = LRUCache(cache_size)
+
+  def _match_host(self, host):
+    if host in self.exact:
+      return True
+    if self.suffixes:
+      # fnmatch("a.b.domain.com", "*.domain.com") is True, as is fnmatch(".domain.com", "*.domain.com")
+      idx = host.find(".")
+      while idx != -1:
+        if host[idx + 1:] in self.suffixes:
+          return True
+        idx = host.find(".", idx + 1)
+    return self.host_regex is not None and self.host_regex.match(host) is not None
+
+  def _match_path(self, host, path):
+    if self.path_regex is None:
+      return False
+    if not path:
+      path = "/"
+    elif not path.startswith("/"):  # Absolute URLs, e.g. when going through a proxy
+      _, _, p, query, _ = parse_url(path)
+      path = (p or "/") + ("?" + query if query else "")
+    return self.path_regex.match(host + path) is not None
+
+  def __call__(self, host, path=None):
+    """
+    :param host: The requested host
+    :type host string
+    :param path: The requested endpoint (may include a query string), if known
+    :type path string
+    :return: True if the host (or host and path) is whitelisted, False otherwise
+    """
+    host = (host or "").lower()
+    # Without path patterns the path doesn't affect the decision, so don't let it fragment the cache
+    key = (host, path) if self.path_regex is not None else host
+    decision = self.cache.get(key)
+    if decision is None:
+      decision = self._match_host(host) or self._match_path(host, path)
+      self.cache.set(key, decision)
+    return decision
+
+
+def _host_rules(spec):
+  """
+  Compiles a per-host setting, given either as a single value for every host, or as a mapping of host (or
+  `host/path`) patterns to values; patterns use the same syntax as the whitelist, and the first matching one applies.
+  :return: A tuple of (Whitelist or None to match any host, value) rules
+  """
+  if spec is None:
+    return ()
+  if isinstance(spec, dict):
+    return tuple((Whitelist([pattern]), value) for pattern, value in spec.items())
+  return ((None, spec),)
+
+
+def _lookup(rules, host, path):
+  for matcher, value in rules:
+    if matcher is None or matcher(host, path):
+      return value
+  return None
+
 
 class UnmockOptions:
-  def __init__(self, replyFn=None, whitelist=None):
+  def __init__(self, replyFn=None, whitelist=None, router=None, cassette=None, latency=None, bandwidth=None,
+               journal=1000, engine="patch", redirect=None, cache=None, fixtures=None,
+               requests_adapter=False, openapi=None):
     """
     Creates a new UnmockOptions object, customizing the use of Unmock
     :param replyFn: A function that gets called with a Request object, and replies with a dictionary with the following keys:
@@ -18,22 +134,150 @@ class UnmockOptions:
         intercepting the calls. Defaults to ["127.0.0.1", "127.0.0.0", "localhost"]
     :type string, list of strings
 
+    :param router: An optional Router, consulted before `replyFn`. `replyFn` is used for requests not matching
+        any route.
+    :type router Router
+
+    :param cassette: An optional Cassette. In "record" mode, whitelisted requests and their responses are recorded
+        to it; in "replay" mode, recorded requests are answered from it (even if whitelisted).
+    :type cassette Cassette
+
+    :param latency: An optional latency (in seconds, or a distribution from `unmock.simulation`) to wait for before
+        responding to mocked requests, or a mapping of host (or `host/path`) patterns to latencies. A "latency" key in
+        a reply takes precedence.
+    :type latency Union[float, Latency, dict]
+
+    :param bandwidth: An optional bandwidth (in bytes per second) to throttle the reading of mocked response bodies
+        to, or a mapping of host (or `host/path`) patterns to bandwidths. A "bandwidth" key in a reply takes
+        precedence.
+    :type bandwidth Union[float, dict]
+
+    :param journal: The number of intercepted requests to keep (as metadata) in `journal`, or a Journal (e.g. one
+        keeping the Request objects and replies, or shared between options). None or 0 disable the journal.
+    :type journal Union[int, Journal]
+
+    :param engine: How requests are intercepted: "patch" (the default) patches the calls http.client and urllib3 use
+        to send requests; "socket" hands the connections to mocked hosts an in-memory socket instead, which parses the
+        requests written to it (supporting persistent connections, pipelining, and other clients writing HTTP/1.1 to
+        sockets). aiohttp and httpx's async client are always intercepted at their transport level.
+    :type engine string
+
+    :param redirect: The address of an unmock server (see `unmock serve`), as "host:port" or a (host, port) tuple, to
+        send the requests to mocked hosts to, instead of answering them in this process. Implies the socket engine.
+    :type redirect Union[string, tuple]
+
+    :param cache: Memoizes replies, so that identical requests do not call `replyFn` (or routes) again: True for a
+        ReplyCache with the default settings, the maximum number of replies to cache, or a ReplyCache. Replies with a
+        "cache" key set to False are not cached.
+    :type cache Union[bool, int, ReplyCache]
+
+    :param fixtures: An optional directory of fixture files (see Fixtures), or Fixtures, consulted after `router` and
+        before `replyFn`
+    :type fixtures Union[string, Fixtures]
+
+    :param requests_adapter: Whether to answer mocked `requests` calls in its transport adapter, building the
+        `requests.Response` directly instead of going through urllib3's pools. This is several times faster, but
+        `Retry` settings mounted on sessions are not applied to mocked responses.
+    :type requests_adapter bool
+
+    :param openapi: An optional OpenAPI 3 specification (see OpenAPI) to generate replies from, as a dictionary, the
+        path to a JSON or YAML file, or OpenAPI; consulted after `fixtures` and before `replyFn`
+    :type openapi Union[dict, string, OpenAPI]
     """
-    self.replyTo = replyFn if replyFn is not None else (lambda _: dict())
+    self.replyFn = replyFn if replyFn is not None else (lambda _: dict())
+    self.router = router
+    self.cassette = cassette
+    self.fixtures = fixtures if fixtures is None or isinstance(fixtures, Fixtures) else Fixtures(fixtures)
+    self.openapi = openapi if openapi is None or isinstance(openapi, OpenAPI) else OpenAPI(openapi)
+    self._replaying = cassette is not None and not cassette.recording
     self.whitelist = whitelist if whitelist is not None else [
         "127.0.0.1", "127.0.0.0", "localhost"]
     if not isinstance(self.whitelist, list):
       self.whitelist = [self.whitelist]
+    self._whitelist = Whitelist(self.whitelist)
+    if engine not in ENGINES:
+      raise ValueError("Unknown engine '{}', expected one of {}".format(engine, ", ".join(ENGINES)))
+    if hasattr(redirect, "encode"):
+      host, _, port = redirect.rpartition(":")
+      redirect = (host, int(port))
+    self.redirect = redirect
+    self.engine = "socket" if redirect is not None else engine
+    self._socket_engine = self.engine == "socket"
+    self.requests_adapter = requests_adapter
+    self.journal = journal if isinstance(journal, Journal) or not journal else Journal(journal)
+    self._latency = _host_rules(latency)
+    self._bandwidth = _host_rules(bandwidth)
+    self._simulating = bool(self._latency or self._bandwidth)
+    if cache is True:
+      cache = ReplyCache()
+    elif cache and not isinstance(cache, ReplyCache):
+      cache = ReplyCache(cache)
+    self.cache = cache if isinstance(cache, ReplyCache) else None
+    # Reply providers are consulted in order; the first one not returning None supplies the reply
+    providers = (cassette if self._replaying else None, router, self.fixtures, self.openapi)
+    self._providers = [provider for provider in providers if provider is not None]
 
-  def _is_host_whitelisted(self, host):
+  def replyTo(self, req):
+    """
+    Generates the reply dictionary for the given Request
+    :param req: The intercepted request
+    :type req Request
+    :return: The reply, or an awaitable for it if `replyFn` (or a route) is a coroutine function; awaited replies
+        should be passed to `_remember`
+    """
+    if self.cache is None:
+      return self._reply(req)
+    key = self.cache.key(req)
+    reply = self.cache.get(key) if key is not None else None
+    if reply is None:
+      reply = self._reply(req)
+      if not hasattr(reply, "__await__"):
+        self.cache.put(key, reply)
+    return reply
+
+  def _reply(self, req):
+    for provider in self._providers:
+      reply = provider(req)
+      if reply is not None:
+        return reply
+    return self.replyFn(req)
+
+  def _remember(self, req, reply):
+    """Caches an awaited reply"""
+    if self.cache is not None:
+      self.cache.put(self.cache.key(req), reply)
+
+  def _is_host_whitelisted(self, host, path=None, method=None):
     """
     Checks if given host is whitelisted
     :param host: String representing a host
     :type host string
+    :param path: Optional string representing the requested endpoint, used for `host/path` whitelist patterns
+    :type path string
+    :param method: Optional HTTP method; requests recorded in a replayed cassette are never considered whitelisted
+    :type method string
     :return: True if host is whitelisted, False otherwise
     """
-    for whitelisted in self.whitelist:
-      if fnmatch.fnmatch(
-              host, whitelisted):  # Whitelisted can be a wildcard string (e.g. "*.amazon.com/...")
-        return True
-    return False
+    if not self._whitelist(host, path):
+      return False
+    return not (self._replaying and method is not None and self.cassette.contains(method, host, path or "/"))
+
+  def _simulate(self, req, reply):
+    """
+    Determines how slow the upstream answering the Request should appear to be.
+    :return: A tuple of the delay before responding (in seconds), and the bandwidth of the body (or None)
+    """
+    if not self._simulating and "latency" not in reply and "bandwidth" not in reply:
+      return 0, None
+    latency = reply.get("latency")
+    if latency is None:
+      latency = _lookup(self._latency, req.host, req.endpoint)
+    bandwidth = reply.get("bandwidth")
+    if bandwidth is None:
+      bandwidth = _lookup(self._bandwidth, req.host, req.endpoint)
+    return (sample(latency) if latency is not None else 0), bandwidth
+
+  @property
+  def _recorder(self):
+    """The cassette to record passed-through requests to, if any"""
+    return self.cassette if self.cassette is not None and self.cassette.recording else None
@@ -1,45 +1,256 @@
+import hashlib
 import json
+import tempfile
 from six.moves.urllib.parse import parse_qs
-from six.moves.http_client import responses
-from .utils import parse_url
+from .utils import parse_url, buffer_size
+from .cassette import body_digest
 try:
-  from unittest import mock
-except ImportError:
-  import mock
+  from collections.abc import MutableMapping
+except ImportError:  # Python 2
+  from collections import MutableMapping
 
+__all__ = ["Request", "Headers"]
+
+_UNSET = object()
+
+SPOOL_THRESHOLD = 1024 * 1024
+"""Streamed request bodies larger than this many bytes are spooled to a temporary file instead of kept in memory"""
+CHUNK_SIZE = 65536
+
+
+def _to_str(value):
+  if isinstance(value, bytes):
+    return value.decode("latin-1")
+  return value if hasattr(value, "encode") else str(value)
+
+
+class Headers(MutableMapping):
+  """
+  A case-insensitive mapping of request headers, keeping every value of repeated headers.
+  Indexing returns the values of a header joined by commas (as they would be folded on the wire); use `get_all` to
+  get each value separately.
+  """
+  __slots__ = ("_store",)
+
+  def __init__(self, headers=None):
+    self._store = dict()  # lowercase name -> (name as first given, [values])
+    if headers:
+      for k, v in (headers.items() if hasattr(headers, "items") else headers):
+        self.add(k, v)
+
+  def add(self, key, value):
+    """Adds a value for the header, keeping the existing ones"""
+    key = _to_str(key)
+    entry = self._store.get(key.lower())
+    if entry is None:
+      self._store[key.lower()] = (key, [_to_str(value)])
+    else:
+      entry[1].append(_to_str(value))
+
+  def get_all(self, key, default=None):
+    """
+    :return: A list of every value given for the header, or `default` if it is missing
+    """
+    entry = self._store.get(key.lower())
+    return list(entry[1]) if entry is not None else default
+
+  def __getitem__(self, key):
+    return ", ".join(self._store[key.lower()][1])
+
+  def __setitem__(self, key, value):
+    key = _to_str(key)
+    self._store[key.lower()] = (key, [_to_str(value)])
+
+  def __delitem__(self, key):
+    del self._store[key.lower()]
+
+  def __contains__(self, key):
+    return hasattr(key, "lower") and key.lower() in self._store
+
+  def __iter__(self):
+    return (name for name, _ in self._store.values())
+
+  def __len__(self):
+    return len(self._store)
+
+  def __repr__(self):
+    return repr(dict(self.items()))
+
+
+def is_streamed(data):
+  """Whether a request body is a file object or an iterator of chunks, which can only be read once"""
+  return hasattr(data, "read") or hasattr(data, "__next__") or hasattr(data, "next")
+
+
+def iter_chunks(data):
+  """Iterates over the chunks of a streamed (or iterable) request body, as bytes"""
+  if hasattr(data, "read"):
+    chunks = iter(lambda: data.read(CHUNK_SIZE), data.read(0))
+  else:
+    chunks = data
+  for chunk in chunks:
+    yield chunk.encode("utf-8") if hasattr(chunk, "encode") else chunk
+
+
+class BodyWriter(object):
+  """
+  Consumes a request body, possibly written in several parts, computing its size and digest on the way. The body is
+  kept in memory up to SPOOL_THRESHOLD bytes, and spooled to a temporary file beyond that.
+  """
+
+  def __init__(self):
+    self.digest = hashlib.sha256()
+    self.size = 0
+    self.buffer = bytearray()
+    self.spool = None
+
+  def write(self, data):
+    """
+    :param data: Bytes, text, a file object, or an iterable of chunks
+    """
+    chunks = (data,) if isinstance(data, (bytes, bytearray, memoryview)) or hasattr(data, "encode") else \
+        iter_chunks(data)
+    for chunk in chunks:
+      if hasattr(chunk, "encode"):
+        chunk = chunk.encode("utf-8")
+      self.digest.update(chunk)
+      self.size += len(chunk)
+      if self.spool is not None:
+        self.spool.write(chunk)
+        continue
+      self.buffer += chunk
+      if len(self.buffer) > SPOOL_THRESHOLD:
+        self.spool = tempfile.TemporaryFile()
+        self.spool.write(self.buffer)
+        self.buffer = None
+
+  def close(self):
+    """Discards the body, if it was not handed to a Request"""
+    if self.spool is not None:
+      self.spool.close()
+
+  def finish(self, req):
+    """Sets the written body as the body of the Request, which then owns the temporary file it may be spooled to"""
+    req.add_body(None)
+    if self.spool is None:
+      req.data = bytes(self.buffer)
+    else:
+      self.spool.seek(0)
+      req.data = self.spool
+    req._size = self.size
+    req._digest = self.digest.hexdigest()
+
+
+class Request(object):
+  """
+  An intercepted request, passed to replyFn.
+  The query string and the JSON body are only parsed when first accessed.
+  """
+  __slots__ = ("host", "endpoint", "method", "port", "headers", "data", "params", "_qs", "_json", "_size", "_digest")
 
-class Request:
   def __init__(self, host, port, endpoint, method):
     self.host = host
     self.endpoint = endpoint
     self.method = method
     self.port = port
 
-    self.headers = dict()
+    self.headers = Headers()
     self.data = None
-    self.qs = dict()
+    self.params = dict()  # Path parameters captured by a Router
+    self._qs = None
+    self._json = _UNSET
+    self._size = None
+    self._digest = None
+
+  @property
+  def qs(self):
+    """A mapping of query string keys to the list of their values"""
+    if self._qs is None:
+      self._qs = dict()
+      _, _, _, query, _ = parse_url(self.endpoint)
+      if query:
+        self.add_query(query)
+    return self._qs
 
-    _, _, _, query, _ = parse_url(endpoint)
-    if query:
-      self.add_query(query)
+  @property
+  def json(self):
+    """The body, decoded as JSON; None if there is no body, or if it isn't valid JSON"""
+    if self._json is _UNSET:
+      self._json = None
+      data = self.data
+      if isinstance(data, (bytes, bytearray)):
+        data = bytes(data).decode("utf-8", "replace")
+      if hasattr(data, "encode") and data:
+        try:
+          self._json = json.loads(data)
+        except ValueError:
+          pass
+    return self._json
 
   def add_qs(self, key, value):
     self.qs[key] = value
 
   def add_query(self, query):
     parsed = parse_qs(query)
+    qs = self.qs
     for k, v in parsed.items():
-      self.qs[k] = v
+      qs[k] = v
 
-  def add_header(self, key, value):
-    self.headers[key] = value
+  def add_header(self, key, *values):
+    """Adds a header; several values (as accepted by `HTTPConnection.putheader`) are folded into one"""
+    self.headers.add(key, ", ".join(_to_str(v) for v in values))
 
   def add_headers(self, headers):
-    for (k, v) in self.headers:
-      self.headers[k] = v
+    """Adds headers from a mapping, or from a list of (name, value) tuples"""
+    for (k, v) in (headers.items() if hasattr(headers, "items") else headers):
+      self.headers.add(k, v)
 
   def add_body(self, data):
-    self.data = data
+    """
+    Sets the body. Streamed bodies (file objects and iterators of chunks) are consumed incrementally, computing their
+    size and digest on the way: up to SPOOL_THRESHOLD bytes, `data` is then the body as bytes; beyond that, it is a
+    temporary file holding it, positioned at its start, so that large uploads are never held in memory.
+    """
+    self._json = _UNSET
+    self._size = None
+    self._digest = None
+    if is_streamed(data):
+      self._spool(data)
+    else:
+      self.data = data
+
+  def _spool(self, data):
+    writer = BodyWriter()
+    writer.write(data)
+    writer.finish(self)
+
+  def close(self):
+    """
+    Closes the temporary file of a spooled body (see `add_body`). Unmock calls it once the reply was produced, so that
+    no file descriptor is held by Requests kept around (e.g. in a journal); the size and digest remain available.
+    """
+    if hasattr(self.data, "read"):
+      self.data.close()
+
+  @property
+  def body_size(self):
+    """The size of the body in bytes, or None if it is not known (e.g. form fields given as a dictionary)"""
+    if self._size is None:
+      data = self.data
+      if data is None:
+        self._size = 0
+      elif hasattr(data, "encode"):
+        self._size = len(data.encode("utf-8"))
+      elif isinstance(data, (bytes, bytearray, memoryview)):
+        self._size = buffer_size(data)
+    return self._size
+
+  @property
+  def body_digest(self):
+    """The SHA-256 hex digest of the body, e.g. to match uploads without reading them"""
+    if self._digest is None:
+      self._digest = body_digest(self.data)
+    return self._digest
 
   def __str__(self):
     return "{} {}{}:{} (headers: {}) with body {}".format(
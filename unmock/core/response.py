@@ -0,0 +1,268 @@
+import hashlib
+import io
+import os
+import mmap
+from io import StringIO, BytesIO
+from six.moves import http_client
+import six
+from .utils import LRUCache, is_python_version_at_least, buffer_size
+from .serialization import BODIES, serialize, is_structured, compress_chunks
+
+__all__ = ["ResponseTemplate", "MessageResponse", "get_template"]
+
+
+def _template_size(template):
+  """The memory held by a template: its body, unless it is served from a file or a buffer, and its headers"""
+  size = len(template.body) if isinstance(template.body, bytes) else 0
+  return size + sum(len(k) + len(v) for k, v in template.headers)
+
+
+TEMPLATES = LRUCache(256, max_bytes=32 * 1024 * 1024, sizeof=_template_size)
+"""Prebuilt response templates, keyed on the reply's status, headers and a digest of its content, and bounded by count
+and by the size of their bodies; set `TEMPLATES.max_bytes` to change its memory cap"""
+
+
+def _header_items(headers):
+  """Flattens a reply's headers dictionary into a list of (name, value) strings, one per header line"""
+  items = list()
+  for k, v in headers.items():
+    for vv in (v if isinstance(v, list) else [v]):
+      if isinstance(vv, bytes):
+        vv = vv.decode("latin-1")
+      elif not isinstance(vv, six.string_types):
+        vv = str(vv)
+      items.append((str(k), vv))
+  return items
+
+
+class BufferReader(io.RawIOBase):
+  """
+  A raw binary stream serving a memoryview (of bytes, a bytearray, a mmap...) without copying it upfront.
+  Memoryviews are served as given: their owner may release them (e.g. a Cassette, when closed). Other buffers are
+  viewed for the lifetime of the stream. If `owner` is given, it is closed together with the stream (e.g. a mmap
+  created for a file).
+  """
+
+  def __init__(self, buffer, owner=None):
+    self.borrowed = isinstance(buffer, memoryview)
+    self.view = buffer if self.borrowed else memoryview(buffer)
+    self.pos = 0
+    self.owner = owner
+
+  def readable(self):
+    return True
+
+  def readinto(self, b):
+    n = min(len(b), len(self.view) - self.pos)
+    b[:n] = self.view[self.pos:self.pos + n]
+    self.pos += n
+    return n
+
+  def close(self):
+    if not self.closed:
+      if not self.borrowed and hasattr(self.view, "release"):  # Python 3.2+; a mmap cannot be closed while viewed
+        self.view.release()
+      if self.owner is not None:
+        self.owner.close()
+    super(BufferReader, self).close()
+
+
+class ChunkedReader(io.RawIOBase):
+  """
+  A raw binary stream lazily reading an iterator of byte (or text) chunks.
+  If `framed`, the chunks are encoded using chunked transfer encoding (as they would be on the wire).
+  """
+
+  def __init__(self, chunks, framed=True):
+    self.chunks = iter(chunks)
+    self.framed = framed
+    self.pending = memoryview(b"")
+    self.done = False
+
+  def readable(self):
+    return True
+
+  def _next_frame(self):
+    for chunk in self.chunks:
+      if hasattr(chunk, "encode"):
+        chunk = chunk.encode("utf-8")
+      if not chunk:  # An empty chunk would mark the end of the body
+        continue
+      if not self.framed:
+        return chunk
+      return "{:x}\r\n".format(len(chunk)).encode("ascii") + bytes(chunk) + b"\r\n"
+    self.done = True
+    return b"0\r\n\r\n" if self.framed else b""
+
+  def readinto(self, b):
+    if not len(self.pending):
+      if self.done:
+        return 0
+      self.pending = memoryview(self._next_frame())
+    n = min(len(b), len(self.pending))
+    b[:n] = self.pending[:n]
+    self.pending = self.pending[n:]
+    return n
+
+
+def is_path(content):
+  return hasattr(content, "__fspath__")
+
+
+def is_buffer(content):
+  return isinstance(content, (memoryview, bytearray, mmap.mmap))
+
+
+def is_stream(content):
+  """Whether the content is an iterator of chunks, to be sent using chunked transfer encoding"""
+  return not isinstance(content, (six.string_types, bytes, dict, list)) and not is_buffer(content) and (
+      hasattr(content, "__next__") or hasattr(content, "next"))
+
+
+def open_body(content, framed=True):
+  """
+  Creates a readable binary file object serving the given reply content.
+  :param content: Text, bytes, a buffer (memoryview, bytearray or mmap), a path-like object whose file is
+      memory-mapped, or an iterator of chunks
+  :param framed: Whether iterators of chunks should be encoded with chunked transfer encoding (http.client decodes
+      it from the raw stream) or served as a plain stream (urllib3 reads from the body object directly)
+  :return: A tuple of the file object and the body length (None for chunked bodies)
+  """
+  if isinstance(content, bytes):
+    return BytesIO(content), len(content)  # BytesIO shares the bytes object until it is written to
+  if hasattr(content, "encode"):
+    body = content.encode("utf-8")
+    return BytesIO(body), len(body)
+  if is_buffer(content):
+    reader = BufferReader(content)
+    return io.BufferedReader(reader), buffer_size(reader.view)
+  if is_path(content):
+    with open(os.fspath(content), "rb") as f:
+      size = os.fstat(f.fileno()).st_size
+      if not size:  # Empty files cannot be memory-mapped
+        return BytesIO(b""), 0
+      mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return io.BufferedReader(BufferReader(mapped, owner=mapped)), size
+  if is_stream(content):
+    return io.BufferedReader(ChunkedReader(content, framed)), None
+  raise TypeError("Unsupported reply content type: {}".format(type(content)))
+
+
+class ResponseTemplate:
+  """
+  The parts of a response that can be shared between requests receiving the same reply:
+  the status, the headers (already normalized to strings) and the encoded body.
+  """
+
+  def __init__(self, status, headers, body):
+    """
+    :param status: The HTTP status code
+    :type status int
+    :param headers: A list of (name, value) tuples
+    :type headers list
+    :param body: The encoded body, or the content to stream the body from (see `open_body`)
+    :type body bytes
+    """
+    self.status = status
+    self.reason = http_client.responses.get(status, "")
+    self.chunked = is_stream(body)
+    if self.chunked and not any(k.lower() == "transfer-encoding" for k, _ in headers):
+      headers = headers + [("Transfer-Encoding", "chunked")]
+    self.headers = headers
+    self.body = body
+    self.has_cookies = any(k.lower() == "set-cookie" for k, _ in headers)
+    if not is_python_version_at_least("3.0"):
+      self._hstring = u"".join(u"{}: {}\r\n".format(k, v) for k, v in headers) + u"\r\n"
+
+  @classmethod
+  def from_reply(cls, reply):
+    """
+    Builds the template of a reply: dictionary and list content is serialized as JSON (see `set_json_encoder`), and
+    with an "encoding" ("gzip" or "deflate"), the body is compressed and its Content-Encoding and Content-Length set.
+    """
+    reply = _serialized(reply)
+    content = reply.get("content", "")
+    headers = _header_items(reply.get("headers", dict()))
+    body = content.encode("utf-8") if hasattr(content, "encode") else content
+    encoding = reply.get("encoding")
+    if encoding:
+      headers = [(k, v) for k, v in headers if k.lower() not in ("content-encoding", "content-length")]
+      headers.append(("Content-Encoding", encoding))
+      if is_stream(body):
+        body = compress_chunks(body, encoding)
+      else:
+        body = BODIES.compress(body, encoding)
+        headers.append(("Content-Length", str(len(body))))
+    return cls(reply.get("status", 200), headers, body)
+
+  def open(self, framed=True):
+    """Opens the body for reading; returns a tuple of a binary file object and the body length (or None)"""
+    return open_body(self.body, framed)
+
+  def message(self):
+    """Creates a new HTTPMessage with this template's headers, without going through email.parser"""
+    if not is_python_version_at_least("3.0"):
+      return http_client.HTTPMessage(StringIO(self._hstring))
+    msg = http_client.HTTPMessage()
+    for k, v in self.headers:
+      msg[k] = v  # __setitem__ appends, so repeated headers are kept
+    return msg
+
+
+class MessageResponse:
+  """
+  A minimal stand-in for the `httplib.HTTPResponse` that urllib3 keeps as `original_response`.
+  `requests` only reads its `msg` attribute, to extract cookies.
+  """
+
+  def __init__(self, msg):
+    self.msg = msg
+
+  def isclosed(self):
+    return True
+
+
+def _serialized(reply):
+  """The reply, with its structured content (if any) serialized, and a JSON Content-Type unless it has one"""
+  content = reply.get("content")
+  if not is_structured(content):
+    return reply
+  headers = reply.get("headers") or dict()
+  if not any(k.lower() == "content-type" for k in headers):
+    headers = dict(headers, **{"Content-Type": "application/json"})
+  return dict(reply, content=serialize(content), headers=headers)
+
+
+def _reply_key(reply):
+  """A hashable key representing the reply's content, or None if the reply cannot be cached"""
+  content = reply.get("content", "")
+  if not isinstance(content, (six.string_types, bytes)) and not is_path(content):
+    return None  # Buffers and streams are served as-is
+  headers = reply.get("headers", dict())
+  if not is_path(content):  # Keys do not hold on to the content
+    content = hashlib.sha1(content.encode("utf-8") if isinstance(content, six.text_type) else content).digest()
+  try:
+    key = (reply.get("status", 200),
+           tuple((k, tuple(v) if isinstance(v, list) else v) for k, v in headers.items()),
+           content,
+           reply.get("encoding"))
+    hash(key)
+  except TypeError:
+    return None
+  return key
+
+
+def get_template(reply):
+  """
+  Returns the ResponseTemplate for the given reply dictionary, reusing a previously built one if the same
+  reply content was seen before. Structured content is serialized first, so that equal content shares a template.
+  """
+  reply = _serialized(reply)
+  key = _reply_key(reply)
+  if key is None:
+    return ResponseTemplate.from_reply(reply)
+  template = TEMPLATES.get(key)
+  if template is None:
+    template = ResponseTemplate.from_reply(reply)
+    TEMPLATES.set(key, template)
+  return template
@@ -0,0 +1,165 @@
+from .utils import parse_url
+
+__all__ = ["Router"]
+
+
+def _split_path(path):
+  """Splits a path (without query string) into its non-empty segments"""
+  return [segment for segment in path.split("/") if segment]
+
+
+def _request_path(endpoint):
+  """Returns the path part of a request endpoint, without the query string"""
+  if not endpoint.startswith("/"):  # Absolute URLs, e.g. when going through a proxy
+    return parse_url(endpoint).path or "/"
+  return endpoint.split("?", 1)[0]
+
+
+def _matches(expected, values):
+  """Checks a query/header predicate against a list of values (or None if missing)"""
+  if callable(expected):
+    return expected(values)
+  if values is None:
+    return False
+  return expected is None or expected in values
+
+
+class Route:
+  def __init__(self, method, params, reply, query=None, headers=None, cache=True):
+    self.method = method.upper() if method not in (None, "*") else None
+    self.params = params
+    self.reply = reply
+    self.query = query or dict()
+    self.headers = headers or dict()
+    self.cache = cache
+
+  def accepts(self, req):
+    if self.method is not None and self.method != req.method.upper():
+      return False
+    for k, v in self.query.items():
+      if not _matches(v, req.qs.get(k)):
+        return False
+    for k, v in self.headers.items():
+      if not _matches(v, req.headers.get_all(k)):
+        return False
+    return True
+
+  def respond(self, req, values):
+    req.params = dict(zip(self.params, values))
+    reply = self.reply(req) if callable(self.reply) else self.reply
+    if not self.cache and isinstance(reply, dict):
+      reply = dict(reply, cache=False)
+    return reply
+
+
+class Node:
+  """A node in the path trie; static segments are preferred over parameters when matching"""
+  __slots__ = ("static", "param", "routes")
+
+  def __init__(self):
+    self.static = dict()
+    self.param = None
+    self.routes = list()
+
+  def insert(self, segments):
+    """Returns the node for the given segments (creating it as needed) and the names of the parameters on the way"""
+    node, params = self, list()
+    for segment in segments:
+      if segment.startswith("{") and segment.endswith("}"):
+        params.append(segment[1:-1])
+        if node.param is None:
+          node.param = Node()
+        node = node.param
+      else:
+        child = node.static.get(segment)
+        if child is None:  # Not setdefault, which would build a Node for every existing segment
+          child = node.static[segment] = Node()
+        node = child
+    return node, params
+
+  def find(self, segments, idx, values, req):
+    """Walks the trie depth-first, returning a (route, parameter values) tuple for the first route accepting `req`"""
+    if idx == len(segments):
+      for route in self.routes:
+        if route.accepts(req):
+          return route, values
+      return None
+    child = self.static.get(segments[idx])
+    if child is not None:
+      found = child.find(segments, idx + 1, values, req)
+      if found is not None:
+        return found
+    if self.param is not None:
+      return self.param.find(segments, idx + 1, values + [segments[idx]], req)
+    return None
+
+
+class Router:
+  """
+  A declarative alternative to a single replyFn. Routes are registered on a method, host and path template
+  (e.g. `/users/{id}`), and are indexed in a trie per host, so dispatching depends on the path length rather than
+  on the number of routes. Captured path parameters are available as `Request.params`.
+
+  Example:
+      router = unmock.Router()
+      router.add("GET", "api.example.com", "/users/{id}", {"content": "..."})
+
+      @router.route("POST", "api.example.com", "/users", headers={"Content-Type": "application/json"})
+      def create_user(req):
+        return {"status": 201}
+
+      unmock.on(router=router, replyFn=fallback)
+  """
+
+  def __init__(self):
+    self.hosts = dict()  # host (or None for any host) -> trie root
+
+  def add(self, method, host, path, reply, query=None, headers=None, cache=True):
+    """
+    Registers a new route.
+    :param method: The HTTP method to match, or None (or "*") to match any method
+    :type method string
+    :param host: The host to match, or None (or "*") to match any host
+    :type host string
+    :param path: A path template; segments wrapped in curly braces (e.g. `{id}`) capture a parameter
+    :type path string
+    :param reply: A reply dictionary, or a function receiving the Request and returning one
+    :type reply Union[dict, Callable]
+    :param query: An optional mapping of query parameters to a required value, None (must be present), or a
+        predicate function receiving the list of values (or None if missing)
+    :type query dict
+    :param headers: An optional mapping of headers to a required value, None (must be present), or a predicate
+        function receiving the list of values (or None if missing)
+    :type headers dict
+    :param cache: Whether the replies of this route may be memoized (see ReplyCache); disable it for stateful
+        routes. Coroutine functions should set the "cache" key of their replies instead.
+    :type cache bool
+    """
+    host = host.lower() if host not in (None, "*") else None
+    root = self.hosts.setdefault(host, Node())
+    node, params = root.insert(_split_path(path))
+    node.routes.append(Route(method, params, reply, query, headers, cache))
+    return self
+
+  def route(self, method, host, path, query=None, headers=None, cache=True):
+    """Decorator form of `add`"""
+    def decorator(fn):
+      self.add(method, host, path, fn, query, headers, cache)
+      return fn
+    return decorator
+
+  def __call__(self, req):
+    """
+    Dispatches the Request to the matching route.
+    :return: The reply for the first matching route, or None if no route matches
+    """
+    segments = _split_path(_request_path(req.endpoint))
+    for host in (req.host.lower(), None):
+      root = self.hosts.get(host)
+      if root is None:
+        continue
+      found = root.find(segments, 0, [], req)
+      if found is not None:
+        route, values = found
+        return route.respond(req, values)
+    return None
@@ -0,0 +1,118 @@
+"""
+Serialization of structured reply content (dictionaries and lists, as JSON), and compression of reply bodies (the
+"encoding" key of replies).
+"""
+import hashlib
+import json
+import os
+import zlib
+from .utils import LRUCache
+
+__all__ = ["set_json_encoder", "BodyCache"]
+
+ENCODINGS = ("gzip", "deflate")
+COMPRESSION_LEVEL = 6  # zlib's default; gzip's own default (9) is several times slower for little gain
+
+_json_encoder = [json.dumps]
+
+
+def set_json_encoder(encoder=None):
+  """
+  Sets the function serializing dictionary and list reply content, e.g. `orjson.dumps` or
+  `functools.partial(json.dumps, separators=(",", ":"))`.
+  :param encoder: A function called with the content, returning text or bytes. None restores `json.dumps`.
+  :type encoder Callable
+  """
+  _json_encoder[0] = encoder if encoder is not None else json.dumps
+
+
+def serialize(content):
+  """Serializes structured content as JSON; returns bytes"""
+  body = _json_encoder[0](content)
+  return body.encode("utf-8") if hasattr(body, "encode") else body
+
+
+def is_structured(content):
+  return isinstance(content, (dict, list))
+
+
+def _compressor(encoding):
+  if encoding not in ENCODINGS:
+    raise ValueError("Unknown encoding '{}', expected one of {}".format(encoding, ", ".join(ENCODINGS)))
+  # gzip adds a header and trailer to the compressed data; deflate is the zlib format, as HTTP defines it
+  wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+  return zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, wbits)
+
+
+def _read(content):
+  """The bytes of a buffer or of a path-like object's file"""
+  if hasattr(content, "__fspath__"):
+    with open(os.fspath(content), "rb") as f:
+      return f.read()
+  return bytes(content)
+
+
+def compress_chunks(chunks, encoding):
+  """Lazily compresses an iterator of byte (or text) chunks"""
+  compressor = _compressor(encoding)
+  for chunk in chunks:
+    if hasattr(chunk, "encode"):
+      chunk = chunk.encode("utf-8")
+    data = compressor.compress(chunk)
+    if data:
+      yield data
+  yield compressor.flush()
+
+
+class BodyCache(LRUCache):
+  """
+  Memoizes compressed bodies by encoding and hash of their uncompressed bytes, so that replies served repeatedly are
+  only compressed once. Bodies are evicted least recently used first once they hold more than `max_bytes`.
+  """
+
+  def __init__(self, max_bytes=64 * 1024 * 1024, maxsize=4096):
+    """
+    :param max_bytes: The maximum size of the cached (compressed) bodies, in bytes
+    :type max_bytes int
+    :param maxsize: The maximum number of cached bodies
+    :type maxsize int
+    """
+    LRUCache.__init__(self, maxsize, max_bytes=max_bytes, sizeof=len)
+    self.hits = 0
+    self.misses = 0
+
+  def clear(self):
+    """Drops the cached bodies and resets the statistics"""
+    LRUCache.clear(self)
+    self.hits = 0
+    self.misses = 0
+
+  def compress(self, body, encoding):
+    """
+    :param body: The uncompressed body, as bytes, a buffer, or a path-like object
+    :param encoding: "gzip" or "deflate"
+    :type encoding string
+    :return: The compressed body, as bytes
+    """
+    data = body if isinstance(body, bytes) else _read(body)
+    key = (encoding, hashlib.sha1(data).digest())
+    compressed = self.get(key)
+    if compressed is not None:
+      self.hits += 1
+      return compressed
+    self.misses += 1
+    compressor = _compressor(encoding)
+    compressed = compressor.compress(data) + compressor.flush()
+    self.set(key, compressed)
+    return compressed
+
+  def stats(self):
+    """
+    :return: A dictionary of the "hits" and "misses" counts, and of the number of cached "entries" and their size in
+        "bytes"
+    """
+    return {"hits": self.hits, "misses": self.misses, "entries": len(self), "bytes": self.bytes}
+
+
+BODIES = BodyCache()
+"""The compressed bodies of replies with an "encoding"; set `BODIES.max_bytes` to change its memory cap"""
@@ -0,0 +1,129 @@
+"""
+Simulation of slow upstreams: latency distributions, and throttling of response bodies to a given bandwidth.
+
+Latencies are given in seconds, either as a number or as one of the distributions below; bandwidths are given in bytes
+per second. They can be set for every mocked request or per host with the `latency` and `bandwidth` UnmockOptions,
+and per reply (e.g. per route) with the "latency" and "bandwidth" keys of the reply dictionary.
+"""
+import bisect
+import io
+import random
+import time
+
+__all__ = ["Latency", "Uniform", "Normal", "Percentiles", "sample", "throttle"]
+
+timer = time.perf_counter if hasattr(time, "perf_counter") else time.time
+
+
+class Latency:
+  """A distribution of latencies; `sample` returns the next latency, in seconds"""
+
+  def __init__(self, seed=None):
+    """
+    :param seed: An optional seed, making the sequence of latencies reproducible
+    :type seed int
+    """
+    self.random = random.Random(seed)
+
+  def sample(self):
+    raise NotImplementedError()
+
+
+class Uniform(Latency):
+  def __init__(self, low, high, seed=None):
+    Latency.__init__(self, seed)
+    self.low = low
+    self.high = high
+
+  def sample(self):
+    return self.random.uniform(self.low, self.high)
+
+
+class Normal(Latency):
+  """A normal distribution, clamped to non-negative values"""
+
+  def __init__(self, mean, stddev, seed=None):
+    Latency.__init__(self, seed)
+    self.mean = mean
+    self.stddev = stddev
+
+  def sample(self):
+    return max(0.0, self.random.gauss(self.mean, self.stddev))
+
+
+class Percentiles(Latency):
+  """
+  A latency profile given by some of its percentiles, e.g. `Percentiles({50: 0.02, 99: 0.25})`.
+  Latencies are interpolated linearly between the given percentiles, and clamped to the lowest and highest ones.
+  """
+
+  def __init__(self, percentiles, seed=None):
+    """
+    :param percentiles: A mapping of percentiles (between 0 and 100) to latencies
+    :type percentiles dict
+    """
+    Latency.__init__(self, seed)
+    if not percentiles:
+      raise ValueError("At least one percentile is required")
+    points = sorted(percentiles.items())
+    self.ranks = [float(p) for p, _ in points]
+    self.values = [float(v) for _, v in points]
+
+  def sample(self):
+    rank = self.random.uniform(0, 100)
+    idx = bisect.bisect_left(self.ranks, rank)
+    if idx == 0:
+      return self.values[0]
+    if idx == len(self.ranks):
+      return self.values[-1]
+    low, high = self.ranks[idx - 1], self.ranks[idx]
+    return self.values[idx - 1] + (self.values[idx] - self.values[idx - 1]) * (rank - low) / (high - low)
+
+
+def sample(latency):
+  """
+  :param latency: A number of seconds, or a Latency distribution
+  :return: The number of seconds to wait for
+  """
+  return latency.sample() if isinstance(latency, Latency) else float(latency)
+
+
+def chunk_size(bandwidth):
+  """The size of the reads of a throttled body; about 50ms worth of data"""
+  return max(1, int(bandwidth / 20))
+
+
+class ThrottledReader(io.RawIOBase):
+  """A raw binary stream reading from another one, no faster than `bandwidth` bytes per second"""
+
+  def __init__(self, fp, bandwidth):
+    self.fp = fp
+    self.bandwidth = float(bandwidth)
+    self.size = chunk_size(bandwidth)
+    self.start = None
+    self.sent = 0
+
+  def readable(self):
+    return True
+
+  def readinto(self, b):
+    if self.start is None:  # The clock starts with the first read
+      self.start = timer()
+    data = self.fp.read(min(len(b), self.size))
+    n = len(data)
+    b[:n] = data
+    self.sent += n
+    wait = self.start + self.sent / self.bandwidth - timer()
+    if wait > 0:
+      time.sleep(wait)
+    return n
+
+  def close(self):
+    if not self.closed:
+      self.fp.close()
+    super(ThrottledReader, self).close()
+
+
+def throttle(fp, bandwidth):
+  """Wraps a readable binary file object so that it is read no faster than `bandwidth` bytes per second"""
+  return io.BufferedReader(ThrottledReader(fp, bandwidth), min(io.DEFAULT_BUFFER_SIZE, chunk_size(bandwidth)))
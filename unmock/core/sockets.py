@@ -0,0 +1,439 @@
+"""
+Socket-level interception, used by UnmockOptions with `engine="socket"`.
+
+Instead of patching the calls clients make to send a request, the functions creating their connections are patched:
+connections to hosts that are not whitelisted are handed an in-memory MockSocket. Requests written to it are parsed
+incrementally, answered using the options' replies, and the serialized responses are read back by the client. This
+supports any client writing HTTP/1.1 to a socket created by `socket.create_connection` (http.client, urllib3 and
+requests, httpx's sync client...), persistent connections, and pipelined requests.
+
+Connections are created before any request is sent, so only host (not `host/path`) whitelist patterns apply.
+"""
+import collections
+import errno
+import io
+import socket
+import time
+from io import BytesIO
+from .utils import PATCHERS
+from .request import Request
+from .response import get_template
+from .simulation import throttle
+from . import context
+from . import metrics
+
+__all__ = ["MockSocket", "RequestParser", "install"]
+
+SOCKET = "socket"
+NO_BODY_STATUSES = (204, 304)
+
+ORIGINALS = dict()
+"""The original (unpatched) functions, by name"""
+
+_idle = []  # A socket that never becomes readable, whose descriptor stands for idle MockSockets in select/poll
+
+
+def _idle_fileno():
+  if not _idle:
+    _idle.append(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+  return _idle[0].fileno()
+
+
+class RequestParser:
+  """An incremental HTTP/1.1 request parser; `feed` returns the requests completed by the given data"""
+
+  def __init__(self):
+    self.buffer = bytearray()
+    self.head = None  # (method, target, version, headers) of the request whose body is being received
+    self.length = None  # Expected length of the body, or None if it is chunked
+    self.chunks = None  # Received chunks of a chunked body
+    self.error = None  # Why the data could not be parsed; nothing is parsed after an error
+
+  def feed(self, data):
+    """
+    :param data: Bytes written to the connection
+    :type data bytes
+    :return: A list of (method, target, version, headers, body) tuples, headers being a list of (name, value) tuples.
+        If malformed data was received, `error` is set, and the requests before it are returned.
+    """
+    if self.error is not None:
+      return list()
+    self.buffer += data
+    requests = list()
+    try:
+      while True:
+        if self.head is None and not self._parse_head():
+          break
+        body = self._parse_body()
+        if body is None:
+          break
+        requests.append(self.head + (body,))
+        self.head = None
+    except ValueError as e:
+      self.error = str(e)
+      del self.buffer[:]
+    return requests
+
+  def _parse_head(self):
+    while self.buffer.startswith(b"\r\n"):  # Tolerate empty lines between requests
+      del self.buffer[:2]
+    end = self.buffer.find(b"\r\n\r\n")
+    if end == -1:
+      return False
+    lines = bytes(self.buffer[:end]).decode("latin-1").split("\r\n")
+    del self.buffer[:end + 4]
+    parts = lines[0].split(" ", 2)
+    if len(parts) != 3 or not parts[0] or not parts[2].startswith("HTTP/"):
+      raise ValueError("Malformed request line {!r}".format(lines[0]))
+    method, target, version = parts
+    headers = list()
+    for line in lines[1:]:
+      if line[:1] in (" ", "\t") and headers:  # Obsolete line folding
+        headers[-1] = (headers[-1][0], headers[-1][1] + " " + line.strip())
+      else:
+        name, _, value = line.partition(":")
+        headers.append((name.strip(), value.strip()))
+    self.head = (method, target, version, headers)
+    encoding = ",".join(v for k, v in headers if k.lower() == "transfer-encoding").lower()
+    if "chunked" in encoding:
+      self.length, self.chunks = None, list()
+    else:
+      lengths = [v for k, v in headers if k.lower() == "content-length"]
+      try:
+        self.length, self.chunks = int(lengths[0]) if lengths else 0, None
+      except ValueError:
+        raise ValueError("Malformed Content-Length {!r}".format(lengths[0]))
+    return True
+
+  def _parse_body(self):
+    """Returns the body once it is fully received, or None"""
+    if self.chunks is None:
+      if len(self.buffer) < self.length:
+        return None
+      body = bytes(self.buffer[:self.length])
+      del self.buffer[:self.length]
+      return body
+    while True:
+      end = self.buffer.find(b"\r\n")
+      if end == -1:
+        return None
+      size_line = bytes(self.buffer[:end]).split(b";", 1)[0]
+      try:
+        size = int(size_line, 16)
+      except ValueError:
+        raise ValueError("Malformed chunk size {!r}".format(size_line))
+      if size == 0:
+        # The last chunk is followed by optional trailers and an empty line
+        trailers_end = self.buffer.find(b"\r\n\r\n", end) if self.buffer[end + 2:end + 4] != b"\r\n" else end
+        if trailers_end == -1:
+          return None
+        del self.buffer[:trailers_end + 4]
+        body, self.chunks = b"".join(self.chunks), None
+        return body
+      if len(self.buffer) < end + 2 + size + 2:
+        return None
+      self.chunks.append(bytes(self.buffer[end + 2:end + 2 + size]))
+      del self.buffer[:end + 2 + size + 2]
+
+
+def closes_connection(version, headers, template):
+  """Whether the connection ends after the response, given the request's HTTP version and headers"""
+  request_connection = ",".join(v for k, v in headers if k.lower() == "connection").lower()
+  reply_connection = ",".join(v for k, v in template.headers if k.lower() == "connection").lower()
+  return "close" in request_connection or "close" in reply_connection or (
+      version == "HTTP/1.0" and "keep-alive" not in request_connection)
+
+
+def response_head(template, method, length, closing):
+  """
+  Serializes the status line and headers of a response, adding the framing headers the reply did not set.
+  :param length: The length of the body, or None if it is chunked
+  :param closing: Whether the connection ends after this response
+  :return: A tuple of the serialized head, and whether a body follows it
+  """
+  lines = ["HTTP/1.1 {} {}".format(template.status, template.reason)]
+  lines.extend("{}: {}".format(k, v) for k, v in template.headers)
+  names = set(k.lower() for k, _ in template.headers)
+  with_body = method.upper() != "HEAD" and template.status not in NO_BODY_STATUSES and template.status >= 200
+  if length is not None and "content-length" not in names and template.status not in NO_BODY_STATUSES:
+    lines.append("Content-Length: {}".format(length))
+  if closing and "connection" not in names:
+    lines.append("Connection: close")
+  return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"), with_body
+
+
+def bad_request(reason):
+  """
+  The serialized 400 Bad Request response to malformed requests (see `RequestParser.error`), closing the connection
+  """
+  body = "Bad Request: {}".format(reason).encode("utf-8")
+  template = get_template({"status": 400, "content": body,
+                           "headers": {"Content-Type": "text/plain", "Connection": "close"}})
+  return response_head(template, "GET", len(body), True)[0] + body
+
+
+class _SocketReader(io.RawIOBase):
+  def __init__(self, sock):
+    self.sock = sock
+
+  def readable(self):
+    return True
+
+  def readinto(self, b):
+    return self.sock.recv_into(b)
+
+  def close(self):
+    if not self.closed:
+      self.sock._release()
+    super(_SocketReader, self).close()
+
+
+class _SocketWriter(io.RawIOBase):
+  def __init__(self, sock):
+    self.sock = sock
+
+  def writable(self):
+    return True
+
+  def write(self, b):
+    self.sock.sendall(bytes(b))
+    return len(b)
+
+
+class TLSStandIn(object):
+  """
+  The parts of the SSLSocket API used by clients, for connections that are not actually encrypted: `wrap_socket`
+  returns them as-is, and they stand in for their TLS-wrapped selves.
+  """
+
+  def read(self, n=1024, buffer=None):
+    if buffer is not None:
+      return self.recv_into(buffer, n)
+    return self.recv(n)
+
+  def write(self, data):
+    return self.send(data)
+
+  def pending(self):
+    return 0
+
+  def getpeercert(self, binary_form=False):
+    if binary_form:
+      return b""
+    return {"subject": ((("commonName", self.server_hostname),),), "subjectAltName": (("DNS", self.server_hostname),)}
+
+  def version(self):
+    return "TLSv1.3"
+
+  def cipher(self):
+    return None
+
+  def selected_alpn_protocol(self):
+    return None
+
+  def selected_npn_protocol(self):
+    return None
+
+  def compression(self):
+    return None
+
+  def do_handshake(self):
+    pass
+
+  def unwrap(self):
+    return self
+
+
+class MockSocket(TLSStandIn):
+  """
+  An in-memory connection to a mocked host. Requests written to it are answered right away, in order; the responses
+  are queued as file objects, so bodies are read from their sources (e.g. memory-mapped files) without being copied.
+  """
+
+  def __init__(self, address, unmock_options, timeout=None):
+    self.host, self.port = address[0], address[1]
+    self.options = unmock_options
+    self.timeout = timeout
+    self.family = socket.AF_INET
+    self.type = socket.SOCK_STREAM
+    self.proto = socket.IPPROTO_TCP
+    self.server_hostname = self.host
+    self.parser = RequestParser()
+    self.incoming = collections.deque()  # File objects serving the responses, in order
+    self.closing = False  # The "server" closes the connection once the pending responses are read
+    self.closed = False
+    self.readers = 0  # Like with real sockets, files made by `makefile` keep the responses readable after `close`
+
+  # Writing requests
+
+  def sendall(self, data, flags=0):
+    if self.closed or self.closing:
+      raise socket.error(errno.EPIPE, "Broken pipe")
+    for request in self.parser.feed(data):
+      if not self.closing:  # Requests pipelined after a "Connection: close" are never answered
+        self._respond(*request)
+    if self.parser.error is not None and not self.closing:
+      self._reject(self.parser.error)
+
+  def _reject(self, reason):
+    """Answers malformed requests as a server would (see `bad_request`), closing the connection"""
+    self.closing = True
+    self.incoming.append(BytesIO(bad_request(reason)))
+
+  def send(self, data, flags=0):
+    self.sendall(data, flags)
+    return len(data)
+
+  def _respond(self, method, target, version, headers, body):
+    unmock_options = context.current()
+    if unmock_options is None or not unmock_options._socket_engine:  # The scope which connected was closed since
+      unmock_options = self.options
+    req = Request(self.host, self.port, target, method)
+    req.add_headers(headers)
+    req.add_body(body or None)
+    reply = ORIGINALS["reply"](unmock_options, req, SOCKET)
+    delay, bandwidth = unmock_options._simulate(req, reply)
+    if delay:
+      time.sleep(delay)
+    template = get_template(reply)
+    self.closing = closes_connection(version, headers, template)
+    fp, length = template.open(framed=True)
+    head, with_body = response_head(template, method, length, self.closing)
+    self.incoming.append(BytesIO(head))
+    if with_body:
+      self.incoming.append(throttle(fp, bandwidth) if bandwidth else fp)
+    else:
+      fp.close()
+    metrics.responded(req, SOCKET, template)
+
+  # Reading responses
+
+  def recv_into(self, buffer, nbytes=0, flags=0):
+    view = memoryview(buffer)
+    if nbytes:
+      view = view[:nbytes]
+    while self.incoming:
+      n = self.incoming[0].readinto(view)
+      if n:
+        return n
+      self.incoming.popleft().close()
+    return 0  # Nothing was requested; in memory, there is nothing to wait for
+
+  def recv(self, bufsize, flags=0):
+    buffer = bytearray(bufsize)
+    n = self.recv_into(buffer)
+    return bytes(buffer[:n])
+
+  def makefile(self, mode="r", buffering=None, **kwargs):
+    if "w" in mode:
+      return io.BufferedWriter(_SocketWriter(self))
+    self.readers += 1
+    reader = io.BufferedReader(_SocketReader(self))
+    return reader if "b" in mode else io.TextIOWrapper(reader, **kwargs)
+
+  # Socket API
+
+  def settimeout(self, timeout):
+    self.timeout = timeout
+
+  def gettimeout(self):
+    return self.timeout
+
+  def setblocking(self, flag):
+    self.timeout = None if flag else 0.0
+
+  def setsockopt(self, *args):
+    pass
+
+  def getsockopt(self, *args):
+    return 0
+
+  def fileno(self):
+    return _idle_fileno()
+
+  def getpeername(self):
+    return self.host, self.port
+
+  def getsockname(self):
+    return "127.0.0.1", 0
+
+  def shutdown(self, how):
+    pass
+
+  def close(self):
+    self.closed = True
+    if not self.readers:
+      self._discard()
+
+  def _release(self):
+    self.readers -= 1
+    if self.closed and not self.readers:
+      self._discard()
+
+  def _discard(self):
+    while self.incoming:
+      self.incoming.popleft().close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+class RedirectedSocket(TLSStandIn):
+  """A plain connection to an unmock server (see `unmock serve`), made in place of one to a mocked host"""
+
+  def __init__(self, sock, host):
+    self.sock = sock
+    self.server_hostname = host
+
+  def __getattr__(self, name):
+    return getattr(self.sock, name)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.sock.close()
+
+
+def _connector(name):
+  """
+  Creates a replacement for a `create_connection` function, handing MockSockets out for mocked hosts, or connections
+  to the unmock server that the options redirect to
+  """
+  def unmock_create_connection(address, *args, **kwargs):
+    unmock_options = context.current()
+    if unmock_options is None or not unmock_options._socket_engine or \
+        unmock_options._is_host_whitelisted(address[0]):
+      return ORIGINALS[name](address, *args, **kwargs)
+    if unmock_options.redirect is not None:
+      return RedirectedSocket(ORIGINALS[name](unmock_options.redirect, *args, **kwargs), address[0])
+    timeout = args[0] if args else kwargs.get("timeout")
+    return MockSocket(address, unmock_options, timeout if isinstance(timeout, (int, float)) else None)
+  return unmock_create_connection
+
+
+def unmock_wrap_socket(self, sock, *args, **kwargs):
+  """SSLContext.wrap_socket; there is no TLS with mocked hosts"""
+  if isinstance(sock, TLSStandIn):
+    return sock
+  return ORIGINALS["wrap_socket"](self, sock, *args, **kwargs)
+
+
+def install_urllib3():
+  """urllib3 creates its connections with its own `create_connection`"""
+  ORIGINALS["urllib3"] = PATCHERS.patch("urllib3.util.connection.create_connection", _connector("urllib3"))
+
+
+def install(reply):
+  """
+  Registers the socket-level patches. They are inert unless the options in use select the socket engine.
+  :param reply: A function getting the reply for a Request, given the options in use and the name of the client
+  :type reply Callable
+  """
+  ORIGINALS["reply"] = reply
+  ORIGINALS["socket"] = PATCHERS.patch("socket.create_connection", _connector("socket"))
+  ORIGINALS["wrap_socket"] = PATCHERS.patch("ssl.SSLContext.wrap_socket", unmock_wrap_socket)
+  PATCHERS.when_imported("urllib3", install_urllib3)
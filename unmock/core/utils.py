@@ -1,13 +1,12 @@
+import importlib
 import sys
+import threading
+from collections import OrderedDict
 from six.moves.urllib.parse import urlsplit, SplitResult
-try:
-  from unittest import mock
-except ImportError:
-  import mock
 
 from ..__version__ import __version__
 
-__all__ = ["PATCHERS", "parse_url",
+__all__ = ["PATCHERS", "IMPORT_HOOK", "parse_url", "LRUCache",
            "is_python_version_at_least"]
 
 
@@ -22,28 +21,95 @@ def is_python_version_at_least(version):
   return sys.version_info >= tuple(int(v) for v in version.split("."))
 
 
+def buffer_size(buffer):
+  """
+  The size in bytes of a buffer (bytes, bytearray, memoryview, mmap...); memoryviews have no `nbytes` on Python 2.7
+  """
+  view = memoryview(buffer)
+  if hasattr(view, "nbytes"):
+    return view.nbytes
+  return len(view) * view.itemsize if view.ndim <= 1 else len(view.tobytes())
+
+
+def _resolve(target):
+  """Imports the module in a dotted `target` path, returning the object owning the attribute and its name"""
+  components = target.split(".")
+  for idx in range(len(components) - 1, 0, -1):
+    try:
+      owner = importlib.import_module(".".join(components[:idx]))
+    except ImportError:
+      continue
+    for name in components[idx:-1]:
+      owner = getattr(owner, name)
+    return owner, components[-1]
+  raise ImportError("Cannot import the module of {}".format(target))
+
+
+class Patcher:
+  """Replaces an attribute, given by its dotted path, until stopped; a lightweight `mock.patch`"""
+
+  def __init__(self, target, new):
+    self.owner, self.attribute = _resolve(target)
+    self.new = new
+    self.local = self.attribute in vars(self.owner)  # Otherwise it is inherited, and only needs to be shadowed
+    self.original = vars(self.owner)[self.attribute] if self.local else getattr(self.owner, self.attribute)
+    self.started = False
+
+  def start(self):
+    setattr(self.owner, self.attribute, self.new)
+    self.started = True
+
+  def stop(self):
+    if self.local:
+      setattr(self.owner, self.attribute, self.original)
+    else:
+      delattr(self.owner, self.attribute)
+    self.started = False
+
+
 class Patchers:
-  """Represents a collection of mock.patcher objects to be started/stopped simulatenously."""
+  """Represents a collection of Patcher objects to be started/stopped simulatenously."""
 
   def __init__(self):
     self.patchers = list()
     self.targets = list()  # So we don't mock a mock mocking a mock.
+    self.deferred = list()  # (module name, callback) tuples registered with IMPORT_HOOK
+    self.started = False
 
   def patch(self, target, new_destination):
     """Patches `target` with new_destination, and returns the original target for later use.
     If `target` is already mocked, it is ignored."""
     if target in self.targets:
       return
-    patcher = mock.patch(target, new_destination)
+    patcher = Patcher(target, new_destination)
     self.targets.append(target)
     self.patchers.append(patcher)
-    return patcher.get_original()[0]
+    return patcher.original
+
+  def when_imported(self, module, install):
+    """
+    Calls `install` once `module` is imported (right away if it already is), so that patching a library does not
+    require importing it. The patches `install` registers with `patch` are started along with the others.
+    :param module: The name of the module
+    :type module string
+    :param install: A function without arguments, registering patches
+    :type install Callable
+    """
+    def on_import(_):
+      install()
+      if self.started:
+        self.start()
+    self.deferred.append((module, on_import))
+    IMPORT_HOOK.when_imported(module, on_import)
 
   def __contains__(self, item):
     return item in self.targets
 
   def clear(self):
     """Stop any ongoing patches and clears the list of patchers in this instance"""
+    for module, callback in self.deferred:
+      IMPORT_HOOK.discard(module, callback)
+    del self.deferred[:]
     if self.patchers:
       self.stop()
     del self.patchers[:]
@@ -51,17 +117,162 @@ class Patchers:
 
   def start(self):
     """Starts all registered patchers"""
+    self.started = True
     for patcher in self.patchers:
-      if getattr(patcher, 'target', None) is None:
+      if not patcher.started:
         patcher.start()
 
   def stop(self):
     """Stops all registered patchers"""
+    self.started = False
     for patcher in self.patchers:
-      if getattr(patcher, 'target', None) is not None:
+      if patcher.started:
         patcher.stop()
 
 
+class _NotifyingLoader:
+  """Wraps the loader of a module, calling back the ImportHook once the module is executed"""
+
+  def __init__(self, loader, hook):
+    self.loader = loader
+    self.hook = hook
+
+  def create_module(self, spec):
+    return self.loader.create_module(spec)
+
+  def exec_module(self, module):
+    # Restore the actual loader first, so that nothing else ever sees this wrapper
+    module.__loader__ = self.loader
+    if getattr(module, "__spec__", None) is not None:
+      module.__spec__.loader = self.loader
+    self.loader.exec_module(module)
+    self.hook.imported(module.__name__, module)
+
+  def __getattr__(self, name):
+    return getattr(self.loader, name)
+
+
+class ImportHook:
+  """
+  A `sys.meta_path` finder calling functions right after given modules are imported.
+  It is only in `sys.meta_path` while callbacks are pending, and only wraps the loaders of the awaited modules.
+  """
+
+  def __init__(self):
+    self.callbacks = dict()  # module name -> list of functions, called with the module
+    self._lock = threading.RLock()
+
+  def when_imported(self, name, fn):
+    """Calls `fn` with the module `name` once it is imported, or right away if it already is"""
+    module = sys.modules.get(name)
+    if module is None and not is_python_version_at_least("3.4"):  # No module specs; import it now, if installed
+      try:
+        module = importlib.import_module(name)
+      except ImportError:
+        return
+    if module is not None:
+      fn(module)
+      return
+    with self._lock:
+      self.callbacks.setdefault(name, list()).append(fn)
+      if self not in sys.meta_path:
+        sys.meta_path.insert(0, self)
+
+  def discard(self, name, fn):
+    """Unregisters a callback that was not called yet"""
+    with self._lock:
+      callbacks = self.callbacks.get(name)
+      if callbacks is not None and fn in callbacks:
+        callbacks.remove(fn)
+        if not callbacks:
+          del self.callbacks[name]
+      self._unregister_if_idle()
+
+  def imported(self, name, module):
+    with self._lock:
+      callbacks = self.callbacks.pop(name, ())
+      self._unregister_if_idle()
+    for fn in callbacks:
+      fn(module)
+
+  def _unregister_if_idle(self):
+    if not self.callbacks and self in sys.meta_path:
+      sys.meta_path.remove(self)
+
+  def find_spec(self, fullname, path, target=None):
+    if fullname not in self.callbacks:
+      return None
+    for finder in sys.meta_path:
+      if finder is self or not hasattr(finder, "find_spec"):
+        continue
+      spec = finder.find_spec(fullname, path, target)
+      if spec is not None:
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+          spec.loader = _NotifyingLoader(spec.loader, self)
+        return spec
+    return None
+
+
+IMPORT_HOOK = ImportHook()
+
+
+class LRUCache:
+  """A small, thread-safe, bounded mapping that evicts the least recently used entries first.
+  `functools.lru_cache` is not available on Python 2, and we need explicit control over the cache contents."""
+
+  def __init__(self, maxsize=1024, max_bytes=None, sizeof=None):
+    """
+    :param maxsize: The maximum number of entries
+    :type maxsize int
+    :param max_bytes: The maximum total size of the cached values, as given by `sizeof`; None for no limit. Values
+        larger than that are not cached.
+    :type max_bytes int
+    :param sizeof: A function returning the size in bytes of a cached value (`len` by default)
+    :type sizeof Callable
+    """
+    self.maxsize = maxsize
+    self.max_bytes = max_bytes
+    self.sizeof = sizeof or len
+    self.bytes = 0
+    self._data = OrderedDict()  # key -> (value, size)
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    """Returns the value for `key` (marking it as recently used), or `default` if it is not cached."""
+    with self._lock:
+      try:
+        entry = self._data.pop(key)
+      except KeyError:
+        return default
+      self._data[key] = entry
+      return entry[0]
+
+  def set(self, key, value):
+    """Caches `value` under `key`, evicting the oldest entries if the cache is full."""
+    size = self.sizeof(value) if self.max_bytes is not None else 0
+    with self._lock:
+      previous = self._data.pop(key, None)
+      if previous is not None:
+        self.bytes -= previous[1]
+      if self.max_bytes is not None and size > self.max_bytes:
+        return
+      self._data[key] = (value, size)
+      self.bytes += size
+      while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+        self.bytes -= self._data.popitem(last=False)[1][1]
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+      self.bytes = 0
+
+  def __contains__(self, key):
+    return key in self._data
+
+  def __len__(self):
+    return len(self._data)
+
+
 def parse_url(url):
   """
   Parses a url using urlsplit, returning a SplitResult. Adds https:// scheme if netloc is empty.
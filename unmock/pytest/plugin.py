@@ -1,29 +1,62 @@
 """A pytest plugin for Unmock"""
 import pytest
 import os
-from .. import on, off
+from .. import on, off, UnmockOptions
+from ..core import http
 
 u_flag = "USE_UNMOCK"
+MARKER = "unmock"
+
+_retained = [False]
+
+
+def _retain():
+  """Installs the patches once for the whole session (or pytest-xdist worker), so fixtures only swap options"""
+  if not _retained[0]:
+    http.retain()
+    _retained[0] = True
 
 
 @pytest.fixture(scope="function")
 def unmock():
-  """Initializes the unmock service whenever used in any function"""
+  """
+  Initializes the unmock service whenever used in any function. The options replace the process-wide ones, so that
+  threads started by the test use them too, and the previous options are restored on teardown.
+  """
+  previous = list()
+
   def _init(**kwargs):
-    off()
-    return on(**kwargs)
+    options = UnmockOptions(**kwargs)
+    replaced = http.swap_default(options)
+    if not previous:  # Later calls replace the options set by a previous call
+      previous.append(replaced)
+    return options
 
   def doNothing(**kwargs):
     pass
 
   if os.environ.get(u_flag):
-    on()
+    _retain()
     yield _init
-    off()
+    if previous:
+      http.swap_default(previous[0])
   else:
     yield doNothing
 
 
+@pytest.fixture(autouse=True)
+def _unmock_marker(request):
+  """Applies the options given with `@pytest.mark.unmock(...)` for the duration of the test, in all its threads"""
+  marker = request.node.get_closest_marker(MARKER)
+  if marker is None:
+    yield
+    return
+  _retain()
+  previous = http.swap_default(UnmockOptions(**marker.kwargs))
+  yield
+  http.swap_default(previous)
+
+
 def pytest_addoption(parser):
   parser.addoption(
       "--unmock", dest=u_flag, action="store_true",
@@ -31,7 +64,11 @@ def pytest_addoption(parser):
 
 
 def pytest_configure(config):
+  config.addinivalue_line(
+      "markers", "{}(**kwargs): capture and mock 3rd party API calls in this test, with the given unmock "
+      "options (e.g. replyFn, whitelist)".format(MARKER))
   if config.getoption(u_flag):
+    _retain()
     on()
     os.environ[u_flag] = "1"
 
@@ -40,3 +77,6 @@ def pytest_unconfigure(config):  # Cleanup
   if config.getoption(u_flag):
     off()
     os.environ.pop(u_flag, "")
+  if _retained[0]:
+    http.release()
+    _retained[0] = False
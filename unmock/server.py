@@ -0,0 +1,176 @@
+"""
+A standalone mock server, answering the HTTP/1.1 requests it receives with the replies of UnmockOptions, so that the
+same mock definitions serve subprocesses, worker pools and non-Python components.
+
+Requests reach it either redirected from processes using unmock (`unmock.on(redirect="127.0.0.1:8080")`), or sent
+through it as an HTTP proxy (e.g. with `HTTP_PROXY=http://127.0.0.1:8080`); the mocked host is taken from the request
+target or its Host header. This module relies on `async` syntax, so it is only available on Python 3.7+.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import signal
+import socket
+import sys
+from .core.options import UnmockOptions
+from .core.router import Router
+from .core.request import Request
+from .core.response import get_template
+from .core.sockets import RequestParser, bad_request, closes_connection, response_head
+from .core.aio import reply_for, throttled, CHUNK_SIZE
+from .core.utils import parse_url
+
+__all__ = ["load_options", "serve", "run"]
+
+SERVER = "server"
+
+
+def load_options(spec):
+  """
+  Loads the options to serve from a "module:attribute" spec.
+  :param spec: The attribute may be UnmockOptions, a Router, a dictionary of UnmockOptions keyword arguments, or a
+      replyFn
+  :type spec string
+  :rtype UnmockOptions
+  """
+  module_name, _, attribute = spec.partition(":")
+  if not attribute:
+    raise ValueError("Expected a 'module:attribute' spec, got '{}'".format(spec))
+  obj = importlib.import_module(module_name)
+  for name in attribute.split("."):
+    obj = getattr(obj, name)
+  if isinstance(obj, UnmockOptions):
+    return obj
+  if isinstance(obj, Router):
+    return UnmockOptions(router=obj)
+  if isinstance(obj, dict):
+    return UnmockOptions(**obj)
+  if callable(obj):
+    return UnmockOptions(replyFn=obj)
+  raise TypeError("Cannot serve {!r}; expected UnmockOptions, a Router, a dictionary or a replyFn".format(obj))
+
+
+def to_request(method, target, headers, body):
+  """Builds the Request for a received request, in origin form (as redirected) or absolute form (as proxied)"""
+  if target.startswith("/"):
+    # The port is only known if not the default one; redirected HTTPS requests are seen on port 80
+    parsed = parse_url(next((v for k, v in headers if k.lower() == "host"), ""))
+    req = Request(parsed.hostname, parsed.port or 80, target, method)
+  else:
+    parsed = parse_url(target)
+    req = Request(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80),
+                  (parsed.path or "/") + ("?" + parsed.query if parsed.query else ""), method)
+  req.add_headers(headers)
+  req.add_body(body or None)
+  return req
+
+
+async def respond(unmock_options, writer, method, target, version, headers, body):
+  """Writes the response to a request; returns whether the connection should be closed after it"""
+  req = to_request(method, target, headers, body)
+  reply = await reply_for(unmock_options, req, SERVER)
+  delay, bandwidth = unmock_options._simulate(req, reply)
+  if delay:
+    await asyncio.sleep(delay)
+  template = get_template(reply)
+  closing = closes_connection(version, headers, template)
+  fp, length = template.open(framed=True)
+  try:
+    head, with_body = response_head(template, method, length, closing)
+    writer.write(head)
+    if not with_body:
+      pass
+    elif bandwidth:
+      async for chunk in throttled(fp, float(bandwidth)):
+        writer.write(chunk)
+        await writer.drain()
+    elif isinstance(template.body, bytes):
+      writer.write(template.body)
+    else:
+      for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+        writer.write(chunk)
+        await writer.drain()
+  finally:
+    fp.close()
+  await writer.drain()
+  return closing
+
+
+async def handle(unmock_options, reader, writer):
+  """Serves a connection; pipelined requests are answered in order"""
+  parser = RequestParser()
+  try:
+    while True:
+      data = await reader.read(CHUNK_SIZE)
+      if not data:
+        break
+      for method, target, version, headers, body in parser.feed(data):
+        if await respond(unmock_options, writer, method, target, version, headers, body):
+          return
+      if parser.error is not None:  # Not HTTP/1.1
+        writer.write(bad_request(parser.error))
+        await writer.drain()
+        return
+  except ConnectionError:  # Disconnected
+    pass
+  finally:
+    writer.close()
+
+
+async def serve(unmock_options, host="127.0.0.1", port=8080, reuse_port=False):
+  """
+  Starts serving the replies of `unmock_options`.
+  :param reuse_port: Whether to bind with SO_REUSEPORT, so that several processes serve the same port
+  :type reuse_port bool
+  :return: The asyncio.Server
+  """
+  def on_connection(reader, writer):
+    return handle(unmock_options, reader, writer)
+  return await asyncio.start_server(on_connection, host, port, reuse_port=reuse_port or None)
+
+
+async def _serve_forever(spec, host, port, reuse_port, announce):
+  server = await serve(load_options(spec), host, port, reuse_port)
+  if announce:
+    print("Serving {} on http://{}:{}".format(spec, *server.sockets[0].getsockname()[:2]), flush=True)
+  async with server:
+    await server.serve_forever()
+
+
+def run_worker(spec, host, port, reuse_port=False, announce=False):
+  try:
+    asyncio.run(_serve_forever(spec, host, port, reuse_port, announce))
+  except KeyboardInterrupt:
+    pass
+
+
+def run(spec, host="127.0.0.1", port=8080, workers=1):
+  """
+  Serves the options given by `spec` (see `load_options`) until interrupted.
+  :param workers: The number of worker processes, sharing the port with SO_REUSEPORT
+  :type workers int
+  """
+  if workers <= 1:
+    return run_worker(spec, host, port, announce=True)
+  if not hasattr(socket, "SO_REUSEPORT"):
+    raise SystemExit("Several workers require SO_REUSEPORT, which this platform does not support")
+  # Reserve the port without listening on it, so that an ephemeral port can be shared as well
+  reserved = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+  reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+  reserved.bind((host, port))
+  port = reserved.getsockname()[1]
+  processes = [multiprocessing.Process(target=run_worker, args=(spec, host, port, True)) for _ in range(workers)]
+  for process in processes:
+    process.start()
+  print("Serving {} on http://{}:{} with {} workers".format(spec, host, port, workers), flush=True)
+  signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # Stop the workers when terminated as well
+  try:
+    for process in processes:
+      process.join()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    for process in processes:
+      process.terminate()
+      process.join()
+    reserved.close()